@@ -21,7 +21,16 @@ from agents import (
 from tools import (
     GitHubCommitsTool, EmailProcessorTool, FileProcessorTool, DocumentTextExtractorTool, NLPAnalyzerTool, KnowledgeBaseBuilderTool
 )
-from utils.file_utils import extract_text_from_file
+from utils.file_utils import ingest_uploads
+from utils.upload_spool import UploadSpool
+from utils.github_utils import track_quota
+from utils.nlp_utils import get_nlp
+from utils.search_index import get_search_index
+
+@st.cache_resource(show_spinner="Loading language model...")
+def load_language_model():
+    """Shared spaCy pipeline, loaded on the first run that needs NLP."""
+    return get_nlp()
 
 st.title("Automated Knowledge Transfer")
 
@@ -53,9 +62,11 @@ if st.button("Start Knowledge Transfer"):
             try:
                 # 1. GitHub Agent
                 github_result = None
+                github_quota = None
                 if github_username:
                     github_tool = github_agent.tools[0]
-                    github_result = github_tool._run(github_username, github_token)
+                    with track_quota() as github_quota:
+                        github_result = github_tool._run(github_username, github_token)
 
                 # 2. Email Agent
                 email_result = None
@@ -66,38 +77,63 @@ if st.button("Start Knowledge Transfer"):
                     email_tool = email_agent.tools[0]
                     email_result = email_tool._run(email.split('@')[0], mapping, company_domain)
 
+                # Spool, hash, type-detect and extract every upload once;
+                # the spooled copies are removed as soon as extraction is done
+                ingested_files = []
+                if uploaded_files:
+                    with UploadSpool() as upload_spool:
+                        ingested_files = ingest_uploads(uploaded_files, spool=upload_spool)
+
                 # 3. File Agent
                 file_result = None
                 if uploaded_files:
                     file_tool = file_agent.tools[0]
-                    file_result = file_tool._run(uploaded_files)
+                    file_result = file_tool._run(ingested_files)
 
                 # 4. Document Agent
                 document_result = None
                 all_texts = []
+                text_sources = []
                 if uploaded_files:
                     document_tool = document_agent.tools[0]
-                    document_result = document_tool._run(uploaded_files)
+                    document_result = document_tool._run(ingested_files)
                     # Gather all text content for NLP
                     all_texts = [doc["content"] for doc in document_result if "content" in doc]
+                    text_sources = ["document"] * len(all_texts)
+                # Each email thread is analysed once, as a single text
+                if email_result and email_result.get("threads"):
+                    thread_texts = [thread["text"] for thread in email_result["threads"] if thread["text"]]
+                    all_texts += thread_texts
+                    text_sources += ["email"] * len(thread_texts)
 
                 # 5. NLP Agent
                 nlp_result = None
                 if all_texts:
                     nlp_tool = nlp_agent.tools[0]
-                    nlp_result = nlp_tool._run(all_texts)
+                    nlp_result = nlp_tool._run(all_texts, nlp=load_language_model())
 
                 # 6. Knowledge Base Agent
                 knowledge_base_result = None
-                if nlp_result:
+                email_threads = email_result.get("threads") if email_result else None
+                if nlp_result or github_result or email_threads:
                     kb_tool = knowledge_agent.tools[0]
-                    knowledge_base_result = kb_tool._run(nlp_result)
+                    knowledge_base_result = kb_tool._run(
+                        nlp_result or [],
+                        documents=document_result,
+                        commits=github_result["commits"] if github_result else None,
+                        threads=email_threads,
+                        person=email or github_username,
+                        insight_sources=text_sources
+                    )
 
                 # Display results
                 st.subheader("Results")
                 if github_result is not None:
                     st.markdown("### GitHub Activity")
-                    st.json(github_result[:3] if isinstance(github_result, list) else github_result)
+                    st.json(github_result["activity"])
+                    st.json(github_result["commits"][:3])
+                    if github_quota is not None:
+                        st.caption(f"GitHub API quota used: {github_quota.as_dict()}")
                 if email_result is not None:
                     st.markdown("### Email Insights")
                     st.json(email_result)
@@ -117,6 +153,18 @@ if st.button("Start Knowledge Transfer"):
             except Exception as e:
                 st.error(f"An error occurred: {str(e)}")
 
+# Search earlier handovers (BM25 over summaries, document text, commits and email threads)
+st.subheader("Search the Knowledge Base")
+search_query = st.text_input("Search previous handovers")
+if search_query:
+    search_source = st.selectbox("Source", ["all", "document", "commit", "email", "summary"])
+    hits = get_search_index().search(search_query, k=10, source=None if search_source == "all" else search_source)
+    if not hits:
+        st.info("No matching documents.")
+    for hit in hits:
+        st.markdown(f"**{hit.get('title') or hit['id']}** ({hit['source']}, score {hit['score']:.2f})")
+        st.caption(hit["snippet"])
+
 
 before2 = '''
 import sys
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# The utils package lives at the repository root, which is not installed.
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
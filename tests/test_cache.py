@@ -0,0 +1,56 @@
+import os
+from itertools import count
+
+import pytest
+
+import utils.cache as cache_module
+from utils.cache import DiskLRUCache, ExtractionCache
+
+@pytest.fixture(autouse=True)
+def clock(monkeypatch):
+    # Every access gets a distinct, increasing timestamp.
+    ticks = count(1)
+    monkeypatch.setattr(cache_module.time, "time", lambda: float(next(ticks)))
+
+def test_hits_and_misses_are_counted(tmp_path):
+    cache = DiskLRUCache(tmp_path / "cache.sqlite")
+    assert cache.get("a") is None
+    cache.set("a", b"value")
+    assert cache.get("a") == b"value"
+    assert cache.get("a") == b"value"
+    assert cache.stats()["hits"] == 2 and cache.stats()["misses"] == 1
+    assert cache.stats()["entries"] == 1
+
+def test_least_recently_read_entries_are_evicted(tmp_path):
+    value = os.urandom(1000)  # incompressible, so each entry is just over 1000 bytes
+    cache = DiskLRUCache(tmp_path / "cache.sqlite", max_bytes=3500)
+    for key in "abc":
+        cache.set(key, value)
+    cache.get("a")
+    cache.set("d", value)
+    assert cache.get("b") is None
+    assert all(cache.get(key) == value for key in "acd")
+    assert cache.stats()["entries"] == 3 and cache.stats()["bytes"] <= 3500
+
+def test_replacing_an_entry_and_oversized_values(tmp_path):
+    cache = DiskLRUCache(tmp_path / "cache.sqlite", max_bytes=3500)
+    cache.set("a", os.urandom(1000))
+    cache.set("a", os.urandom(1000))
+    assert cache.stats()["entries"] == 1 and cache.stats()["bytes"] < 1100
+    cache.set("huge", os.urandom(5000))
+    assert cache.get("huge") is None and cache.get("a") is not None
+    cache.delete("a")
+    assert cache.stats()["bytes"] == 0
+
+def test_size_survives_reopening(tmp_path):
+    cache = DiskLRUCache(tmp_path / "cache.sqlite")
+    cache.set("a", os.urandom(1000))
+    assert DiskLRUCache(tmp_path / "cache.sqlite").stats()["bytes"] == cache.stats()["bytes"]
+
+def test_extraction_cache_is_keyed_by_content_type_and_version(tmp_path):
+    path = tmp_path / "extraction.sqlite"
+    digest = ExtractionCache.digest(memoryview(b"%PDF-1.7 ..."))
+    ExtractionCache("1", path).put(digest, "pdf", "text")
+    assert ExtractionCache("1", path).get(digest, "pdf") == "text"
+    assert ExtractionCache("1", path).get(digest, "txt") is None
+    assert ExtractionCache("2", path).get(digest, "pdf") is None
@@ -0,0 +1,57 @@
+from utils.commit_store import CommitStore
+
+def _commit(sha, repo, author, date, additions=0, deletions=0, login=None):
+    return {"sha": sha, "repo": repo, "author": author, "author_login": login, "date": date,
+            "message": f"{sha} subject\n\nbody", "additions": additions, "deletions": deletions}
+
+COMMITS = [
+    # 2024-01-01 was a Monday.
+    _commit("a1", "billing", "Alice", "2024-01-01T09:15:00Z", 10, 2, login="alice"),
+    _commit("a2", "billing", "Alice", "2024-01-07T23:30:00Z", 1, 1, login="alice"),
+    _commit("a3", "deploy", "Alice", "2024-01-08T00:10:00+02:00", 5, 0, login="alice"),
+    _commit("b1", "billing", "Bob", "2024-01-03T09:45:00Z", 3, 3),
+    _commit("c1", "website", "Carol", "2024-01-04T12:00:00Z"),
+    _commit("u1", "billing", "Bob", None),
+    _commit("u2", "archive", "Dave", "not a date"),
+]
+
+def test_undated_commits_are_left_out_of_time_aggregates():
+    summary = CommitStore.from_commits(COMMITS).summary("alice")
+    assert summary["total_commits"] == 7
+    assert summary["undated_commits"] == 2
+    assert summary["first_commit"] == "2024-01-01T09:15:00Z"
+    assert summary["last_commit"] == "2024-01-07T23:30:00Z"
+    assert sum(summary["commits_by_weekday"].values()) == 5
+    assert summary["commits_by_weekday"]["Mon"] == 1
+    assert summary["commits_by_weekday"]["Sun"] == 2
+    assert summary["busiest_hour_utc"] == 9
+
+def test_weeks_start_on_monday():
+    weeks = CommitStore.from_commits(COMMITS).activity_by_week()
+    # a3 is Monday 00:10 in UTC+2, so still Sunday in UTC.
+    assert weeks == [{"week": "2024-01-01", "commits": 5}]
+    weeks = CommitStore.from_commits([_commit("x", "r", "A", "2024-01-08T00:00:00Z"), _commit("y", "r", "A", "2024-01-07T23:59:59Z")]).activity_by_week()
+    assert weeks == [{"week": "2024-01-01", "commits": 1}, {"week": "2024-01-08", "commits": 1}]
+
+def test_most_active_repos_and_repos_without_dated_commits():
+    repos = CommitStore.from_commits(COMMITS).most_active_repos()
+    assert [(repo["repo"], repo["commits"], repo["lines_changed"]) for repo in repos] == [
+        ("billing", 4, 20), ("deploy", 1, 5), ("website", 1, 0), ("archive", 1, 0),
+    ]
+    assert repos[0]["last_commit"] == "2024-01-07T23:30:00Z"
+    assert repos[3]["last_commit"] is None
+
+def test_collaborators_are_limited_to_the_users_repos():
+    store = CommitStore.from_commits(COMMITS)
+    # Found by login as well as by name; Carol and Dave never touched Alice's repos.
+    assert store.collaborators("alice") == [{"author": "Bob", "commits": 2, "shared_repos": 1}]
+    assert store.collaborators("Alice") == store.collaborators("alice")
+    assert [row["author"] for row in store.collaborators()] == ["Alice", "Bob", "Carol", "Dave"]
+
+def test_raw_github_payloads_and_empty_history():
+    raw = {"sha": "r1", "repo": "billing", "commit": {"author": {"name": "Alice", "date": "2024-01-02T00:00:00Z"}, "message": "Fix\n\nDetails"}}
+    store = CommitStore.from_commits([raw])
+    assert store.messages == ["Fix"] and store.repos == ["billing"]
+    summary = CommitStore.from_commits([]).summary()
+    assert summary["total_commits"] == 0 and summary["first_commit"] is None
+    assert summary["activity_by_week"] == [] and summary["busiest_hour_utc"] is None
@@ -0,0 +1,56 @@
+import numpy as np
+
+from utils.dedup import MinHasher, near_duplicate_clusters, shingle_hashes
+
+def _words(count, seed):
+    rng = np.random.default_rng(seed)
+    return [f"w{value}" for value in rng.integers(0, 10 ** 6, count)]
+
+def _jaccard(a, b):
+    a, b = set(a.tolist()), set(b.tolist())
+    return len(a & b) / len(a | b)
+
+def test_shingle_hashes():
+    assert len(shingle_hashes("")) == 0
+    # Case and punctuation do not matter; repeated shingles are counted once.
+    assert np.array_equal(shingle_hashes("The cat sat. The cat sat."), shingle_hashes("the CAT sat the cat sat"))
+    assert len(shingle_hashes("a b c d e")) == 3
+    # Texts shorter than a shingle still hash to one shingle.
+    assert len(shingle_hashes("hello world")) == 1
+
+def test_minhash_estimates_jaccard():
+    base = _words(400, seed=0)
+    a = shingle_hashes(" ".join(base))
+    b = shingle_hashes(" ".join(base[:300] + _words(100, seed=1)))
+    hasher = MinHasher(256)
+    estimate = np.mean(hasher.signature(a) == hasher.signature(b))
+    assert abs(estimate - _jaccard(a, b)) < 0.1
+
+def test_copies_and_near_copies_cluster_with_the_longest():
+    base = _words(300, seed=2)
+    texts = [
+        " ".join(base[:290]),
+        " ".join(base),
+        " ".join(_words(300, seed=3)),
+        " ".join(base).upper(),
+        "",
+    ]
+    representatives, similarities = near_duplicate_clusters(texts)
+    assert representatives == [1, 1, 2, 1, 4]
+    assert similarities[1] == similarities[3] == 1.0
+    assert 0.7 <= similarities[0] < 1.0
+    assert similarities[2] == similarities[4] == 1.0
+
+def test_similarity_is_not_chained():
+    # Each text shares 80% of its words with its neighbours but little
+    # with texts further down the chain.
+    words = _words(2000, seed=4)
+    texts = [" ".join(words[offset * 60:offset * 60 + 300]) for offset in range(7)]
+    representatives, similarities = near_duplicate_clusters(texts, threshold=0.6)
+    signatures = [MinHasher().signature(shingle_hashes(text)) for text in texts]
+    assert len(set(representatives)) > 1
+    for member, representative in enumerate(representatives):
+        estimate = np.mean(signatures[member] == signatures[representative])
+        assert estimate >= 0.6
+        assert similarities[member] == round(float(estimate), 3)
+        assert abs(member - representative) <= 1
@@ -0,0 +1,206 @@
+import re
+import sqlite3
+from contextlib import contextmanager
+
+import pytest
+
+from utils.email_store import EmailStore, fetch_missing_bodies, sync_folder
+
+USER = "alice@company.com"
+
+def _raw_header(uid: int, sender: str, recipient: str, date: str) -> bytes:
+    return (
+        f"Subject: Message {uid}\r\nFrom: {sender}\r\nTo: {recipient}\r\n"
+        f"Date: {date}\r\nMessage-ID: <m{uid}@company.com>\r\n\r\n"
+    ).encode()
+
+class FakeFolder:
+    def __init__(self, server):
+        self.server = server
+
+    def set(self, folder):
+        self.server.selected = folder
+
+    def status(self, folder, items):
+        return {"UIDVALIDITY": self.server.folders[folder]["uidvalidity"]}
+
+class FakeClient:
+    def __init__(self, server):
+        self.server = server
+
+    def uid(self, command, uid_set, query):
+        assert command == "FETCH"
+        self.server.queries.append(query)
+        messages = self.server.folders[self.server.selected]["messages"]
+        data = []
+        if query == "(UID BODYSTRUCTURE)":
+            for uid in uid_set.split(","):
+                data.append(f"{uid} (UID {uid} BODYSTRUCTURE ".encode() + messages[int(uid)]["structure"] + b")")
+            return "OK", data
+        section = re.fullmatch(r"\(UID BODY\.PEEK\[([\d.]+)\]\)", query)
+        if section:
+            for uid in uid_set.split(","):
+                payload = messages[int(uid)]["parts"][section.group(1)]
+                # Like some servers, put the UID after the literal.
+                data.append((f"{uid} (BODY[{section.group(1)}] {{{len(payload)}}}".encode(), payload))
+                data.append(f" UID {uid})".encode())
+            return "OK", data
+        self.server.fetched.extend(int(uid) for uid in uid_set.split(","))
+        for uid in uid_set.split(","):
+            raw = messages[int(uid)]["raw"]
+            data.append((f"{uid} (UID {uid} BODYSTRUCTURE (\"text\" \"plain\") BODY[HEADER.FIELDS] {{{len(raw)}}}".encode(), raw))
+            data.append(b")")
+        return "OK", data
+
+class FakeMailbox:
+    """
+    In-memory stand-in for an imap_tools MailBox: folders with a
+    UIDVALIDITY and UID-keyed messages, answering the SEARCH criteria
+    sync_folder sends (FROM/TO the user, optionally UID n:*).
+    """
+
+    def __init__(self):
+        self.folders = {}
+        self.selected = None
+        self.fetched = []
+        self.queries = []
+        self.folder = FakeFolder(self)
+        self.client = FakeClient(self)
+
+    def add_folder(self, name, uidvalidity):
+        self.folders[name] = {"uidvalidity": uidvalidity, "messages": {}}
+
+    def deliver(self, folder, uid, sender, recipient, date="Mon, 01 Jan 2024 10:00:00 +0000", structure=b'("text" "plain" NIL NIL NIL "7bit" 5 1)', parts=None):
+        self.folders[folder]["messages"][uid] = {
+            "from": sender, "to": recipient, "raw": _raw_header(uid, sender, recipient, date),
+            "structure": structure, "parts": parts or {"1": b"Hello"},
+        }
+
+    def uids(self, criteria):
+        query = str(criteria)
+        address = re.search(r'FROM "([^"]+)"', query).group(1)
+        uid_range = re.search(r"UID (\d+):\*", query)
+        messages = self.folders[self.selected]["messages"]
+        matching = sorted(uid for uid, message in messages.items() if address in (message["from"], message["to"]))
+        if uid_range:
+            low = int(uid_range.group(1))
+            # Like a real server, "n:*" also matches the highest UID when it is below n.
+            matching = [uid for uid in matching if uid >= low or uid == max(messages)]
+        return [str(uid) for uid in matching]
+
+@pytest.fixture
+def store(tmp_path):
+    return EmailStore(tmp_path / "email_store.sqlite")
+
+@pytest.fixture
+def mailbox():
+    mailbox = FakeMailbox()
+    mailbox.add_folder("INBOX", uidvalidity=100)
+    mailbox.deliver("INBOX", 1, "bob@company.com", USER)
+    mailbox.deliver("INBOX", 2, USER, "carol@company.com")
+    mailbox.deliver("INBOX", 3, "spam@example.com", "someone@example.com")
+    return mailbox
+
+def test_initial_sync_stores_matching_headers(store, mailbox):
+    assert sync_folder(mailbox, store, "acct", "INBOX", USER) == 2
+    assert sorted(header.uid for header in store.query(USER)) == ["1", "2"]
+    assert store.last_uid("acct", "INBOX", USER) == 2
+
+def test_resync_fetches_only_new_uids(store, mailbox):
+    sync_folder(mailbox, store, "acct", "INBOX", USER)
+    mailbox.fetched.clear()
+    assert sync_folder(mailbox, store, "acct", "INBOX", USER) == 0
+    assert mailbox.fetched == []
+
+    mailbox.deliver("INBOX", 4, "dave@company.com", USER)
+    assert sync_folder(mailbox, store, "acct", "INBOX", USER) == 1
+    assert mailbox.fetched == [4]
+    assert sorted(header.uid for header in store.query(USER)) == ["1", "2", "4"]
+
+    # "5:*" still matches UID 4, the highest in the folder; it must not be stored twice.
+    mailbox.fetched.clear()
+    assert sync_folder(mailbox, store, "acct", "INBOX", USER) == 0
+    assert mailbox.fetched == []
+
+def test_uidvalidity_change_drops_stale_messages_and_resyncs(store, mailbox):
+    sync_folder(mailbox, store, "acct", "INBOX", USER)
+    # The server renumbered the folder: old UIDs are meaningless now.
+    mailbox.add_folder("INBOX", uidvalidity=200)
+    mailbox.deliver("INBOX", 1, "erin@company.com", USER)
+    mailbox.fetched.clear()
+
+    assert sync_folder(mailbox, store, "acct", "INBOX", USER) == 1
+    assert mailbox.fetched == [1]
+    headers = store.query(USER)
+    assert [(header.uid, header.from_) for header in headers] == [("1", "erin@company.com")]
+    assert store.last_uid("acct", "INBOX", USER) == 1
+
+def test_sync_marks_are_per_folder(store, mailbox):
+    mailbox.add_folder("Sent", uidvalidity=7)
+    mailbox.deliver("Sent", 9, USER, "bob@company.com")
+    sync_folder(mailbox, store, "acct", "INBOX", USER)
+    sync_folder(mailbox, store, "acct", "Sent", USER)
+    assert store.last_uid("acct", "INBOX", USER) == 2
+    assert store.last_uid("acct", "Sent", USER) == 9
+    assert [header.uid for header in store.query(USER, folders=["Sent"])] == ["9"]
+
+def test_query_orders_by_utc_time(store, mailbox):
+    mailbox.add_folder("INBOX", uidvalidity=100)
+    mailbox.deliver("INBOX", 1, "bob@company.com", USER, date="Mon, 01 Jan 2024 08:00:00 -0500")
+    mailbox.deliver("INBOX", 2, "carol@company.com", USER, date="Mon, 01 Jan 2024 09:30:00 +0000")
+    sync_folder(mailbox, store, "acct", "INBOX", USER)
+    assert [header.uid for header in store.query(USER)] == ["2", "1"]
+
+def test_existing_store_gets_date_epoch_backfilled(tmp_path):
+    path = tmp_path / "old.sqlite"
+    conn = sqlite3.connect(str(path))
+    conn.execute(
+        "CREATE TABLE messages (account TEXT NOT NULL, folder TEXT NOT NULL, uidvalidity INTEGER NOT NULL, "
+        "uid INTEGER NOT NULL, message_id TEXT, subject TEXT, from_addr TEXT, to_addrs TEXT, cc_addrs TEXT, "
+        "date TEXT, in_reply_to TEXT, refs TEXT, attachments TEXT, body TEXT, PRIMARY KEY (account, folder, uidvalidity, uid))"
+    )
+    rows = [(1, "2024-01-01T08:00:00-05:00"), (2, "2024-01-01T09:30:00+00:00")]
+    conn.executemany(
+        "INSERT INTO messages (account, folder, uidvalidity, uid, from_addr, to_addrs, cc_addrs, date) "
+        "VALUES ('acct', 'INBOX', 1, ?, 'bob@company.com', '[\"alice@company.com\"]', '[]', ?)",
+        rows,
+    )
+    conn.commit()
+    conn.close()
+    assert [header.uid for header in EmailStore(path).query(USER)] == ["2", "1"]
+
+class FakePool:
+    max_connections = 1
+
+    def __init__(self, mailbox):
+        self.mailbox = mailbox
+
+    @contextmanager
+    def connection(self):
+        yield self.mailbox
+
+MIXED = (
+    b'((("text" "plain" ("charset" "iso-8859-1") NIL NIL "quoted-printable" 20 1 NIL NIL NIL)'
+    b'("text" "html" ("charset" "utf-8") NIL NIL "7bit" 40 1 NIL NIL NIL) "alternative")'
+    b'("text" "plain" ("name" "log.txt") NIL NIL "base64" 900000 9 NIL ("attachment" ("filename" "log.txt")) NIL)'
+    b'("application" "pdf" ("name" "spec.pdf") NIL NIL "base64" 5000000 NIL ("attachment" ("filename" "spec.pdf")) NIL) "mixed")'
+)
+
+def test_bodies_are_fetched_without_attachment_payloads(store, mailbox):
+    mailbox.deliver("INBOX", 4, "dave@company.com", USER, structure=MIXED, parts={"1.1": b"Caf=E9 at noon", "1.2": b"<p>Cafe</p>"})
+    mailbox.deliver("INBOX", 5, "erin@company.com", USER, structure=b'("text" "html" ("charset" "utf-8") NIL NIL "base64" 20 1)',
+                    parts={"1": b"PHA+SGk8L3A+"})
+    sync_folder(mailbox, store, "acct", "INBOX", USER)
+    headers = store.query(USER)
+    mailbox.queries.clear()
+
+    fetch_missing_bodies(FakePool(mailbox), store, "acct", headers)
+    bodies = {key.split("@")[0]: body for key, body in store.get_bodies(headers, "acct").items()}
+    assert bodies == {"<m1": "Hello", "<m2": "Hello", "<m4": "Café at noon", "<m5": "<p>Hi</p>"}
+    body_queries = [query for query in mailbox.queries if "BODY.PEEK" in query]
+    assert sorted(body_queries) == ["(UID BODY.PEEK[1.1])", "(UID BODY.PEEK[1])"]
+
+    # Stored bodies are not downloaded again.
+    mailbox.queries.clear()
+    fetch_missing_bodies(FakePool(mailbox), store, "acct", headers)
+    assert mailbox.queries == []
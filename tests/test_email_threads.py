@@ -0,0 +1,30 @@
+from utils.email_threads import build_threads, strip_quoted_text
+from utils.email_utils import MessageHeader
+
+def test_outlook_quote_header_is_stripped():
+    body = (
+        "Sounds good, ship it.\n"
+        "\n"
+        "From: Bob <bob@company.com>\n"
+        "Sent: Monday, January 1, 2024 10:00 AM\n"
+        "To: Alice <alice@company.com>\n"
+        "Subject: Release\n"
+        "\n"
+        "Can we release today?"
+    )
+    assert strip_quoted_text(body) == "Sounds good, ship it."
+
+def test_from_line_in_prose_is_kept():
+    body = "Forwarding the numbers below.\nFrom: the finance report, revenue grew 4%.\nThanks"
+    assert strip_quoted_text(body) == body
+
+def test_reply_attribution_and_quoted_lines_are_stripped():
+    body = "Yes.\n> earlier line\nOn Mon, Jan 1, 2024 at 10:00 Bob wrote:\n> Can we?"
+    assert strip_quoted_text(body) == "Yes."
+
+def test_thread_messages_are_ordered_by_utc_time():
+    # 09:30+00:00 is earlier than 08:00-05:00 (13:00 UTC), although it sorts later as a string.
+    later = MessageHeader(uid="1", subject="Plan", date="2024-01-01T08:00:00-05:00", message_id="<a>")
+    earlier = MessageHeader(uid="2", subject="Re: Plan", date="2024-01-01T09:30:00+00:00", message_id="<b>")
+    [thread] = build_threads([later, earlier])
+    assert [message.uid for message in thread.messages] == ["2", "1"]
@@ -0,0 +1,49 @@
+from utils.entity_index import EntityIndex, normalize_entity
+
+INSIGHTS = [
+    {"entities": [("Acme Corp", "ORG", 0, 0), ("the Acme Corp's", "ORG", 30, 1), ("Alice", "PERSON", 50, 1)]},
+    {"entities": [("ACME  corp", "ORG", 5, 0), ("Berlin", "GPE", 20, 0), ("Alice", "PERSON", 40, 2), ("Alice", "ORG", 60, 3)]},
+    {"entities": [("Globex", "ORG", 0, 0), ("“Alice”", "PERSON", 10, 0), ("...", "ORG", 20, 0)]},
+]
+
+def _index():
+    return EntityIndex.from_insights(INSIGHTS, sources=["document", "email", "document"])
+
+def test_normalize_entity():
+    assert normalize_entity("  The  ACME\tCorp's ") == "acme corp"
+    assert normalize_entity("“Alice”") == "alice"
+    assert normalize_entity("ﬁnance") == "finance"
+    assert normalize_entity("...") == ""
+
+def test_mentions_are_merged_per_text_and_label():
+    index = _index()
+    # acme corp/ORG, alice/PERSON, berlin/GPE, alice/ORG, globex/ORG; "..." is dropped.
+    assert len(index) == 5
+    [acme] = index.lookup("Acme Corp")
+    assert index.describe(acme) == {"text": "Acme Corp", "label": "ORG", "count": 3, "documents": [0, 1], "sources": ["document", "email"]}
+    assert index.mentions(acme) == [
+        {"document": 0, "sentence": 0, "source": "document"},
+        {"document": 0, "sentence": 1, "source": "document"},
+        {"document": 1, "sentence": 0, "source": "email"},
+    ]
+
+def test_documents_mentioning():
+    index = _index()
+    assert index.documents_mentioning("alice") == [0, 1, 2]
+    assert index.documents_mentioning("Alice", label="ORG") == [1]
+    assert index.documents_mentioning("acme corp.") == [0, 1]
+    assert index.documents_mentioning("Initech") == []
+
+def test_top_by_label():
+    index = _index()
+    assert [(entity["text"], entity["count"]) for entity in index.top(label="ORG")] == [("Acme Corp", 3), ("Alice", 1), ("Globex", 1)]
+    assert [entity["text"] for entity in index.top(k=2)] == ["Acme Corp", "Alice"]
+    assert index.top(label="PERSON")[0]["count"] == 3
+    assert index.top(label="DATE") == []
+    assert [entity["label"] for entity in index.to_dict()] == ["ORG", "PERSON", "GPE", "ORG", "ORG"]
+
+def test_plain_entity_pairs_and_empty_input():
+    index = EntityIndex.from_insights([{"entities": [("Acme", "ORG")]}, {}])
+    assert index.mentions(0) == [{"document": 0, "sentence": -1, "source": "unknown"}]
+    assert len(EntityIndex.from_insights([])) == 0
+    assert EntityIndex.from_insights([]).top() == []
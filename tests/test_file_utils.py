@@ -0,0 +1,91 @@
+import multiprocessing
+import time
+from io import BytesIO
+
+from docx import Document
+from openpyxl import Workbook
+
+import utils.file_utils as file_utils
+from utils.cache import ExtractionCache
+
+from utils.file_utils import _detect_stream_type, _extract_worker, extract_text_from_file, ingest_uploads, iter_extract_texts_parallel
+
+def _text_files(count):
+    return [(f"notes{i}.txt", f"line {i}\n".encode() * 100) for i in range(count)]
+
+def test_parallel_extraction_returns_every_file():
+    results = list(iter_extract_texts_parallel(_text_files(4), max_workers=2))
+    assert sorted(result["filename"] for result in results) == [f"notes{i}.txt" for i in range(4)]
+    assert all(result["content"].startswith("line ") and result["error"] is None for result in results)
+
+class _Upload(BytesIO):
+    def __init__(self, name, data):
+        super().__init__(data)
+        self.name = name
+        self.type = "text/plain"
+
+def test_single_upload_is_extracted_in_a_worker_with_a_timeout():
+    [record] = ingest_uploads([_Upload("notes.txt", b"hello\n")], use_cache=False)
+    assert record["status"] == "success" and record["content"] == "hello\n"
+    # The worker cannot even start within the timeout, so the upload fails
+    # instead of running (or hanging) in this process.
+    [record] = ingest_uploads([_Upload("notes.txt", b"hello\n")], timeout=0.01, use_cache=False)
+    assert record["status"] == "failed" and "timed out" in record["error"]
+
+def test_text_that_looks_like_an_error_is_extracted_and_cached(tmp_path, monkeypatch):
+    cache = ExtractionCache(file_utils.EXTRACTOR_VERSION, tmp_path / "cache.sqlite")
+    monkeypatch.setattr(file_utils, "get_extraction_cache", lambda version: cache)
+    upload = _Upload("log.txt", b"Error extracting text: a line from a real log\n")
+    [record] = ingest_uploads([upload])
+    assert record["status"] == "success" and record["content"].startswith("Error extracting text:")
+    assert cache.get(record["sha256"], "txt") == record["content"]
+
+def test_timed_out_pool_leaves_no_worker_processes():
+    results = list(iter_extract_texts_parallel(_text_files(3), max_workers=2, timeout=0.01))
+    assert all(result["content"] == "" and "timed out" in result["error"] for result in results)
+    deadline = time.monotonic() + 5
+    while multiprocessing.active_children() and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert multiprocessing.active_children() == []
+
+def test_text_budget_truncates_without_changing_text():
+    data = "".join(f"line {i}\n" for i in range(1000)).encode()
+    full = extract_text_from_file("notes.txt", BytesIO(data))
+    assert full == data.decode()
+    assert extract_text_from_file("notes.txt", BytesIO(data), max_chars=50) == full[:50]
+    assert extract_text_from_file("notes.txt", BytesIO(data), max_chars=10 ** 9) == full
+
+def test_text_budget_stops_docx_paragraphs():
+    document = Document()
+    for i in range(200):
+        document.add_paragraph(f"Paragraph {i}")
+    stream = BytesIO()
+    document.save(stream)
+    full = extract_text_from_file("report.docx", BytesIO(stream.getvalue()))
+    budgeted = extract_text_from_file("report.docx", BytesIO(stream.getvalue()), max_chars=40)
+    assert full.startswith("Paragraph 0\nParagraph 1\n")
+    assert budgeted.replace("\n", "") == full.replace("\n", "")[:40]
+
+def test_stream_type_detection_leaves_buffer_writable():
+    stream = BytesIO(b"%PDF-1.7\n")
+    assert _detect_stream_type(stream, "upload.bin") == "pdf"
+    # A memoryview still exported over the buffer would make this raise BufferError.
+    stream.write(b"appended")
+
+def _workbook(rows):
+    workbook = Workbook()
+    sheet = workbook.active
+    for i in range(rows):
+        sheet.append([f"row{i}", i])
+    stream = BytesIO()
+    workbook.save(stream)
+    return stream.getvalue()
+
+def test_sheet_row_limits_reach_the_extractor():
+    data = _workbook(1000)
+    assert extract_text_from_file("book.xlsx", BytesIO(data)).count("\n") == 999
+    first = extract_text_from_file("book.xlsx", BytesIO(data), max_rows_per_sheet=10)
+    assert first.splitlines() == [f"row{i}\t{i}" for i in range(10)]
+    text, error = _extract_worker("book.xlsx", data, "xlsx", None, 10, True)
+    assert error is None
+    assert text.splitlines() == [f"row{i}\t{i}" for i in range(0, 1000, 100)]
@@ -0,0 +1,83 @@
+import os
+import subprocess
+
+import pytest
+
+import utils.git_utils as git_utils
+from utils.git_utils import find_local_repos, git_log_commits, mine_repos, mirror_repo
+
+def _git(repo, *args, date=None):
+    env = dict(os.environ, GIT_AUTHOR_NAME="Alice", GIT_AUTHOR_EMAIL="alice@company.com",
+               GIT_COMMITTER_NAME="Alice", GIT_COMMITTER_EMAIL="alice@company.com")
+    if date:
+        env.update(GIT_AUTHOR_DATE=date, GIT_COMMITTER_DATE=date)
+    subprocess.run(["git", "-C", str(repo), *args], check=True, capture_output=True, env=env)
+
+@pytest.fixture
+def repo(tmp_path):
+    repo = tmp_path / "work" / "billing"
+    repo.mkdir(parents=True)
+    _git(repo, "init", "--quiet", "--initial-branch=main")
+    (repo / "README.md").write_text("one\ntwo\nthree\n")
+    _git(repo, "add", "README.md")
+    _git(repo, "commit", "--quiet", "-m", "Add readme\twith a tab", date="2024-01-01T10:00:00+02:00")
+    (repo / "README.md").write_text("one\n2\nthree\nfour\n")
+    (repo / "logo.png").write_bytes(bytes(range(256)) * 4)
+    _git(repo, "add", "README.md", "logo.png")
+    _git(repo, "commit", "--quiet", "-m", "Update readme, add logo", date="2024-01-02T09:00:00+00:00")
+    return repo
+
+def test_git_log_commits_parses_messages_and_numstat(repo):
+    newest, oldest = git_log_commits(repo)
+    assert oldest["message"] == "Add readme\twith a tab"
+    assert (oldest["additions"], oldest["deletions"], oldest["files_changed"]) == (3, 0, 1)
+    assert oldest["date"] == "2024-01-01T10:00:00+02:00"
+    # The binary logo counts as a changed file with no line stats.
+    assert (newest["additions"], newest["deletions"], newest["files_changed"]) == (2, 1, 2)
+    assert newest["repo"] == "billing" and newest["author_email"] == "alice@company.com"
+    assert [commit["sha"] for commit in git_log_commits(repo, max_count=1)] == [newest["sha"]]
+
+def test_empty_repository_has_no_commits(tmp_path):
+    _git(tmp_path, "init", "--quiet")
+    assert git_log_commits(tmp_path) == []
+
+def test_mirrors_are_found_and_mined_newest_first(repo, tmp_path):
+    other = tmp_path / "work" / "deploy"
+    other.mkdir()
+    _git(other, "init", "--quiet")
+    (other / "run.sh").write_text("echo deploy\n")
+    _git(other, "add", "run.sh")
+    _git(other, "commit", "--quiet", "-m", "Add deploy script", date="2024-01-01T12:00:00+00:00")
+
+    clone_dir = tmp_path / "mirrors"
+    for source in (repo, other):
+        mirror_repo(str(source), clone_dir / f"{source.name}.git")
+    # A second call refreshes the existing mirror instead of cloning.
+    (repo / "notes.txt").write_text("later\n")
+    _git(repo, "add", "notes.txt")
+    _git(repo, "commit", "--quiet", "-m", "Add notes", date="2024-01-03T00:00:00+00:00")
+    mirror_repo(str(repo), clone_dir / "billing.git")
+
+    mirrors = find_local_repos(clone_dir)
+    assert [path.name for path in mirrors] == ["billing.git", "deploy.git"]
+    commits = mine_repos(mirrors)
+    assert [commit["message"] for commit in commits] == [
+        "Add notes", "Update readme, add logo", "Add deploy script", "Add readme\twith a tab",
+    ]
+    assert [commit["repo"] for commit in mine_repos(mirrors, max_commits=2)] == ["billing", "billing"]
+
+def test_token_is_passed_through_the_environment(monkeypatch):
+    calls = []
+
+    def run(command, **kwargs):
+        calls.append((command, kwargs["env"]))
+        return subprocess.CompletedProcess(command, 0, "", "")
+
+    monkeypatch.setattr(git_utils.subprocess, "run", run)
+    monkeypatch.setenv("GIT_CONFIG_COUNT", "1")
+    git_utils._run_git(["fetch", "origin"], token="secret-token")
+    command, env = calls[0]
+    assert not any("secret-token" in arg for arg in command)
+    assert env["GIT_CONFIG_COUNT"] == "2"
+    assert env["GIT_CONFIG_KEY_1"] == "http.extraHeader"
+    assert env["GIT_CONFIG_VALUE_1"].startswith("Authorization: Basic ")
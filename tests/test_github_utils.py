@@ -0,0 +1,206 @@
+import pytest
+import requests
+
+import utils.github_utils as github_utils
+from utils.cache import DiskLRUCache
+from utils.github_utils import GitHubAPIError, GitHubRequestScheduler, track_quota
+
+class FakeClock:
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+        self.sleeps = []
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(round(seconds, 3))
+        self.now += seconds
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(github_utils.time, "time", clock.time)
+    monkeypatch.setattr(github_utils.time, "sleep", clock.sleep)
+    return clock
+
+class FakeResponse:
+    def __init__(self, status_code=200, data=None, headers=None, text=""):
+        self.status_code = status_code
+        self._data = data
+        self.headers = requests.structures.CaseInsensitiveDict(headers or {})
+        self.text = text
+
+    def json(self):
+        return self._data
+
+class FakeSession:
+    """Answers GETs from a queue of responses (or a callable) and records every request."""
+
+    def __init__(self, responses):
+        self.responses = responses
+        self.requests = []
+
+    def get(self, url, headers=None, params=None):
+        self.requests.append((url, dict(headers or {}), dict(params or {})))
+        if callable(self.responses):
+            return self.responses(url, headers or {}, params or {})
+        return self.responses.pop(0)
+
+@pytest.fixture
+def session(monkeypatch):
+    def install(responses):
+        fake = FakeSession(responses)
+        monkeypatch.setattr(github_utils, "get_session", lambda pool_size=None: fake)
+        return fake
+    return install
+
+def _limits(clock, remaining, reset_in=3600, limit=5000):
+    return {"X-RateLimit-Remaining": str(remaining), "X-RateLimit-Reset": str(int(clock.now + reset_in)), "X-RateLimit-Limit": str(limit)}
+
+def _waits(scheduler, count, key="anonymous"):
+    return [round(scheduler._wait_for_slot(key), 3) for _ in range(count)]
+
+def test_anonymous_quota_is_not_paced(clock):
+    scheduler = GitHubRequestScheduler()
+    scheduler._limits["anonymous"] = (59, int(clock.now) + 3000, 60)
+    assert _waits(scheduler, 4) == [0, 0, 0, 0]
+    assert clock.sleeps == []
+
+def test_low_quota_is_spread_over_the_window(clock):
+    scheduler = GitHubRequestScheduler()
+    # 400 of 5000 left (below 10%), 390 usable above the reserve, 390 s to go.
+    scheduler._limits["token"] = (400, int(clock.now) + 390, 5000)
+    assert _waits(scheduler, 4, "token") == pytest.approx([0, 1, 1, 1], abs=0.01)
+
+def test_exhausted_quota_fails_fast_with_reset_time(clock):
+    scheduler = GitHubRequestScheduler()
+    reset = int(clock.now) + 1800
+    scheduler._limits["anonymous"] = (3, reset, 60)
+    with pytest.raises(GitHubAPIError, match=github_utils._format_reset(reset)):
+        scheduler._wait_for_slot("anonymous")
+    assert clock.sleeps == []
+
+def test_exhausted_quota_resetting_soon_is_waited_out(clock):
+    scheduler = GitHubRequestScheduler()
+    scheduler._limits["anonymous"] = (2, int(clock.now) + 10, 60)
+    assert scheduler._wait_for_slot("anonymous") == pytest.approx(11)
+
+def test_retry_after_is_honoured(clock, session):
+    fake = session([
+        FakeResponse(403, headers={"Retry-After": "3"}, text="You have exceeded a secondary rate limit"),
+        FakeResponse(200, data=[]),
+    ])
+    with track_quota() as usage:
+        response = GitHubRequestScheduler().request("https://api.github.com/x", "token")
+    assert response.status_code == 200
+    assert len(fake.requests) == 2 and clock.sleeps == [3]
+    assert (usage.requests, usage.quota_spent, usage.retries) == (2, 2, 1)
+    assert usage.wait_seconds == 3
+
+def test_exhausted_primary_limit_waits_for_the_reset(clock, session):
+    fake = session([FakeResponse(403, headers=_limits(clock, 0, reset_in=5), text="API rate limit exceeded"), FakeResponse(200, data=[])])
+    response = GitHubRequestScheduler().request("https://api.github.com/x", "token")
+    assert response.status_code == 200 and len(fake.requests) == 2
+    assert sum(clock.sleeps) == pytest.approx(6)
+
+def test_backoff_longer_than_max_wait_fails_fast(clock, session):
+    session([FakeResponse(429, headers={"Retry-After": "120"})])
+    with pytest.raises(GitHubAPIError, match="retry after"):
+        GitHubRequestScheduler(max_wait=30).request("https://api.github.com/x", "token")
+    session([FakeResponse(403, headers=_limits(clock, 0, reset_in=1800), text="API rate limit exceeded")])
+    with pytest.raises(GitHubAPIError, match="retry after"):
+        GitHubRequestScheduler(max_wait=30).request("https://api.github.com/x", "token")
+    assert clock.sleeps == []
+
+def test_forbidden_without_rate_limit_is_not_retried(clock, session):
+    fake = session([FakeResponse(403, headers=_limits(clock, 4000), text="Resource not accessible")])
+    assert GitHubRequestScheduler().request("https://api.github.com/x", "token").status_code == 403
+    assert len(fake.requests) == 1 and clock.sleeps == []
+
+def _raw_commit(sha, date):
+    return {"sha": sha, "commit": {"author": {"name": "Alice", "date": date}, "committer": {"date": date}, "message": f"commit {sha}"}}
+
+@pytest.fixture
+def sync_state(tmp_path, monkeypatch):
+    monkeypatch.setattr(github_utils, "SYNC_STATE_DIR", tmp_path)
+
+def test_cold_start_sync_stops_at_its_budget(sync_state, monkeypatch):
+    histories = {f"repo{i}": [_raw_commit(f"r{i}c{j}", f"2024-01-{28 - j:02d}T00:00:00Z") for j in range(20)] for i in range(4)}
+    calls = []
+
+    def fetch_repo_commits(username, repo_name, token, per_page, max_pages, stop_event, since, limit):
+        calls.append((repo_name, since, limit))
+        # Like the API, "since" is inclusive.
+        commits = [commit for commit in histories[repo_name] if since is None or commit["commit"]["committer"]["date"] >= since]
+        return commits[:limit]
+
+    monkeypatch.setattr(github_utils, "fetch_user_repos", lambda username, token: [{"name": name} for name in histories])
+    monkeypatch.setattr(github_utils, "fetch_repo_commits", fetch_repo_commits)
+    history = github_utils.sync_user_commits("alice", max_workers=1, cold_start_commits=15)
+    # One repo already fills the budget, so the others are left for later.
+    assert len(history) == 15
+    assert calls[0] == ("repo0", None, 15)
+    assert len(github_utils.load_sync_state("alice")["repos"]) == 1
+
+    calls.clear()
+    histories["repo0"].insert(0, _raw_commit("new", "2024-02-01T00:00:00Z"))
+    history = github_utils.sync_user_commits("alice", max_workers=1, cold_start_commits=15)
+    # repo0 is synced from its mark without a budget; one more cold repo fits.
+    assert calls[0] == ("repo0", "2024-01-28T00:00:00Z", None)
+    assert history[0]["sha"] == "new"
+    assert len(history) == 31
+
+@pytest.fixture
+def http_cache(tmp_path, monkeypatch):
+    cache = DiskLRUCache(tmp_path / "http_cache.sqlite")
+    monkeypatch.setattr(github_utils, "_http_cache", cache)
+    return cache
+
+def test_not_modified_is_replayed_from_cache_without_spending_quota(http_cache, session):
+    def respond(url, headers, params):
+        if headers.get("If-None-Match") == '"v1"':
+            return FakeResponse(304)
+        return FakeResponse(200, data=[{"name": "billing"}], headers={"ETag": '"v1"', "Link": '<https://api.github.com/next>; rel="next"'})
+
+    fake = session(respond)
+    with track_quota() as usage:
+        first = github_utils.cached_request("https://api.github.com/users/alice/repos", "token", {"per_page": 100})
+        second = github_utils.cached_request("https://api.github.com/users/alice/repos", "token", {"per_page": 100})
+    assert not first.from_cache and second.from_cache
+    assert second.data == first.data == [{"name": "billing"}]
+    assert second.headers["Link"] == first.headers["Link"]
+    assert fake.requests[1][1]["If-None-Match"] == '"v1"'
+    assert (usage.requests, usage.quota_spent) == (2, 1)
+
+def test_incremental_sync_merges_commits_since_the_mark(sync_state, http_cache, session):
+    commits = [_raw_commit("c1", "2024-01-01T00:00:00Z"), _raw_commit("c2", "2024-01-02T00:00:00Z")]
+
+    def respond(url, headers, params):
+        if url.endswith("/repos"):
+            return FakeResponse(200, data=[{"name": "billing"}])
+        since = params.get("since")
+        # Newest first, and "since" includes the commit at the mark itself.
+        matching = [commit for commit in commits if since is None or commit["commit"]["committer"]["date"] >= since]
+        return FakeResponse(200, data=sorted(matching, key=lambda commit: commit["commit"]["committer"]["date"], reverse=True))
+
+    fake = session(respond)
+    assert [commit["sha"] for commit in github_utils.sync_user_commits("alice")] == ["c2", "c1"]
+    state = github_utils.load_sync_state("alice")["repos"]["billing"]
+    assert (state["last_sha"], state["last_date"]) == ("c2", "2024-01-02T00:00:00Z")
+
+    # A rebased commit: authored before c2 but committed after it.
+    rebased = _raw_commit("c3", "2024-01-03T00:00:00Z")
+    rebased["commit"]["author"]["date"] = "2023-12-31T00:00:00Z"
+    commits.append(rebased)
+    fake.requests.clear()
+    history = github_utils.sync_user_commits("alice")
+    commit_params = [params for url, _, params in fake.requests if url.endswith("/commits")]
+    assert commit_params == [{"per_page": 100, "page": 1, "since": "2024-01-02T00:00:00Z"}]
+    assert sorted(commit["sha"] for commit in history) == ["c1", "c2", "c3"]
+    state = github_utils.load_sync_state("alice")["repos"]["billing"]
+    assert (state["last_sha"], state["last_date"]) == ("c3", "2024-01-03T00:00:00Z")
+
+    # Nothing new: the mark stays and nothing is duplicated.
+    assert len(github_utils.sync_user_commits("alice")) == 3
+    assert github_utils.load_sync_state("alice")["repos"]["billing"]["last_sha"] == "c3"
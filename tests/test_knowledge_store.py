@@ -0,0 +1,35 @@
+import pytest
+
+pytest.importorskip("chromadb")
+
+from utils.knowledge_store import KnowledgeStore, items_from_documents, items_from_threads
+
+@pytest.fixture
+def store(tmp_path):
+    return KnowledgeStore(tmp_path / "chroma", collection="test")
+
+def test_same_filename_from_two_people_is_kept_apart(store):
+    alice = items_from_documents([{"filename": "notes.txt", "content": "Alice owns the billing service.", "sha256": "a1"}], "alice")
+    bob = items_from_documents([{"filename": "notes.txt", "content": "Bob runs the deploy pipeline.", "sha256": "b2"}], "bob")
+    assert store.upsert(alice)["added"] == 1
+    assert store.upsert(bob) == {"added": 1, "removed": 0, "total": 2}
+    hits = store.query("billing service", person="alice")
+    assert [hit["text"] for hit in hits] == ["Alice owns the billing service."]
+
+def test_reupserting_unchanged_items_writes_nothing(store):
+    items = items_from_documents([{"filename": "a.txt", "content": "Some text.", "sha256": "s"}], "alice")
+    items += items_from_threads([{"subject": "Plan", "first_date": "2024-01-01", "last_date": "2024-01-02", "text": "Plan text."}], "alice")
+    assert store.upsert(items)["added"] == 2
+    assert store.upsert(items) == {"added": 0, "removed": 0, "total": 2}
+
+def test_changed_thread_replaces_its_old_chunks(store):
+    thread = {"subject": "Plan", "first_date": "2024-01-01", "last_date": "2024-01-02", "text": "First version."}
+    store.upsert(items_from_threads([thread], "alice"))
+    thread = dict(thread, text="Second version.")
+    assert store.upsert(items_from_threads([thread], "alice")) == {"added": 1, "removed": 1, "total": 1}
+
+def test_changed_document_replaces_its_old_chunks(store):
+    store.upsert(items_from_documents([{"filename": "notes.txt", "content": "Old billing notes.", "sha256": "v1"}], "alice"))
+    changed = items_from_documents([{"filename": "notes.txt", "content": "New deploy notes.", "sha256": "v2"}], "alice")
+    assert store.upsert(changed) == {"added": 1, "removed": 1, "total": 1}
+    assert [hit["text"] for hit in store.query("notes", person="alice")] == ["New deploy notes."]
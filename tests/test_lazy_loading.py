@@ -0,0 +1,39 @@
+import subprocess
+import sys
+import threading
+from pathlib import Path
+
+import pytest
+
+from utils import nlp_utils
+
+ROOT = Path(__file__).resolve().parent.parent
+
+def test_nlp_modules_do_not_import_spacy():
+    code = (
+        "import sys; import utils.nlp_utils, utils.summarize, utils.topics, utils.dedup, utils.entity_index; "
+        "print(sorted(name for name in ('spacy', 'yake') if name in sys.modules))"
+    )
+    result = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == "[]"
+
+def test_get_nlp_loads_each_model_once(monkeypatch):
+    spacy = pytest.importorskip("spacy")
+    loads = []
+
+    def fake_load(name):
+        loads.append(name)
+        return spacy.blank("en")
+
+    monkeypatch.setattr(spacy, "load", fake_load)
+    monkeypatch.setattr(nlp_utils, "_models", {})
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(nlp_utils.get_nlp("toy_model"))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert loads == ["toy_model"]
+    assert all(model is results[0] for model in results)
+    # A sentence boundary component is ensured on first load.
+    assert "sentencizer" in results[0].pipe_names
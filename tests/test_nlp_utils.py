@@ -0,0 +1,44 @@
+import pytest
+
+spacy = pytest.importorskip("spacy")
+
+from utils.nlp_utils import extract_entities, parse_texts, pipes_to_disable, split_text
+
+@pytest.fixture
+def nlp():
+    # A blank pipeline with a rule-based "ner" stands in for en_core_web_sm.
+    nlp = spacy.blank("en")
+    ruler = nlp.add_pipe("entity_ruler", name="ner")
+    ruler.add_patterns([
+        {"label": "ORG", "pattern": "Acme"},
+        {"label": "PERSON", "pattern": [{"LOWER": "ada"}, {"LOWER": "lovelace"}]},
+    ])
+    nlp.add_pipe("sentencizer")
+    return nlp
+
+def test_split_text_covers_text_and_respects_limit():
+    text = "".join(f"Sentence number {i} is here. " for i in range(200)) + "\n\n" + "tail " * 50
+    chunks = split_text(text, 300)
+    assert "".join(chunk for _, chunk in chunks) == text
+    assert all(len(chunk) <= 300 for _, chunk in chunks)
+    assert all(text[offset:offset + len(chunk)] == chunk for offset, chunk in chunks)
+    # Cuts land after a sentence end rather than mid-word.
+    assert all(chunk.endswith(". ") for _, chunk in chunks[:-2])
+
+def test_pipes_to_disable_keeps_only_requested(nlp):
+    assert pipes_to_disable(nlp, ["ner"]) == ["sentencizer"]
+
+def test_batched_entities_match_per_text_offsets(nlp):
+    texts = ["Ada Lovelace joined Acme.", "", "Nothing here.", "Acme hired Ada Lovelace. " * 40]
+    entities = extract_entities(nlp, texts, batch_size=2, max_chars=120)
+    assert entities[0] == [("Ada Lovelace", "PERSON", 0, 12), ("Acme", "ORG", 20, 24)]
+    assert entities[1] == [] and entities[2] == []
+    # Offsets stay relative to the full text although it was split into chunks.
+    assert len(entities[3]) == 80
+    assert all(texts[3][start:end] == text for text, _, start, end in entities[3])
+
+def test_parse_texts_returns_sentences_and_terms(nlp):
+    [parsed] = parse_texts(nlp, ["Acme ships widgets. Ada Lovelace reviews them."])
+    assert [label for _, label, _, _ in parsed.entities] == ["ORG", "PERSON"]
+    assert len(parsed.sentences) == 2 == len(parsed.sentence_terms)
+    assert all(parsed.sentence_terms)
@@ -0,0 +1,102 @@
+import math
+from collections import Counter
+
+import numpy as np
+import pytest
+
+import utils.search_index as search_index
+from utils.search_index import SearchIndex, decode_varints, encode_varints, tokenize
+
+WORDS = "billing deploy pipeline invoice queue cache schema release budget vendor outage metrics".split()
+
+def _corpus(count, seed=0):
+    rng = np.random.default_rng(seed)
+    return {f"doc{i}": " ".join(rng.choice(WORDS, rng.integers(3, 30))) for i in range(count)}
+
+def _brute_force_bm25(texts, query, k1=1.2, b=0.75):
+    """Textbook BM25 over the live texts, written independently of the index."""
+    tokens = {doc_id: tokenize(text) for doc_id, text in texts.items()}
+    avg_length = max(sum(len(t) for t in tokens.values()) / len(tokens), 1.0)
+    scores = {}
+    for doc_id, doc_tokens in tokens.items():
+        counts = Counter(doc_tokens)
+        score = 0.0
+        for term in dict.fromkeys(tokenize(query)):
+            df = sum(term in other for other in tokens.values())
+            if not counts[term]:
+                continue
+            idf = math.log(1 + (len(tokens) - df + 0.5) / (df + 0.5))
+            tf = counts[term]
+            score += idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * len(doc_tokens) / avg_length))
+        if score > 0:
+            scores[doc_id] = score
+    return scores
+
+def _search_scores(index, query):
+    return {hit["id"]: hit["score"] for hit in index.search(query, k=1000)}
+
+def test_varint_round_trip():
+    rng = np.random.default_rng(0)
+    values = np.concatenate((
+        [0, 1, 127, 128, 16383, 16384, 2 ** 32, 2 ** 63 - 1],
+        rng.integers(0, 2 ** 40, 1000),
+    )).astype(np.int64)
+    encoded, starts = encode_varints(values)
+    assert starts[0] == 0 and len(starts) == len(values)
+    np.testing.assert_array_equal(decode_varints(np.frombuffer(encoded, dtype=np.uint8)), values)
+    assert encode_varints(np.array([127, 128]))[0] == bytes([0x7F, 0x80, 0x01])
+
+def test_bm25_matches_brute_force_across_segments_and_updates(tmp_path):
+    index = SearchIndex(tmp_path, merge_factor=100)
+    texts = _corpus(60)
+    items = list(texts.items())
+    for start in range(0, len(items), 15):
+        index.add_documents({"id": doc_id, "text": text} for doc_id, text in items[start:start + 15])
+    # Replace a few documents; their old versions become deleted postings.
+    for doc_id in ("doc3", "doc20", "doc41"):
+        texts[doc_id] = "outage outage vendor"
+    index.add_documents({"id": doc_id, "text": texts[doc_id]} for doc_id in ("doc3", "doc20", "doc41"))
+
+    for query in ("billing outage", "vendor", "deploy pipeline cache", "nothing matches"):
+        expected = _brute_force_bm25(texts, query)
+        actual = _search_scores(index, query)
+        assert actual.keys() == expected.keys()
+        for doc_id, score in expected.items():
+            assert actual[doc_id] == pytest.approx(score)
+
+def test_scores_do_not_change_after_merge(tmp_path):
+    index = SearchIndex(tmp_path, merge_factor=100)
+    texts = _corpus(40, seed=1)
+    items = list(texts.items())
+    for start in range(0, len(items), 10):
+        index.add_documents({"id": doc_id, "text": text} for doc_id, text in items[start:start + 10])
+    index.add_documents([{"id": "doc5", "text": "budget budget release"}])
+    before = _search_scores(index, "budget release")
+    index.merge(max_segments=len(index.segments))
+    assert len(index.segments) == 1
+    after = _search_scores(index, "budget release")
+    assert after.keys() == before.keys()
+    assert all(after[doc_id] == pytest.approx(before[doc_id]) for doc_id in before)
+
+def test_unchanged_documents_are_skipped(tmp_path):
+    index = SearchIndex(tmp_path)
+    assert index.add_documents([{"id": "a", "text": "billing queue"}])["added"] == 1
+    assert index.add_documents([{"id": "a", "text": "billing queue"}])["added"] == 0
+    reopened = SearchIndex(tmp_path)
+    assert [hit["id"] for hit in reopened.search("billing")] == ["a"]
+
+def test_replacement_during_merge_deletes_the_merged_copy(tmp_path, monkeypatch):
+    index = SearchIndex(tmp_path, merge_factor=100)
+    index.add_documents([{"id": "a", "text": "old billing text"}])
+    index.add_documents([{"id": "b", "text": "other queue text"}])
+    build_postings = search_index._build_postings
+
+    def merge_then_build(token_lists):
+        # A background merge finishes after "a" was looked up but before the new segment lands.
+        index.merge()
+        return build_postings(token_lists)
+
+    monkeypatch.setattr(search_index, "_build_postings", merge_then_build)
+    assert index.add_documents([{"id": "a", "text": "new invoice text"}])["deleted"] == 1
+    assert index.search("billing") == []
+    assert [hit["id"] for hit in index.search("invoice")] == ["a"]
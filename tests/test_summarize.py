@@ -0,0 +1,55 @@
+import math
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from utils.summarize import hierarchical_rank, textrank_scores, top_sentences
+
+def _dense_textrank(sentence_terms, damping=0.85, iterations=500):
+    """Reference TextRank on a dense graph, following the overlap formula literally."""
+    n = len(sentence_terms)
+    graph = np.zeros((n, n))
+    for i in range(n):
+        for j in range(n):
+            if i == j:
+                continue
+            counts_i = {t: sentence_terms[i].count(t) for t in set(sentence_terms[i])}
+            counts_j = {t: sentence_terms[j].count(t) for t in set(sentence_terms[j])}
+            shared = sum(counts_i[t] * counts_j[t] for t in counts_i if t in counts_j)
+            norm = math.log(max(len(sentence_terms[i]), 1)) + math.log(max(len(sentence_terms[j]), 1))
+            graph[i, j] = shared / norm if norm > 1e-7 else 0.0
+    out = graph.sum(axis=1)
+    scores = np.full(n, 1.0 / n)
+    for _ in range(iterations):
+        spread = np.array([scores[k] / out[k] if out[k] else 0.0 for k in range(n)])
+        dangling = sum(scores[k] for k in range(n) if not out[k])
+        scores = (1 - damping) / n + damping * (graph.T @ spread + dangling / n)
+    return scores
+
+def _random_sentences(count, vocabulary=40, seed=0):
+    rng = np.random.default_rng(seed)
+    return [rng.integers(0, vocabulary, rng.integers(0, 12)).tolist() for _ in range(count)]
+
+def test_sparse_textrank_matches_dense_reference():
+    sentences = _random_sentences(60)
+    np.testing.assert_allclose(textrank_scores(sentences), _dense_textrank(sentences), atol=1e-6)
+
+def test_textrank_scores_are_a_distribution():
+    scores = textrank_scores(_random_sentences(30, seed=3))
+    assert np.all(scores > 0)
+    assert abs(scores.sum() - 1.0) < 1e-6
+    assert textrank_scores([]).shape == (0,)
+
+def test_hierarchical_rank_equals_textrank_for_short_texts():
+    sentences = _random_sentences(20, seed=1)
+    lengths = [50] * len(sentences)
+    assert hierarchical_rank(sentences, lengths, 3, section_chars=10_000) == top_sentences(sentences, 3)
+
+def test_hierarchical_rank_reduces_long_texts_the_same_on_an_executor():
+    sentences = _random_sentences(400, seed=2)
+    lengths = [80] * len(sentences)
+    serial = hierarchical_rank(sentences, lengths, 4, section_chars=2000)
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        parallel = hierarchical_rank(sentences, lengths, 4, section_chars=2000, executor=executor)
+    assert serial == parallel
+    assert len(serial) == 4 and serial == sorted(serial)
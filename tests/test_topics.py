@@ -0,0 +1,78 @@
+import numpy as np
+from scipy import sparse
+
+from utils.topics import corpus_topics, nmf, tfidf_matrix, topic_weights
+
+TERMS = {1: "invoice", 2: "billing", 3: "payment", 4: "refund", 11: "deploy", 12: "pipeline", 13: "release", 14: "rollback", 99: "team"}
+
+def _two_topic_corpus():
+    rng = np.random.default_rng(0)
+    finance, infra = [1, 2, 3, 4], [11, 12, 13, 14]
+    docs = [list(rng.choice(finance, 12)) + [99] for _ in range(6)]
+    docs += [list(rng.choice(infra, 12)) + [99] for _ in range(6)]
+    return docs
+
+def test_tfidf_rows_are_normalized_and_common_terms_dropped():
+    tfidf, vocabulary = tfidf_matrix(_two_topic_corpus())
+    # "team" is in every document, above max_df.
+    assert 99 not in vocabulary
+    norms = np.sqrt(np.asarray(tfidf.multiply(tfidf).sum(axis=1)).ravel())
+    np.testing.assert_allclose(norms, 1.0)
+    assert (tfidf.data > 0).all()
+
+def test_tfidf_drops_singleton_terms_but_keeps_empty_rows():
+    tfidf, vocabulary = tfidf_matrix([[1, 2, 5], [1, 2], [2, 3], [3, 1], []])
+    assert 5 not in vocabulary
+    assert tfidf.shape == (5, len(vocabulary))
+    assert tfidf[4].nnz == 0
+
+def test_nmf_is_non_negative_and_fits_a_low_rank_matrix():
+    rng = np.random.default_rng(1)
+    matrix = sparse.csr_matrix(rng.random((30, 2)) @ rng.random((2, 20)))
+    W, H = nmf(matrix, 2, max_iter=500, tol=0)
+    assert (W >= 0).all() and (H >= 0).all()
+    error = np.linalg.norm(matrix.toarray() - W @ H) / np.linalg.norm(matrix.toarray())
+    assert error < 0.05
+
+def test_nmf_loss_decreases_with_more_iterations():
+    matrix = sparse.random(40, 30, density=0.2, random_state=2, format="csr")
+    losses = []
+    for iterations in (1, 5, 50):
+        W, H = nmf(matrix, 4, max_iter=iterations, tol=0)
+        losses.append(np.linalg.norm(matrix.toarray() - W @ H))
+    assert losses[0] > losses[1] > losses[2]
+
+def test_corpus_topics_separates_two_topics():
+    result = corpus_topics(_two_topic_corpus(), TERMS.get, n_topics=2)
+    assert len(result["topics"]) == 2
+    weights = result["weights"]
+    np.testing.assert_allclose(weights.sum(axis=1), 1.0)
+    dominant = weights.argmax(axis=1)
+    assert len(set(dominant[:6])) == 1 and len(set(dominant[6:])) == 1
+    assert dominant[0] != dominant[6]
+    finance_label = result["topics"][dominant[0]]
+    assert all(term in ("invoice", "billing", "payment", "refund") for term in finance_label.split(", "))
+    assert set(result["keywords"][0]) <= {"invoice", "billing", "payment", "refund"}
+
+def test_corpus_topics_without_usable_terms():
+    result = corpus_topics([[], []], TERMS.get)
+    assert result["topics"] == []
+    assert result["weights"].shape == (2, 0)
+    assert result["keywords"] == [[], []]
+
+def test_small_corpus_gets_fewer_topics_than_documents():
+    docs = [[1, 2, 3, 4, 11], [1, 2, 3, 12], [2, 3, 4, 11, 12]]
+    result = corpus_topics(docs, TERMS.get, n_topics=8)
+    assert len(result["topics"]) == 1
+    result = corpus_topics(_two_topic_corpus(), TERMS.get, n_topics=8)
+    assert len(result["topics"]) == 6
+
+def test_topic_weights_filters_and_orders():
+    weights = np.array([0.05, 0.6, 0.35])
+    assert topic_weights(["a", "b", "c"], weights) == {1: {"label": "b", "weight": 0.6}, 2: {"label": "c", "weight": 0.35}}
+    assert list(topic_weights(["a", "b", "c"], weights, min_weight=0.0)) == [1, 2, 0]
+
+def test_topics_with_the_same_label_are_kept_apart():
+    weights = topic_weights(["billing, invoice", "billing, invoice"], np.array([0.5, 0.5]))
+    assert sorted(weights) == [0, 1]
+    assert [share["label"] for share in weights.values()] == ["billing, invoice", "billing, invoice"]
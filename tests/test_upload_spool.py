@@ -0,0 +1,31 @@
+from io import BytesIO
+
+import pytest
+
+from utils.upload_spool import UploadSpool, UploadTooLargeError, open_mapped
+
+def _upload(name, data):
+    upload = BytesIO(data)
+    upload.name = name
+    return upload
+
+def test_identical_uploads_share_one_file(tmp_path):
+    with UploadSpool(tmp_path) as spool:
+        first = spool.add(_upload("a.txt", b"same bytes"))
+        second = spool.add(_upload("copy.TXT", b"same bytes"))
+        assert first.path == second.path
+        assert spool.total_bytes == len(b"same bytes")
+        with open_mapped(first.path) as mapped:
+            assert mapped.read() == b"same bytes"
+        run_dir = spool.run_dir
+    assert not run_dir.exists()
+
+def test_per_file_and_per_run_limits(tmp_path):
+    with UploadSpool(tmp_path, max_file_bytes=10, max_run_bytes=15) as spool:
+        with pytest.raises(UploadTooLargeError, match="per-file"):
+            spool.add(_upload("big.txt", b"x" * 11))
+        spool.add(_upload("one.txt", b"y" * 10))
+        with pytest.raises(UploadTooLargeError, match="per-run"):
+            spool.add(_upload("two.txt", b"z" * 6))
+        # Rejected uploads leave no partial files behind.
+        assert [path.name for path in spool.run_dir.iterdir()] == [spool.files[0].path.name]
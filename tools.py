@@ -1,38 +1,55 @@
 import requests
+import hashlib
 import os
+from bisect import bisect_right
 import tempfile
 from pathlib import Path
 from crewai.tools import BaseTool
 from io import BytesIO
-from utils.github_utils import fetch_user_repos, fetch_repo_commits
-from utils.file_utils import extract_text_from_file
-from utils.email_utils import get_all_relevant_emails
-import spacy
+from contextlib import nullcontext
+from concurrent.futures import ProcessPoolExecutor
+from utils.github_utils import fetch_user_repos, fetch_all_user_commits
+from utils.git_utils import MIRROR_DIR, find_local_repos, mirror_user_repos, mine_repos
+from utils.commit_store import CommitStore
+from utils.file_utils import ingest_uploads, is_ingested
+from utils.email_store import get_stored_relevant_emails
+from utils.nlp_utils import NER_BATCH_SIZE, get_nlp, parse_texts
+from utils.summarize import SECTION_CHARS, SECTION_SENTENCES, hierarchical_summary
+from utils.knowledge_store import get_knowledge_store, items_from_documents, items_from_commits, items_from_threads
+from utils.search_index import get_search_index
+from utils.entity_index import EntityIndex
+from utils.topics import MAX_TOPICS, MIN_TOPIC_DOCS, corpus_topics, topic_weights
+from utils.dedup import DEDUP_THRESHOLD, near_duplicate_clusters
 from typing import List, Dict, Any
-from sumy.parsers.plaintext import PlaintextParser
-from sumy.nlp.tokenizers import Tokenizer
-from sumy.summarizers.text_rank import TextRankSummarizer
-import yake
-
-# Initialize NLP model (ensure the model is installed via requirements.txt)
-nlp = spacy.load("en_core_web_sm")
 
 class GitHubCommitsTool(BaseTool):
     name: str = "GitHub Commits Fetcher"
     description: str = "Fetches commit history for a GitHub user."
 
-    def _run(self, github_username: str, token: str = None) -> List[Dict]:
-        """Fetch commit history for a GitHub user using github_utils."""
-        commits = []
-        repos = fetch_user_repos(github_username, token)
-        for repo in repos:
-            if not isinstance(repo, dict) or "name" not in repo:
-                continue
-            repo_name = repo["name"]
-            repo_commits = fetch_repo_commits(github_username, repo_name, token)
-            if isinstance(repo_commits, list):
-                commits.extend(repo_commits)
-        return commits[:50]
+    def _run(self, github_username: str, token: str = None, max_commits: int = 50, backend: str = "api", clone_dir: str = None) -> Dict:
+        """
+        Fetch commit history for a GitHub user using github_utils.
+        The API backend syncs the user's history incrementally (only commits
+        newer than the stored per-repo high-water marks are fetched); the
+        first sync of a user collects at most COLD_START_COMMITS commits.
+        backend="git" mirrors each repo under clone_dir (reusing existing bare
+        clones) and mines `git log` locally instead of paging the REST API.
+        Returns the newest max_commits slim commits plus activity aggregates
+        computed over the full history.
+        """
+        if backend == "git":
+            clone_dir = clone_dir or MIRROR_DIR
+            repo_paths = find_local_repos(clone_dir)
+            if github_username:
+                repo_paths = mirror_user_repos(fetch_user_repos(github_username, token), clone_dir, token)
+            history = mine_repos(repo_paths)
+        else:
+            history = fetch_all_user_commits(github_username, token)
+        store = CommitStore.from_commits(history)
+        return {
+            "commits": history[:max_commits],
+            "activity": store.summary(github_username),
+        }
 
 class EmailProcessorTool(BaseTool):
     name: str = "Email Processor"
@@ -43,9 +60,12 @@ class EmailProcessorTool(BaseTool):
         Fetch emails as per requirements:
         - All company emails to/from user
         - All emails with attachments
+        New messages are synced into the local email store first; the
+        results are then read from the store. Major threads come back with
+        their de-quoted text so each can be analysed as one unit.
         """
         try:
-            email_data = get_all_relevant_emails(person_name, mapping, company_domain)
+            email_data = get_stored_relevant_emails(person_name, mapping, company_domain)
             # You can further process or summarize email_data here if needed
             return {
                 "from_company": [
@@ -57,8 +77,19 @@ class EmailProcessorTool(BaseTool):
                     for msg in email_data["to_company"]
                 ],
                 "with_attachments": [
-                    {"subject": msg.subject, "from": msg.from_, "to": msg.to, "date": msg.date, "attachments": [att.filename for att in msg.attachments]}
+                    {"subject": msg.subject, "from": msg.from_, "to": msg.to, "date": msg.date, "attachments": msg.attachments}
                     for msg in email_data["with_attachments"]
+                ],
+                "threads": [
+                    {
+                        "subject": thread.subject,
+                        "messages": len(thread.messages),
+                        "participants": thread.participants,
+                        "first_date": thread.messages[0].date,
+                        "last_date": thread.messages[-1].date,
+                        "text": thread.text
+                    }
+                    for thread in email_data["threads"]
                 ]
             }
         except Exception as e:
@@ -69,12 +100,20 @@ class FileProcessorTool(BaseTool):
     description: str = "Processes uploaded files and extracts metadata."
 
     def _run(self, uploaded_files: List) -> List[Dict]:
-        """Process uploaded files and extract metadata."""
+        """
+        Process uploaded files and extract metadata.
+        Accepts raw uploads or the records produced by ingest_uploads.
+        """
+        records = uploaded_files if is_ingested(uploaded_files) else ingest_uploads(uploaded_files)
         return [{
-            "filename": file.name,
-            "filetype": file.type,
-            "size": len(file.getvalue())
-        } for file in uploaded_files]
+            "filename": record["filename"],
+            "filetype": record["filetype"],
+            "detected_type": record["detected_type"],
+            "size": record["size"],
+            "sha256": record["sha256"],
+            "status": record["status"],
+            "error": record["error"]
+        } for record in records]
 
 class DocumentTextExtractorTool(BaseTool):
     name: str = "Document Text Extractor"
@@ -83,21 +122,18 @@ class DocumentTextExtractorTool(BaseTool):
     def _run(self, uploaded_files: List) -> List[Dict]:
         """
         Extract text from Streamlit-uploaded files.
-        Each file is a Streamlit UploadedFile object.
+        Accepts raw uploads or the records produced by ingest_uploads, so an
+        upload that has already been ingested is not read or parsed again.
+        Successful files also carry the content's "sha256"; failed files carry
+        an "error" entry instead of "content".
         """
-        results = []
-        for file in uploaded_files:
-            filename = file.name
-            file_stream = BytesIO(file.getvalue())
-            try:
-                text = extract_text_from_file(filename, file_stream)
-            except Exception as e:
-                text = f"Error extracting text: {str(e)}"
-            results.append({
-                "filename": filename,
-                "content": text
-            })
-        return results
+        records = uploaded_files if is_ingested(uploaded_files) else ingest_uploads(uploaded_files)
+        return [
+            {"filename": record["filename"], "content": record["content"], "sha256": record["sha256"]}
+            if record["status"] == "success" else
+            {"filename": record["filename"], "error": record["error"]}
+            for record in records
+        ]
 
 class NLPAnalyzerTool(BaseTool):
     name: str = "NLP Analyzer"
@@ -107,41 +143,101 @@ class NLPAnalyzerTool(BaseTool):
         self,
         texts: List[str],
         summary_sentences: int = 3,
-        topic_count: int = 5
+        topic_count: int = 5,
+        batch_size: int = NER_BATCH_SIZE,
+        n_process: int = 1,
+        nlp=None,
+        section_chars: int = SECTION_CHARS,
+        section_sentences: List[int] = SECTION_SENTENCES,
+        max_workers: int = 1,
+        topic_model: str = "auto",
+        n_topics: int = MAX_TOPICS,
+        dedup_threshold: float = DEDUP_THRESHOLD
     ) -> List[Dict[str, Any]]:
+        """
+        topic_model="auto" fits one TF-IDF + NMF topic model over all texts
+        when there are at least MIN_TOPIC_DOCS of them, and falls back to
+        per-text YAKE keywords otherwise ("nmf" / "yake" force either path).
+        Near-duplicate texts (estimated Jaccard >= dedup_threshold; None
+        disables) are analysed once: the others get {"duplicate_of": index,
+        "similarity": estimate} pointing at the analysed representative.
+        Summarization runs in-process; max_workers > 1 opts in to summarizing
+        the sections of long texts on a process pool of that size.
+        """
+        # spaCy and yake are loaded on first use rather than at import time,
+        # so runs that never reach NLP do not pay for them.
+        import yake
+
+        nlp = nlp or get_nlp()
+        valid = [i for i, text in enumerate(texts) if isinstance(text, str) and text.strip()]
+        # Near-duplicate detection (MinHash + LSH): only one representative per cluster is analysed
+        duplicates = {}
+        if dedup_threshold is not None and len(valid) > 1:
+            representatives, similarities = near_duplicate_clusters([texts[i] for i in valid], dedup_threshold)
+            for position, i in enumerate(valid):
+                if valid[representatives[position]] != i:
+                    duplicates[i] = {"duplicate_of": valid[representatives[position]], "similarity": similarities[position]}
+            valid = [i for i in valid if i not in duplicates]
+        # Named Entity Recognition and sentence segmentation, batched over every
+        # text with only the NER and sentence-boundary stages enabled
+        parsed_by_text = dict(zip(valid, parse_texts(nlp, [texts[i] for i in valid], batch_size, n_process)))
+
+        # Corpus-level topics: one TF-IDF matrix over every text's spaCy terms, factorized with NMF
+        corpus = None
+        if topic_model == "nmf" or (topic_model == "auto" and len(valid) >= MIN_TOPIC_DOCS):
+            doc_terms = [[term for sentence in parsed_by_text[i].sentence_terms for term in sentence] for i in valid]
+            corpus = corpus_topics(doc_terms, lambda term: nlp.vocab.strings[term], n_topics, topic_count)
+        corpus_position = {i: position for position, i in enumerate(valid)}
+
+        # Long texts are summarized section by section, on a process pool only when asked for
+        pool = nullcontext()
+        if max_workers > 1 and any(len(texts[i]) > section_chars for i in valid):
+            pool = ProcessPoolExecutor(max_workers=max_workers)
+
         results = []
-        for text in texts:
-            if not isinstance(text, str) or not text.strip():
-                results.append({"error": "Empty or invalid text input."})
-                continue
-
-            # Named Entity Recognition
-            doc = nlp(text)
-            entities = [(ent.text, ent.label_) for ent in doc.ents]
-
-            # Extractive Summarization (TextRank)
-            try:
-                parser = PlaintextParser.from_string(text, Tokenizer("english"))
-                summarizer = TextRankSummarizer()
-                summary = " ".join(str(sentence) for sentence in summarizer(parser.document, summary_sentences))
-                if not summary:
+        with pool as executor:
+            for i, text in enumerate(texts):
+                if i in duplicates:
+                    results.append(duplicates[i])
+                    continue
+                if i not in parsed_by_text:
+                    results.append({"error": "Empty or invalid text input."})
+                    continue
+
+                parsed = parsed_by_text[i]
+                # (text, label, start_char, sentence index) so mentions can be traced back
+                sentence_starts = [start for start, _ in parsed.sentences]
+                entities = [
+                    (ent_text, label, start, max(bisect_right(sentence_starts, start) - 1, 0))
+                    for ent_text, label, start, _ in parsed.entities
+                ]
+
+                # Extractive Summarization (TextRank over the spaCy sentences, map-reduce over sections for long texts)
+                try:
+                    summary = hierarchical_summary(text, parsed, summary_sentences, section_chars, section_sentences, executor)
+                    if not summary:
+                        summary = text[:200] + "..." if len(text) > 200 else text
+                except Exception:
                     summary = text[:200] + "..." if len(text) > 200 else text
-            except Exception:
-                summary = text[:200] + "..." if len(text) > 200 else text
-
-            # Topic Extraction (YAKE)
-            try:
-                kw_extractor = yake.KeywordExtractor(n=1, top=topic_count)
-                keywords = kw_extractor.extract_keywords(text)
-                topics = [kw for kw, score in keywords]
-            except Exception:
-                topics = []
-
-            results.append({
-                "entities": entities,
-                "summary": summary,
-                "topics": topics
-            })
+
+                # Topic Extraction (corpus topic model, YAKE when there is no corpus model or it found no terms)
+                topics = corpus["keywords"][corpus_position[i]] if corpus else []
+                if not topics:
+                    try:
+                        kw_extractor = yake.KeywordExtractor(n=1, top=topic_count)
+                        keywords = kw_extractor.extract_keywords(text)
+                        topics = [kw for kw, score in keywords]
+                    except Exception:
+                        topics = []
+
+                result = {
+                    "entities": entities,
+                    "summary": summary,
+                    "topics": topics
+                }
+                if corpus and corpus["topics"]:
+                    result["topic_weights"] = topic_weights(corpus["topics"], corpus["weights"][corpus_position[i]])
+                results.append(result)
         return results
 
 
@@ -149,14 +245,51 @@ class KnowledgeBaseBuilderTool(BaseTool):
     name: str = "Knowledge Base Builder"
     description: str = "Builds structured knowledge base from extracted insights."
 
-    def _run(self, insights: List[Dict]) -> Dict:
-        """Build knowledge base from insights."""
+    def _run(self, insights: List[Dict], documents: List[Dict] = None, commits: List[Dict] = None, threads: List[Dict] = None, person: str = None, insight_sources: List[str] = None) -> Dict:
+        """
+        Build knowledge base from insights. Documents, commits and email
+        threads are also chunked into the persistent knowledge store under
+        data/knowledge_base, and together with the summaries added to the
+        BM25 search index; unchanged content is skipped. Entities are
+        deduplicated into one entry per entity with its mention count and
+        the insights (and their insight_sources) that mention it.
+        """
+        items = (
+            items_from_documents(documents or [], person)
+            + items_from_commits(commits or [], person)
+            + items_from_threads(threads or [], person)
+        )
+        summaries = [insight.get("summary", "") for insight in insights]
+        # Summaries, extracted text and commit messages are also added to the BM25 search index
+        search_docs = [
+            {"id": item["doc_id"], "text": item["text"], "title": item.get("title"), "source": item["source"]}
+            for item in items
+        ] + [
+            {"id": f"summary:{hashlib.sha256(summary.encode('utf-8')).hexdigest()}", "text": summary, "source": "summary"}
+            for summary in summaries if summary
+        ]
         return {
-            "entities": [item for insight in insights for item in insight.get("entities", [])],
-            "summaries": [insight.get("summary", "") for insight in insights],
-            "topics": list(set([topic for insight in insights for topic in insight.get("topics", [])]))
+            "entities": EntityIndex.from_insights(insights, insight_sources).to_dict(),
+            "summaries": summaries,
+            "topics": list(set([topic for insight in insights for topic in insight.get("topics", [])])),
+            "shared_topics": self._shared_topics(insights),
+            "indexed": get_knowledge_store().upsert(items) if items else None,
+            "searchable": get_search_index().add_documents(search_docs) if search_docs else None
         }
 
+    @staticmethod
+    def _shared_topics(insights: List[Dict]) -> List[Dict]:
+        """Corpus topics ranked by their total weight across insights."""
+        totals, labels = {}, {}
+        for insight in insights:
+            for topic, share in insight.get("topic_weights", {}).items():
+                totals[topic] = totals.get(topic, 0.0) + share["weight"]
+                labels[topic] = share["label"]
+        return [
+            {"topic": topic, "label": labels[topic], "weight": round(weight, 3)}
+            for topic, weight in sorted(totals.items(), key=lambda item: -item[1])
+        ]
+
 # Optional: Export tool instances if you prefer to use them directly in agents.py
 # But you can also instantiate them directly in agents.py as shown in the example below.
 
@@ -1 +1,140 @@
+import hashlib
+import sqlite3
+import threading
+import time
+import zlib
+from pathlib import Path
+from typing import Optional, Dict, Union
 
+DATA_DIR = Path(__file__).resolve().parent.parent / "data"
+PROCESSED_DIR = DATA_DIR / "processed"
+
+class DiskLRUCache:
+    """
+    Persistent key/value cache backed by a single SQLite file.
+
+    Values are zlib-compressed bytes. When the stored size exceeds max_bytes,
+    the least recently read entries are evicted first.
+    """
+
+    def __init__(self, path: Union[str, Path], max_bytes: int = 256 * 1024 * 1024):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS entries_last_access ON entries(last_access)")
+        self._conn.commit()
+        self._total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._conn.execute("UPDATE entries SET last_access = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+        return zlib.decompress(row[0])
+
+    def set(self, key: str, value: bytes):
+        blob = zlib.compress(value)
+        size = len(blob)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            row = self._conn.execute("SELECT size FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                self._total -= row[0]
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries (key, value, size, last_access) VALUES (?, ?, ?, ?)",
+                (key, blob, size, time.time()),
+            )
+            self._total += size
+            self._evict()
+            self._conn.commit()
+
+    def delete(self, key: str):
+        with self._lock:
+            row = self._conn.execute("SELECT size FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self._total -= row[0]
+                self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM entries")
+            self._conn.commit()
+            self._total = 0
+
+    def _evict(self):
+        """Drop least recently used entries until the cache fits; caller holds the lock."""
+        while self._total > self.max_bytes:
+            rows = self._conn.execute(
+                "SELECT key, size FROM entries ORDER BY last_access LIMIT 64"
+            ).fetchall()
+            if not rows:
+                self._total = 0
+                break
+            for key, size in rows:
+                self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self._total -= size
+                if self._total <= self.max_bytes:
+                    break
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        return {"hits": self.hits, "misses": self.misses, "entries": entries, "bytes": self._total}
+
+EXTRACTION_CACHE_PATH = PROCESSED_DIR / "extraction_cache.sqlite"
+EXTRACTION_CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+class ExtractionCache:
+    """
+    Content-addressed cache of extracted document text.
+
+    Entries are keyed by the SHA-256 of the file bytes, the detected file type
+    and the extractor version, so re-uploads of the same handbook under any
+    name hit the cache while an extractor change invalidates old entries.
+    """
+
+    def __init__(self, version: str, path: Union[str, Path] = EXTRACTION_CACHE_PATH, max_bytes: int = EXTRACTION_CACHE_MAX_BYTES):
+        self.version = version
+        self._store = DiskLRUCache(path, max_bytes=max_bytes)
+
+    @staticmethod
+    def digest(data) -> str:
+        """SHA-256 of bytes or any buffer (e.g. a memoryview) without copying it."""
+        return hashlib.sha256(data).hexdigest()
+
+    def key(self, digest: str, file_type: Optional[str]) -> str:
+        return f"{digest}:{file_type or ''}:{self.version}"
+
+    def get(self, digest: str, file_type: Optional[str]) -> Optional[str]:
+        value = self._store.get(self.key(digest, file_type))
+        return value.decode("utf-8") if value is not None else None
+
+    def put(self, digest: str, file_type: Optional[str], text: str):
+        self._store.set(self.key(digest, file_type), text.encode("utf-8"))
+
+    def stats(self) -> Dict[str, int]:
+        return self._store.stats()
+
+_extraction_caches = {}
+_extraction_caches_lock = threading.Lock()
+
+def get_extraction_cache(version: str) -> ExtractionCache:
+    """Process-wide ExtractionCache for the given extractor version."""
+    with _extraction_caches_lock:
+        if version not in _extraction_caches:
+            _extraction_caches[version] = ExtractionCache(version)
+        return _extraction_caches[version]
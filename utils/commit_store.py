@@ -0,0 +1,165 @@
+from datetime import datetime, timezone
+from typing import Optional, List, Dict, Iterable
+
+import numpy as np
+
+from utils.github_utils import parse_commit_data
+
+WEEK_SECONDS = 7 * 24 * 3600
+# The Unix epoch fell on a Thursday; shifting by four days aligns weeks to Mondays.
+WEEK_OFFSET = 4 * 24 * 3600
+
+def normalize_commit(commit: Dict) -> Dict:
+    """Reduce a raw GitHub commit payload to the slim parse_commit_data shape."""
+    if "commit" in commit:
+        return parse_commit_data(commit, commit.get("repo"))
+    return commit
+
+def _to_timestamp(value: Optional[str]) -> int:
+    """Epoch seconds, or 0 when the date is missing or unparseable."""
+    if not value:
+        return 0
+    try:
+        parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return 0
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return int(parsed.timestamp())
+
+class CommitStore:
+    """
+    Columnar view of a commit history.
+
+    Repos and authors are dictionary-encoded into integer ids so every
+    aggregation below is a handful of NumPy calls over flat arrays. Commits
+    without a usable date have timestamp 0 and are left out of the time
+    aggregates.
+    """
+
+    def __init__(self, timestamps, repo_ids, author_ids, additions, deletions, files_changed, repos: List[str], authors: List[str], author_logins: List[Optional[str]], shas: List[str], messages: List[str]):
+        self.timestamps = timestamps
+        self.repo_ids = repo_ids
+        self.author_ids = author_ids
+        self.additions = additions
+        self.deletions = deletions
+        self.files_changed = files_changed
+        self.repos = repos
+        self.authors = authors
+        self.author_logins = author_logins
+        self.shas = shas
+        self.messages = messages
+
+    @classmethod
+    def from_commits(cls, commits: Iterable[Dict]) -> "CommitStore":
+        repo_index, author_index = {}, {}
+        author_logins = []
+        timestamps, repo_ids, author_ids = [], [], []
+        additions, deletions, files_changed = [], [], []
+        shas, messages = [], []
+        for raw in commits:
+            commit = normalize_commit(raw)
+            repo_ids.append(repo_index.setdefault(commit.get("repo") or "", len(repo_index)))
+            author = commit.get("author") or ""
+            if author not in author_index:
+                author_index[author] = len(author_index)
+                author_logins.append(commit.get("author_login"))
+            author_ids.append(author_index[author])
+            timestamps.append(_to_timestamp(commit.get("date")))
+            additions.append(commit.get("additions") or 0)
+            deletions.append(commit.get("deletions") or 0)
+            files_changed.append(commit.get("files_changed") or 0)
+            shas.append(commit.get("sha"))
+            messages.append((commit.get("message") or "").split("\n", 1)[0])
+        return cls(
+            timestamps=np.asarray(timestamps, dtype=np.int64),
+            repo_ids=np.asarray(repo_ids, dtype=np.int32),
+            author_ids=np.asarray(author_ids, dtype=np.int32),
+            additions=np.asarray(additions, dtype=np.int32),
+            deletions=np.asarray(deletions, dtype=np.int32),
+            files_changed=np.asarray(files_changed, dtype=np.int32),
+            repos=list(repo_index),
+            authors=list(author_index),
+            author_logins=author_logins,
+            shas=shas,
+            messages=messages,
+        )
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    def _author_id(self, user: Optional[str]) -> Optional[int]:
+        if not user:
+            return None
+        user = user.lower()
+        for author_id, (name, login) in enumerate(zip(self.authors, self.author_logins)):
+            if name.lower() == user or (login or "").lower() == user:
+                return author_id
+        return None
+
+    def most_active_repos(self, top: int = 5) -> List[Dict]:
+        if not len(self):
+            return []
+        counts = np.bincount(self.repo_ids, minlength=len(self.repos))
+        churn = np.bincount(self.repo_ids, weights=self.additions + self.deletions, minlength=len(self.repos))
+        last_active = np.zeros(len(self.repos), dtype=np.int64)
+        np.maximum.at(last_active, self.repo_ids, self.timestamps)
+        order = np.argsort(-counts, kind="stable")[:top]
+        return [{
+            "repo": self.repos[i],
+            "commits": int(counts[i]),
+            "lines_changed": int(churn[i]),
+            "last_commit": _format_timestamp(last_active[i]) if last_active[i] > 0 else None,
+        } for i in order if counts[i]]
+
+    def activity_by_week(self) -> List[Dict]:
+        dated = self.timestamps[self.timestamps > 0]
+        if not len(dated):
+            return []
+        weeks, counts = np.unique((dated - WEEK_OFFSET) // WEEK_SECONDS, return_counts=True)
+        starts = weeks * WEEK_SECONDS + WEEK_OFFSET
+        return [{"week": _format_timestamp(start)[:10], "commits": int(count)} for start, count in zip(starts, counts)]
+
+    def collaborators(self, user: Optional[str] = None, top: int = 10) -> List[Dict]:
+        """Other authors in the user's repos, with commit and shared-repo counts."""
+        if not len(self):
+            return []
+        mask = np.ones(len(self), dtype=bool)
+        user_id = self._author_id(user)
+        if user_id is not None:
+            mask &= self.author_ids != user_id
+            user_repos = np.unique(self.repo_ids[self.author_ids == user_id])
+            mask &= np.isin(self.repo_ids, user_repos)
+        author_ids = self.author_ids[mask]
+        if not len(author_ids):
+            return []
+        commit_counts = np.bincount(author_ids, minlength=len(self.authors))
+        pairs = np.unique(self.repo_ids[mask].astype(np.int64) * len(self.authors) + author_ids)
+        repo_counts = np.bincount(pairs % len(self.authors), minlength=len(self.authors))
+        order = np.argsort(-commit_counts, kind="stable")[:top]
+        return [{
+            "author": self.authors[i],
+            "commits": int(commit_counts[i]),
+            "shared_repos": int(repo_counts[i]),
+        } for i in order if commit_counts[i]]
+
+    def summary(self, user: Optional[str] = None) -> Dict:
+        """Aggregates backing the GitHub task's 'patterns and trends' output."""
+        dated = self.timestamps[self.timestamps > 0]
+        weekday_counts = np.bincount(((dated // 86400) + 3) % 7, minlength=7)
+        hour_counts = np.bincount((dated % 86400) // 3600, minlength=24)
+        return {
+            "total_commits": len(self),
+            "undated_commits": len(self) - len(dated),
+            "repositories": len(self.repos),
+            "first_commit": _format_timestamp(dated.min()) if len(dated) else None,
+            "last_commit": _format_timestamp(dated.max()) if len(dated) else None,
+            "most_active_repos": self.most_active_repos(),
+            "activity_by_week": self.activity_by_week(),
+            "commits_by_weekday": dict(zip(["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"], weekday_counts.tolist())),
+            "busiest_hour_utc": int(np.argmax(hour_counts)) if len(dated) else None,
+            "collaborators": self.collaborators(user),
+        }
+
+def _format_timestamp(timestamp) -> str:
+    return datetime.fromtimestamp(int(timestamp), tz=timezone.utc).isoformat().replace("+00:00", "Z")
@@ -0,0 +1,97 @@
+import re
+import zlib
+from typing import List, Dict, Sequence, Tuple
+
+import numpy as np
+
+DEDUP_THRESHOLD = 0.7
+NUM_PERM = 128
+LSH_BANDS = 32
+SHINGLE_SIZE = 3
+_SIGNATURE_BLOCK = 4096
+_TOKEN_RE = re.compile(r"\w+")
+# Hash permutations are (a * x + b) mod p over 32-bit shingle hashes; with
+# a, b < 2**31 the products stay inside uint64.
+_PRIME = np.uint64(4294967311)
+_MAX_HASH = np.uint64(0xFFFFFFFF)
+_SHINGLE_BASE = np.uint64(1000003)
+
+def shingle_hashes(text: str, size: int = SHINGLE_SIZE) -> np.ndarray:
+    """Distinct 32-bit hashes of the text's overlapping size-word shingles."""
+    words = _TOKEN_RE.findall(text.lower())
+    if not words:
+        return np.zeros(0, dtype=np.uint64)
+    hashes = np.fromiter((zlib.crc32(word.encode("utf-8")) for word in words), dtype=np.uint64, count=len(words))
+    size = min(size, len(hashes))
+    count = len(hashes) - size + 1
+    combined = np.zeros(count, dtype=np.uint64)
+    for offset in range(size):
+        # uint64 arithmetic wraps around, which is fine for hashing.
+        combined = combined * _SHINGLE_BASE + hashes[offset:offset + count]
+    return np.unique(combined & _MAX_HASH)
+
+class MinHasher:
+    """MinHash signatures over num_perm seeded universal hash permutations."""
+
+    def __init__(self, num_perm: int = NUM_PERM, seed: int = 1):
+        rng = np.random.default_rng(seed)
+        self.num_perm = num_perm
+        self.a = rng.integers(1, 2 ** 31, num_perm, dtype=np.uint64)
+        self.b = rng.integers(0, 2 ** 31, num_perm, dtype=np.uint64)
+
+    def signature(self, shingles: np.ndarray) -> np.ndarray:
+        signature = np.full(self.num_perm, _MAX_HASH, dtype=np.uint64)
+        for start in range(0, len(shingles), _SIGNATURE_BLOCK):
+            block = shingles[start:start + _SIGNATURE_BLOCK, None]
+            signature = np.minimum(signature, ((block * self.a + self.b) % _PRIME).min(axis=0))
+        return signature
+
+def near_duplicate_clusters(texts: Sequence[str], threshold: float = DEDUP_THRESHOLD, num_perm: int = NUM_PERM, bands: int = LSH_BANDS, shingle_size: int = SHINGLE_SIZE) -> Tuple[List[int], List[float]]:
+    """
+    Group near-duplicate texts. Each text is shingled into word n-grams and
+    MinHashed; LSH banding (bands x num_perm/bands rows) buckets texts whose
+    signatures agree on a whole band, and only texts sharing a bucket are
+    compared, so the cost stays close to linear.
+
+    Clusters are formed greedily around leaders: texts are visited longest
+    first, each unassigned text becomes a leader, and its unassigned bucket
+    mates join it when their estimated Jaccard similarity to the leader
+    reaches threshold. Similarity is never chained through intermediate
+    texts, so every member is within threshold of its representative.
+
+    Returns, for every text, the index of its cluster's representative (the
+    longest text, the earliest on ties) and its estimated similarity to it.
+    """
+    hasher = MinHasher(num_perm)
+    signatures = np.stack([hasher.signature(shingle_hashes(text, shingle_size)) for text in texts]) if len(texts) else np.zeros((0, num_perm), dtype=np.uint64)
+    has_shingles = (signatures != _MAX_HASH).any(axis=1)
+    rows = num_perm // bands
+
+    buckets: Dict[Tuple[int, bytes], List[int]] = {}
+    text_buckets: List[List[List[int]]] = [[] for _ in texts]
+    for band in range(bands):
+        band_values = signatures[:, band * rows:(band + 1) * rows]
+        for index in np.flatnonzero(has_shingles):
+            bucket = buckets.setdefault((band, band_values[index].tobytes()), [])
+            bucket.append(int(index))
+            text_buckets[index].append(bucket)
+
+    representatives = list(range(len(texts)))
+    similarities = [1.0] * len(texts)
+    assigned = [False] * len(texts)
+    for leader in sorted(range(len(texts)), key=lambda index: (-len(texts[index]), index)):
+        if assigned[leader]:
+            continue
+        assigned[leader] = True
+        for bucket in text_buckets[leader]:
+            for member in bucket:
+                if assigned[member]:
+                    continue
+                similarity = float(np.mean(signatures[leader] == signatures[member]))
+                if similarity >= threshold:
+                    assigned[member] = True
+                    representatives[member] = leader
+                    similarities[member] = round(similarity, 3)
+            # Drop assigned texts so later leaders do not rescan them.
+            bucket[:] = [member for member in bucket if not assigned[member]]
+    return representatives, similarities
@@ -0,0 +1,251 @@
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Optional, List, Dict, Iterable, Union
+
+from imap_tools import AND, OR, U
+
+from utils.cache import DATA_DIR
+from utils.email_utils import (
+    DEFAULT_FOLDERS, IMAP_HOST, MAX_IMAP_CONNECTIONS, IMAPConnectionPool, MessageHeader, classify_emails,
+    date_to_epoch, dedupe_by_message_id, fetch_headers, fetch_message_bodies, get_email_credentials, get_official_email_id, resolve_folders,
+    run_on_folders
+)
+from utils.email_threads import build_threads, message_key, thread_text
+
+EMAIL_STORE_PATH = DATA_DIR / "raw" / "email_store.sqlite"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS folders (
+    account TEXT NOT NULL,
+    folder TEXT NOT NULL,
+    uidvalidity INTEGER NOT NULL,
+    PRIMARY KEY (account, folder)
+);
+CREATE TABLE IF NOT EXISTS sync_state (
+    account TEXT NOT NULL,
+    folder TEXT NOT NULL,
+    query TEXT NOT NULL,
+    last_uid INTEGER NOT NULL,
+    synced_at REAL NOT NULL,
+    PRIMARY KEY (account, folder, query)
+);
+CREATE TABLE IF NOT EXISTS messages (
+    account TEXT NOT NULL,
+    folder TEXT NOT NULL,
+    uidvalidity INTEGER NOT NULL,
+    uid INTEGER NOT NULL,
+    message_id TEXT,
+    subject TEXT,
+    from_addr TEXT,
+    to_addrs TEXT,
+    cc_addrs TEXT,
+    date TEXT,
+    date_epoch REAL,
+    in_reply_to TEXT,
+    refs TEXT,
+    attachments TEXT,
+    body TEXT,
+    PRIMARY KEY (account, folder, uidvalidity, uid)
+);
+CREATE INDEX IF NOT EXISTS messages_from ON messages(from_addr);
+CREATE INDEX IF NOT EXISTS messages_message_id ON messages(message_id);
+"""
+
+class EmailStore:
+    """
+    Local SQLite copy of synced message headers.
+
+    Messages are keyed by (account, folder, UIDVALIDITY, UID). For every
+    account/folder/query the highest synced UID is recorded, so a later sync
+    only asks the server for UIDs above it. A UIDVALIDITY change invalidates
+    everything stored for that folder.
+    """
+
+    def __init__(self, path: Union[str, Path] = EMAIL_STORE_PATH):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.executescript(SCHEMA)
+        self._add_date_epoch()
+        self._conn.commit()
+
+    def _add_date_epoch(self):
+        """Add and backfill the UTC epoch column on stores created before it existed."""
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(messages)")]
+        if "date_epoch" not in columns:
+            self._conn.execute("ALTER TABLE messages ADD COLUMN date_epoch REAL")
+            rows = self._conn.execute("SELECT rowid, date FROM messages").fetchall()
+            self._conn.executemany("UPDATE messages SET date_epoch = ? WHERE rowid = ?", [(date_to_epoch(date), rowid) for rowid, date in rows])
+        self._conn.execute("CREATE INDEX IF NOT EXISTS messages_date_epoch ON messages(date_epoch)")
+
+    def check_uidvalidity(self, account: str, folder: str, uidvalidity: int):
+        """Record the folder's UIDVALIDITY, dropping stale messages and sync marks if it changed."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT uidvalidity FROM folders WHERE account = ? AND folder = ?", (account, folder)
+            ).fetchone()
+            if row is not None and row[0] == uidvalidity:
+                return
+            self._conn.execute("DELETE FROM messages WHERE account = ? AND folder = ?", (account, folder))
+            self._conn.execute("DELETE FROM sync_state WHERE account = ? AND folder = ?", (account, folder))
+            self._conn.execute(
+                "INSERT OR REPLACE INTO folders (account, folder, uidvalidity) VALUES (?, ?, ?)",
+                (account, folder, uidvalidity),
+            )
+            self._conn.commit()
+
+    def last_uid(self, account: str, folder: str, query: str) -> int:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT last_uid FROM sync_state WHERE account = ? AND folder = ? AND query = ?",
+                (account, folder, query),
+            ).fetchone()
+        return row[0] if row else 0
+
+    def add_messages(self, account: str, folder: str, uidvalidity: int, query: str, headers: List[MessageHeader], last_uid: int):
+        """Insert newly synced headers and advance the query's high-water mark in one transaction."""
+        rows = [(
+            account, folder, uidvalidity, int(header.uid), header.message_id, header.subject, header.from_,
+            json.dumps(header.to), json.dumps(header.cc), header.date, date_to_epoch(header.date), header.in_reply_to,
+            json.dumps(header.references), json.dumps(header.attachments),
+        ) for header in headers]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO messages (account, folder, uidvalidity, uid, message_id, subject, from_addr, "
+                "to_addrs, cc_addrs, date, date_epoch, in_reply_to, refs, attachments) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sync_state (account, folder, query, last_uid, synced_at) VALUES (?, ?, ?, ?, ?)",
+                (account, folder, query, last_uid, time.time()),
+            )
+            self._conn.commit()
+
+    def query(self, user_email: str, account: Optional[str] = None, folders: Optional[List[str]] = None) -> List[MessageHeader]:
+        """All stored messages sent by or addressed to user_email, oldest first."""
+        user_email = user_email.lower()
+        sql = (
+            "SELECT uid, subject, from_addr, to_addrs, cc_addrs, date, message_id, in_reply_to, refs, attachments, folder "
+            "FROM messages WHERE (from_addr = ? OR instr(to_addrs, ?) > 0 OR instr(cc_addrs, ?) > 0)"
+        )
+        params = [user_email, json.dumps(user_email), json.dumps(user_email)]
+        if account is not None:
+            sql += " AND account = ?"
+            params.append(account)
+        if folders:
+            sql += f" AND folder IN ({', '.join('?' for _ in folders)})"
+            params.extend(folders)
+        # ISO strings with different UTC offsets do not sort chronologically; the epoch column does.
+        sql += " ORDER BY date_epoch, uid"
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [MessageHeader(
+            uid=str(row[0]),
+            subject=row[1] or "",
+            from_=row[2] or "",
+            to=tuple(json.loads(row[3] or "[]")),
+            cc=tuple(json.loads(row[4] or "[]")),
+            date=row[5] or "",
+            message_id=row[6] or "",
+            in_reply_to=row[7] or "",
+            references=tuple(json.loads(row[8] or "[]")),
+            attachments=json.loads(row[9] or "[]"),
+            folder=row[10],
+        ) for row in rows]
+
+    def get_bodies(self, headers: Iterable[MessageHeader], account: Optional[str] = None) -> Dict[str, Optional[str]]:
+        """Stored bodies for the given messages keyed by message_key(); None where not yet downloaded."""
+        bodies = {}
+        with self._lock:
+            for header in headers:
+                sql = "SELECT body FROM messages WHERE folder = ? AND uid = ?"
+                params = [header.folder, int(header.uid)]
+                if account is not None:
+                    sql += " AND account = ?"
+                    params.append(account)
+                row = self._conn.execute(sql, params).fetchone()
+                bodies[message_key(header)] = row[0] if row else None
+        return bodies
+
+    def set_body(self, account: str, folder: str, uid: str, body: str):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE messages SET body = ? WHERE account = ? AND folder = ? AND uid = ?", (body, account, folder, int(uid))
+            )
+            self._conn.commit()
+
+def sync_folder(mailbox, store: EmailStore, account: str, folder: str, user_email: str) -> int:
+    """
+    Pull headers for messages from/to user_email that arrived in `folder`
+    since the last sync. Returns the number of new messages stored.
+    """
+    mailbox.folder.set(folder)
+    uidvalidity = mailbox.folder.status(folder, ["UIDVALIDITY"])["UIDVALIDITY"]
+    store.check_uidvalidity(account, folder, uidvalidity)
+    query = user_email.lower()
+    last_uid = store.last_uid(account, folder, query)
+    criteria = OR(from_=user_email, to=user_email)
+    if last_uid:
+        criteria = AND(criteria, uid=U(last_uid + 1, "*"))
+    # "N:*" always matches the highest UID, even when it is below N.
+    uids = [uid for uid in mailbox.uids(criteria) if int(uid) > last_uid]
+    headers = fetch_headers(mailbox, uids)
+    for header in headers:
+        header.folder = folder
+    new_last_uid = max([int(uid) for uid in uids], default=last_uid)
+    store.add_messages(account, folder, uidvalidity, query, headers, new_last_uid)
+    return len(headers)
+
+def fetch_missing_bodies(pool: IMAPConnectionPool, store: EmailStore, account: str, headers: List[MessageHeader]):
+    """Download, once, the bodies of the given messages that the store does not hold yet."""
+    bodies = store.get_bodies(headers, account)
+    missing: Dict[str, List[str]] = {}
+    for header in headers:
+        if bodies.get(message_key(header)) is None:
+            missing.setdefault(header.folder, []).append(header.uid)
+
+    def download(mailbox, folder):
+        mailbox.folder.set(folder)
+        # Only each message's text part is transferred, never its attachments.
+        for uid, body in fetch_message_bodies(mailbox, missing[folder]).items():
+            store.set_body(account, folder, uid, body)
+
+    if missing:
+        run_on_folders(pool, list(missing), download)
+
+def get_stored_relevant_emails(person_name, mapping, company_domain, store: Optional[EmailStore] = None, sync: bool = True, folders: Optional[List[str]] = None, max_connections: int = MAX_IMAP_CONNECTIONS, max_threads: int = 20):
+    """
+    Like get_all_relevant_emails, but answered from the local store.
+    With sync=True, each folder is synced concurrently over pooled
+    connections, fetching only UIDs newer than the stored marks. Messages
+    are also grouped into threads; bodies are downloaded lazily, and only
+    for the max_threads largest threads, whose unquoted text is attached.
+    """
+    user_email = get_official_email_id(person_name, mapping)
+    if not user_email:
+        raise ValueError("Official email not found for this person.")
+    store = store or EmailStore()
+    if sync:
+        account, password = get_email_credentials()
+        with IMAPConnectionPool(IMAP_HOST, account, password, max_connections) as pool:
+            with pool.connection() as mailbox:
+                folder_names = resolve_folders(mailbox, folders or DEFAULT_FOLDERS)
+            run_on_folders(pool, folder_names, lambda mailbox, folder: sync_folder(mailbox, store, account, folder, user_email))
+            headers = dedupe_by_message_id(store.query(user_email, account=account, folders=folder_names))
+            threads = build_threads(headers)[:max_threads]
+            fetch_missing_bodies(pool, store, account, [message for thread in threads for message in thread.messages])
+    else:
+        account = None
+        folder_names = folders if folders and not any(folder.startswith("\\") for folder in folders) else None
+        headers = dedupe_by_message_id(store.query(user_email, folders=folder_names))
+        threads = build_threads(headers)[:max_threads]
+    bodies = store.get_bodies([message for thread in threads for message in thread.messages], account)
+    for thread in threads:
+        thread.text = thread_text(thread, {key: body for key, body in bodies.items() if body})
+    result = classify_emails(headers, user_email, company_domain)
+    result["threads"] = threads
+    return result
@@ -0,0 +1,138 @@
+import re
+from dataclasses import dataclass, field
+from typing import Optional, List, Dict, Iterable
+
+from utils.email_utils import MessageHeader, date_to_epoch
+
+_SUBJECT_PREFIX_RE = re.compile(r"^\s*((re|fw|fwd|aw|sv)(\[\d+\])?\s*:\s*)+", re.IGNORECASE)
+_ATTRIBUTION_RE = re.compile(r"^\s*(On .+wrote:|-{2,}\s*Original Message\s*-{2,}|_{10,})\s*$", re.IGNORECASE)
+# Outlook-style quote headers: a "From:" line is only an attribution when the
+# next line continues the header block, so "From: ..." in prose is kept.
+_QUOTE_FROM_RE = re.compile(r"^\s*From:\s.+$", re.IGNORECASE)
+_QUOTE_FIELD_RE = re.compile(r"^\s*(Sent|Date|To):\s", re.IGNORECASE)
+
+@dataclass
+class EmailThread:
+    """One conversation, with its messages in date order."""
+    thread_id: str
+    subject: str
+    messages: List[MessageHeader] = field(default_factory=list)
+    text: str = ""
+
+    @property
+    def participants(self) -> List[str]:
+        seen = []
+        for message in self.messages:
+            for address in (message.from_,) + message.to + message.cc:
+                if address and address not in seen:
+                    seen.append(address)
+        return seen
+
+class _Container:
+    __slots__ = ("message", "parent", "children")
+
+    def __init__(self):
+        self.message = None
+        self.parent = None
+        self.children = []
+
+def message_key(header: MessageHeader) -> str:
+    return header.message_id or f"{header.folder}:{header.uid}"
+
+def normalize_subject(subject: str) -> str:
+    return _SUBJECT_PREFIX_RE.sub("", subject or "").strip().lower()
+
+def _is_ancestor(candidate: _Container, node: _Container) -> bool:
+    while node is not None:
+        if node is candidate:
+            return True
+        node = node.parent
+    return False
+
+def build_threads(headers: Iterable[MessageHeader]) -> List[EmailThread]:
+    """
+    Group messages into threads with a simplified JWZ algorithm: one id table
+    links each message to its References/In-Reply-To chain, roots are taken
+    from the resulting forest, and roots sharing a normalized subject are
+    merged. Work is linear in the number of messages and references.
+    """
+    containers: Dict[str, _Container] = {}
+
+    def container_for(message_id: str) -> _Container:
+        if message_id not in containers:
+            containers[message_id] = _Container()
+        return containers[message_id]
+
+    for index, header in enumerate(headers):
+        message_id = header.message_id or f"<local-{header.folder}-{header.uid}-{index}>"
+        container = container_for(message_id)
+        if container.message is not None:
+            continue
+        container.message = header
+        chain = list(header.references)
+        if header.in_reply_to and (not chain or chain[-1] != header.in_reply_to):
+            chain.append(header.in_reply_to)
+        parent = None
+        for reference in chain:
+            node = container_for(reference)
+            if parent is not None and node.parent is None and not _is_ancestor(node, parent):
+                node.parent = parent
+                parent.children.append(node)
+            parent = node
+        if parent is not None and parent is not container and container.parent is None and not _is_ancestor(container, parent):
+            container.parent = parent
+            parent.children.append(container)
+
+    threads_by_subject: Dict[str, EmailThread] = {}
+    threads = []
+    for root_id, root in containers.items():
+        if root.parent is not None:
+            continue
+        messages = []
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            if node.message is not None:
+                messages.append(node.message)
+            stack.extend(node.children)
+        if not messages:
+            continue
+        subject = messages[0].subject
+        key = normalize_subject(subject)
+        thread = threads_by_subject.get(key) if key else None
+        if thread is None:
+            thread = EmailThread(thread_id=root_id, subject=_SUBJECT_PREFIX_RE.sub("", subject).strip())
+            threads.append(thread)
+            if key:
+                threads_by_subject[key] = thread
+        thread.messages.extend(messages)
+    for thread in threads:
+        thread.messages.sort(key=lambda message: date_to_epoch(message.date))
+    threads.sort(key=lambda thread: len(thread.messages), reverse=True)
+    return threads
+
+def strip_quoted_text(body: str) -> str:
+    """Remove quoted replies: '>' lines and everything after a reply attribution."""
+    kept = []
+    lines = (body or "").splitlines()
+    for index, line in enumerate(lines):
+        if _ATTRIBUTION_RE.match(line):
+            break
+        if _QUOTE_FROM_RE.match(line) and index + 1 < len(lines) and _QUOTE_FIELD_RE.match(lines[index + 1]):
+            break
+        if line.lstrip().startswith(">"):
+            continue
+        kept.append(line)
+    return "\n".join(kept).strip()
+
+def thread_text(thread: EmailThread, bodies: Dict[str, str]) -> str:
+    """
+    Concatenate the new (unquoted) text of each message in a thread so the
+    whole conversation is analysed once. bodies maps message_key() to raw bodies.
+    """
+    parts = [thread.subject]
+    for message in thread.messages:
+        text = strip_quoted_text(bodies.get(message_key(message), ""))
+        if text:
+            parts.append(f"{message.from_}: {text}")
+    return "\n\n".join(parts)
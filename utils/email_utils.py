@@ -1,11 +1,54 @@
+import binascii
 import os
+import queue
+import quopri
 import re
+import threading
+import email
+import email.policy
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from email.header import decode_header, make_header
+from email.utils import getaddresses, parsedate_to_datetime
+from itertools import takewhile
+from typing import Optional, List, Dict, Iterable, Tuple
 from dotenv import load_dotenv
-from imap_tools import MailBox, AND, OR
+from imap_tools import MailBox, OR
 import getpass
 
 load_dotenv()
 
+IMAP_HOST = os.getenv("IMAP_HOST", "imap.gmail.com")
+# Special-use flags (RFC 6154) are resolved to the server's folder names;
+# plain names such as Gmail labels are used as given.
+DEFAULT_FOLDERS = [name.strip() for name in os.getenv("IMAP_FOLDERS", "INBOX,\\Sent,\\All").split(",") if name.strip()]
+MAX_IMAP_CONNECTIONS = int(os.getenv("IMAP_MAX_CONNECTIONS", "4"))
+HEADER_FIELDS = "SUBJECT FROM TO CC DATE MESSAGE-ID IN-REPLY-TO REFERENCES"
+FETCH_BATCH_SIZE = 500
+
+_UID_RE = re.compile(rb"UID (\d+)")
+_BODYSTRUCTURE_RE = re.compile(rb"BODYSTRUCTURE (\(.*\))", re.DOTALL)
+_FILENAME_RE = re.compile(rb'"(?:FILENAME|NAME)\*?" "((?:[^"\\]|\\.)*)"', re.IGNORECASE)
+_SEXP_TOKEN_RE = re.compile(rb'\(|\)|"((?:[^"\\]|\\.)*)"|[^\s()"]+')
+_ESCAPE_RE = re.compile(rb"\\(.)")
+
+@dataclass
+class MessageHeader:
+    """Envelope of one message, fetched without its body or attachment payloads."""
+    uid: str
+    subject: str = ""
+    from_: str = ""
+    to: Tuple[str, ...] = ()
+    cc: Tuple[str, ...] = ()
+    date: str = ""
+    message_id: str = ""
+    in_reply_to: str = ""
+    references: Tuple[str, ...] = ()
+    attachments: List[str] = field(default_factory=list)
+    folder: str = "INBOX"
+
 def get_official_email_id(person_name: str, mapping: dict) -> str:
     """
     Fetch the official email ID for a person from a mapping.
@@ -21,29 +64,340 @@ def get_email_credentials():
     password = os.getenv('EMAIL_PASS') or getpass.getpass("Enter your app password (after 2FA): ")
     return email, password
 
-def fetch_company_emails(mailbox, user_email, company_domain):
+def date_to_epoch(value: str) -> float:
+    """UTC epoch seconds of a stored ISO date (naive dates are taken as UTC); 0.0 if it does not parse."""
+    try:
+        parsed = datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return 0.0
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+def _decode(value) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, bytes):
+        value = value.decode("utf-8", errors="replace")
+    try:
+        return str(make_header(decode_header(value)))
+    except Exception:
+        return value
+
+def _addresses(values: List[str]) -> Tuple[str, ...]:
+    return tuple(address.lower() for _, address in getaddresses(values) if address)
+
+def _attachment_names(bodystructure: bytes) -> List[str]:
+    """Filenames of the parts in a BODYSTRUCTURE that carry a name or filename."""
+    names = []
+    for match in _FILENAME_RE.findall(bodystructure):
+        name = _decode(match.replace(b'\\"', b'"'))
+        if name and name not in names:
+            names.append(name)
+    return names
+
+def _fetch_literals(data: list) -> List[Tuple[bytes, bytes]]:
+    """
+    (meta, literal) pairs of an imaplib FETCH response with one literal per
+    message. Servers may put the UID before or after the literal, so the
+    non-literal chunks that follow it are added to its meta.
     """
-    Fetch emails sent from company emails to user and from user to company emails.
+    pairs = []
+    for item in data:
+        if isinstance(item, tuple):
+            pairs.append([item[0], item[1]])
+        elif isinstance(item, bytes) and pairs:
+            pairs[-1][0] += item
+    return [(meta, literal) for meta, literal in pairs]
+
+def parse_header_response(data: list) -> List[MessageHeader]:
     """
-    # From company to user
-    from_company = list(mailbox.fetch(AND(from_=f"@{company_domain}", to=user_email)))
-    # From user to company
-    to_company = list(mailbox.fetch(AND(from_=user_email, to=f"@{company_domain}")))
-    return from_company, to_company
+    Turn an imaplib UID FETCH (BODYSTRUCTURE BODY.PEEK[HEADER.FIELDS ...])
+    response into MessageHeader objects. Servers may order the items either
+    way, so the UID and BODYSTRUCTURE are read from whichever non-literal
+    chunk holds them.
+    """
+    headers = [_build_header(meta, raw_header) for meta, raw_header in _fetch_literals(data)]
+    return [header for header in headers if header is not None]
+
+def _build_header(meta: bytes, raw_header: bytes) -> Optional[MessageHeader]:
+    uid_match = _UID_RE.search(meta)
+    if not uid_match:
+        return None
+    structure_match = _BODYSTRUCTURE_RE.search(meta)
+    message = email.message_from_bytes(raw_header, policy=email.policy.compat32)
+    date = ""
+    if message.get("Date"):
+        try:
+            date = parsedate_to_datetime(message["Date"]).isoformat()
+        except (TypeError, ValueError):
+            date = message["Date"]
+    from_addresses = _addresses(message.get_all("From", []))
+    return MessageHeader(
+        uid=uid_match.group(1).decode(),
+        subject=_decode(message.get("Subject")),
+        from_=from_addresses[0] if from_addresses else "",
+        to=_addresses(message.get_all("To", [])),
+        cc=_addresses(message.get_all("Cc", [])),
+        date=date,
+        message_id=(message.get("Message-ID") or "").strip(),
+        in_reply_to=(message.get("In-Reply-To") or "").strip(),
+        references=tuple((message.get("References") or "").split()),
+        attachments=_attachment_names(structure_match.group(1)) if structure_match else [],
+    )
 
-def fetch_emails_with_attachments(mailbox, user_email):
+def fetch_headers(mailbox, uids: Iterable[str], batch_size: int = FETCH_BATCH_SIZE) -> List[MessageHeader]:
     """
-    Fetch all emails to/from user with attachments.
+    Bulk-fetch headers and BODYSTRUCTURE for the given UIDs. BODY.PEEK keeps
+    messages unread and no body or attachment bytes are transferred.
+    """
+    uids = list(uids)
+    headers = []
+    for start in range(0, len(uids), batch_size):
+        batch = ",".join(uids[start:start + batch_size])
+        status, data = mailbox.client.uid("FETCH", batch, f"(UID BODYSTRUCTURE BODY.PEEK[HEADER.FIELDS ({HEADER_FIELDS})])")
+        if status != "OK":
+            raise RuntimeError(f"IMAP header fetch failed: {status}")
+        headers.extend(parse_header_response(data))
+    return headers
+
+def _parse_list(data: bytes, start: int = 0) -> Optional[list]:
+    """
+    The first parenthesized IMAP list in data at or after start, as nested
+    lists of bytes (None for NIL). Quoted strings are unescaped.
+    """
+    stack = []
+    for match in _SEXP_TOKEN_RE.finditer(data, start):
+        token = match.group(0)
+        if token == b"(":
+            stack.append([])
+        elif token == b")":
+            if not stack:
+                return None
+            done = stack.pop()
+            if not stack:
+                return done
+            stack[-1].append(done)
+        elif stack:
+            if match.group(1) is not None:
+                stack[-1].append(_ESCAPE_RE.sub(rb"\1", match.group(1)))
+            else:
+                stack[-1].append(None if token.upper() == b"NIL" else token)
+    return None
+
+def _inline_text_parts(structure: list, section: Tuple[int, ...] = ()) -> Iterable[Tuple[str, bytes, Optional[bytes], Optional[str]]]:
+    """
+    (section, subtype, transfer encoding, charset) of every text part of a
+    parsed BODYSTRUCTURE that is not marked as an attachment, in order.
+    Attached messages (message/rfc822) are not descended into.
+    """
+    if structure and isinstance(structure[0], list):
+        children = takewhile(lambda part: isinstance(part, list), structure)
+        for index, part in enumerate(children):
+            yield from _inline_text_parts(part, section + (index + 1,))
+        return
+    if len(structure) < 7 or not isinstance(structure[0], bytes) or structure[0].lower() != b"text":
+        return
+    # Text parts carry a line count, so the disposition is the tenth field.
+    disposition = structure[9] if len(structure) > 9 else None
+    if isinstance(disposition, list) and isinstance(disposition[0], bytes) and disposition[0].lower() == b"attachment":
+        return
+    params = structure[2] if isinstance(structure[2], list) else []
+    charset = next((value.decode("ascii", errors="replace") for key, value in zip(params[::2], params[1::2])
+                    if isinstance(key, bytes) and key.lower() == b"charset" and value), None)
+    # A single-part message still has part number 1.
+    yield ".".join(str(number) for number in section or (1,)), (structure[1] or b"").lower(), structure[5], charset
+
+def _body_part(bodystructure: list) -> Optional[Tuple[str, Optional[bytes], Optional[str]]]:
+    """(section, encoding, charset) of the part to read: plain text first, else HTML."""
+    parts = list(_inline_text_parts(bodystructure))
+    for subtype in (b"plain", b"html"):
+        for section, part_subtype, encoding, charset in parts:
+            if part_subtype == subtype:
+                return section, encoding, charset
+    return None
+
+def _decode_part(payload: bytes, encoding: Optional[bytes], charset: Optional[str]) -> str:
+    encoding = (encoding or b"").lower()
+    try:
+        if encoding == b"base64":
+            payload = binascii.a2b_base64(payload)
+        elif encoding == b"quoted-printable":
+            payload = quopri.decodestring(payload)
+    except (binascii.Error, ValueError):
+        pass
+    try:
+        return payload.decode(charset or "utf-8", errors="replace")
+    except LookupError:
+        return payload.decode("utf-8", errors="replace")
+
+def fetch_message_bodies(mailbox, uids: Iterable[str], batch_size: int = FETCH_BATCH_SIZE) -> Dict[str, str]:
     """
-    emails_with_attachments = []
-    for msg in mailbox.fetch(OR(from_=user_email, to=user_email)):
-        if msg.attachments:
-            emails_with_attachments.append(msg)
-    return emails_with_attachments
+    Download the readable text of the given messages, keyed by UID. The
+    BODYSTRUCTURE is fetched first, and then only the first inline
+    text/plain part (text/html when there is none) of each message, so
+    attachment payloads are never transferred. BODY.PEEK keeps messages
+    unread. Messages without a text part map to "".
+    """
+    uids = list(uids)
+    parts = {}
+    for start in range(0, len(uids), batch_size):
+        batch = ",".join(uids[start:start + batch_size])
+        status, data = mailbox.client.uid("FETCH", batch, "(UID BODYSTRUCTURE)")
+        if status != "OK":
+            raise RuntimeError(f"IMAP BODYSTRUCTURE fetch failed: {status}")
+        for item in data:
+            meta = b"".join(item) if isinstance(item, tuple) else item
+            uid_match = _UID_RE.search(meta or b"")
+            position = (meta or b"").find(b"BODYSTRUCTURE")
+            if uid_match and position >= 0:
+                structure = _parse_list(meta, position)
+                parts[uid_match.group(1).decode()] = _body_part(structure) if structure else None
+
+    bodies = {uid: "" for uid in parts}
+    by_section: Dict[str, List[str]] = {}
+    for uid, part in parts.items():
+        if part is not None:
+            by_section.setdefault(part[0], []).append(uid)
+    for section, section_uids in by_section.items():
+        for start in range(0, len(section_uids), batch_size):
+            batch = ",".join(section_uids[start:start + batch_size])
+            status, data = mailbox.client.uid("FETCH", batch, f"(UID BODY.PEEK[{section}])")
+            if status != "OK":
+                raise RuntimeError(f"IMAP body fetch failed: {status}")
+            for meta, payload in _fetch_literals(data):
+                uid_match = _UID_RE.search(meta)
+                if uid_match and uid_match.group(1).decode() in parts:
+                    uid = uid_match.group(1).decode()
+                    _, encoding, charset = parts[uid]
+                    bodies[uid] = _decode_part(payload, encoding, charset)
+    return bodies
+
+def classify_emails(headers: List[MessageHeader], user_email: str, company_domain: str) -> Dict[str, List[MessageHeader]]:
+    """
+    Split one pass of headers into the three views the email tool reports:
+    company mail to the user, user mail to the company, and mail with attachments.
+    """
+    user_email = user_email.lower()
+    domain = f"@{company_domain.lower()}"
+    from_company, to_company, with_attachments = [], [], []
+    for header in headers:
+        recipients = header.to + header.cc
+        if header.from_.endswith(domain) and user_email in header.to:
+            from_company.append(header)
+        if header.from_ == user_email and any(address.endswith(domain) for address in header.to):
+            to_company.append(header)
+        if header.attachments and (header.from_ == user_email or user_email in recipients):
+            with_attachments.append(header)
+    return {
+        "from_company": from_company,
+        "to_company": to_company,
+        "with_attachments": with_attachments
+    }
+
+class IMAPConnectionPool:
+    """
+    Bounded pool of logged-in MailBox connections shared by worker threads.
+    Connections are opened lazily up to max_connections and reused; one that
+    raises while checked out is discarded rather than returned to the pool.
+    """
+
+    def __init__(self, host: str, username: str, password: str, max_connections: int = MAX_IMAP_CONNECTIONS):
+        self.host = host
+        self.username = username
+        self.password = password
+        self.max_connections = max(1, max_connections)
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(self.max_connections)
+
+    @contextmanager
+    def connection(self):
+        self._slots.acquire()
+        try:
+            try:
+                mailbox = self._idle.get_nowait()
+            except queue.Empty:
+                mailbox = MailBox(self.host).login(self.username, self.password)
+            try:
+                yield mailbox
+            except Exception:
+                _logout_quietly(mailbox)
+                raise
+            self._idle.put(mailbox)
+        finally:
+            self._slots.release()
+
+    def close(self):
+        while True:
+            try:
+                _logout_quietly(self._idle.get_nowait())
+            except queue.Empty:
+                break
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def _logout_quietly(mailbox):
+    try:
+        mailbox.logout()
+    except Exception:
+        pass
+
+def resolve_folders(mailbox, folders: Iterable[str]) -> List[str]:
+    """
+    Map special-use flags such as \\Sent or \\All to this server's folder
+    names. Unknown flags are dropped; plain folder names pass through.
+    """
+    listing = mailbox.folder.list()
+    resolved = []
+    for folder in folders:
+        if folder.startswith("\\"):
+            matches = [info.name for info in listing if folder.lower() in (flag.lower() for flag in info.flags)]
+        else:
+            matches = [folder]
+        for name in matches:
+            if name not in resolved:
+                resolved.append(name)
+    return resolved
+
+def dedupe_by_message_id(headers: Iterable[MessageHeader]) -> List[MessageHeader]:
+    """Drop copies of the same message found in several folders, keeping the first."""
+    seen = set()
+    unique = []
+    for header in headers:
+        key = header.message_id or (header.folder, header.uid)
+        if key in seen:
+            continue
+        seen.add(key)
+        unique.append(header)
+    return unique
+
+def fetch_folder_headers(mailbox, folder: str, user_email: str) -> List[MessageHeader]:
+    mailbox.folder.set(folder)
+    uids = mailbox.uids(OR(from_=user_email, to=user_email))
+    headers = fetch_headers(mailbox, uids)
+    for header in headers:
+        header.folder = folder
+    return headers
+
+def run_on_folders(pool: IMAPConnectionPool, folders: List[str], task) -> list:
+    """Run task(mailbox, folder) for each folder concurrently, one pooled connection per call."""
+    def run(folder):
+        with pool.connection() as mailbox:
+            return task(mailbox, folder)
+    with ThreadPoolExecutor(max_workers=min(pool.max_connections, max(1, len(folders)))) as executor:
+        return list(executor.map(run, folders))
 
-def get_all_relevant_emails(person_name, mapping, company_domain):
+def get_all_relevant_emails(person_name, mapping, company_domain, folders: Optional[List[str]] = None, max_connections: int = MAX_IMAP_CONNECTIONS):
     """
     Main function to get all relevant emails as per requirements.
+    Each folder gets a single UID search covering every criterion, followed
+    by a headers/BODYSTRUCTURE-only fetch; folders are read concurrently over
+    pooled connections and merged by Message-ID. Bodies are left for
+    fetch_message_bodies.
     """
     user_email = get_official_email_id(person_name, mapping)
     if not user_email:
@@ -51,11 +405,9 @@ def get_all_relevant_emails(person_name, mapping, company_domain):
 
     email, password = get_email_credentials()
 
-    with MailBox('imap.gmail.com').login(email, password, 'INBOX') as mailbox:
-        from_company, to_company = fetch_company_emails(mailbox, user_email, company_domain)
-        attachments = fetch_emails_with_attachments(mailbox, user_email)
-        return {
-            "from_company": from_company,
-            "to_company": to_company,
-            "with_attachments": attachments
-        } 
+    with IMAPConnectionPool(IMAP_HOST, email, password, max_connections) as pool:
+        with pool.connection() as mailbox:
+            folder_names = resolve_folders(mailbox, folders or DEFAULT_FOLDERS)
+        per_folder = run_on_folders(pool, folder_names, lambda mailbox, folder: fetch_folder_headers(mailbox, folder, user_email))
+    headers = dedupe_by_message_id(header for headers in per_folder for header in headers)
+    return classify_emails(headers, user_email, company_domain)
@@ -0,0 +1,128 @@
+import re
+import unicodedata
+from collections import Counter
+from typing import Optional, List, Dict, Sequence
+
+import numpy as np
+
+_POSSESSIVE_RE = re.compile(r"['’]s$")
+_EDGE_PUNCT = "\"'’“”()[]{}<>.,;:!?-–— \t\n"
+
+def normalize_entity(text: str) -> str:
+    """Case-folded, whitespace-collapsed form used to merge entity mentions."""
+    text = unicodedata.normalize("NFKC", text)
+    text = " ".join(text.split()).strip(_EDGE_PUNCT)
+    text = _POSSESSIVE_RE.sub("", text)
+    if text.lower().startswith("the "):
+        text = text[4:]
+    return text.casefold()
+
+class EntityIndex:
+    """
+    Deduplicated entities of a handover with their mentions.
+
+    Each distinct (normalized text, label) pair is stored once. Its mentions
+    (document, sentence, source type) sit in flat int32/int8 arrays grouped
+    by entity, with offsets marking where each entity's run starts, so
+    "documents mentioning X" is one slice and per-label rankings are
+    vectorized over the count array.
+    """
+
+    def __init__(self, names: List[str], labels: List[str], display: List[str], offsets: np.ndarray, doc_ids: np.ndarray, sentences: np.ndarray, source_ids: np.ndarray, sources: List[str]):
+        self.names = names
+        self.labels = labels
+        self.display = display
+        self.offsets = offsets
+        self.doc_ids = doc_ids
+        self.sentences = sentences
+        self.source_ids = source_ids
+        self.sources = sources
+        self.counts = np.diff(offsets)
+        self._ids = {}
+        for entity_id, name in enumerate(names):
+            self._ids.setdefault(name, []).append(entity_id)
+
+    @classmethod
+    def from_insights(cls, insights: Sequence[Dict], sources: Optional[Sequence[str]] = None) -> "EntityIndex":
+        """
+        Build from NLPAnalyzerTool output. Entities are (text, label) or
+        (text, label, start_char, sentence) tuples; sources gives each
+        insight's source type (e.g. 'document', 'email').
+        """
+        keys, names, labels, surfaces = {}, [], [], []
+        source_codes = {}
+        entity_ids, doc_ids, sentences, source_ids = [], [], [], []
+        for doc_id, insight in enumerate(insights):
+            source = sources[doc_id] if sources is not None and doc_id < len(sources) else "unknown"
+            source_id = source_codes.setdefault(source, len(source_codes))
+            for entity in insight.get("entities", []):
+                name = normalize_entity(entity[0])
+                if not name:
+                    continue
+                key = (name, entity[1])
+                if key not in keys:
+                    keys[key] = len(names)
+                    names.append(name)
+                    labels.append(entity[1])
+                    surfaces.append(Counter())
+                surfaces[keys[key]][entity[0].strip()] += 1
+                entity_ids.append(keys[key])
+                doc_ids.append(doc_id)
+                sentences.append(entity[3] if len(entity) > 3 else -1)
+                source_ids.append(source_id)
+
+        entity_ids = np.array(entity_ids, dtype=np.int32)
+        order = np.argsort(entity_ids, kind="stable")
+        offsets = np.zeros(len(names) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(np.bincount(entity_ids, minlength=len(names)))
+        return cls(
+            names, labels,
+            [surface.most_common(1)[0][0] for surface in surfaces],
+            offsets,
+            np.array(doc_ids, dtype=np.int32)[order],
+            np.array(sentences, dtype=np.int32)[order],
+            np.array(source_ids, dtype=np.int8)[order],
+            list(source_codes),
+        )
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def lookup(self, text: str, label: Optional[str] = None) -> List[int]:
+        """Ids of the entities matching text (and label, if given)."""
+        return [entity_id for entity_id in self._ids.get(normalize_entity(text), []) if label is None or self.labels[entity_id] == label]
+
+    def mentions(self, entity_id: int) -> List[Dict]:
+        """Every mention of one entity as {'document', 'sentence', 'source'}."""
+        start, end = self.offsets[entity_id], self.offsets[entity_id + 1]
+        return [
+            {"document": int(doc_id), "sentence": int(sentence), "source": self.sources[source_id]}
+            for doc_id, sentence, source_id in zip(self.doc_ids[start:end], self.sentences[start:end], self.source_ids[start:end])
+        ]
+
+    def documents_mentioning(self, text: str, label: Optional[str] = None) -> List[int]:
+        """Indices of the documents that mention text, in document order."""
+        runs = [self.doc_ids[self.offsets[entity_id]:self.offsets[entity_id + 1]] for entity_id in self.lookup(text, label)]
+        return np.unique(np.concatenate(runs)).tolist() if runs else []
+
+    def top(self, label: Optional[str] = None, k: int = 10) -> List[Dict]:
+        """The k most mentioned entities, optionally of one label (e.g. 'ORG')."""
+        candidates = np.arange(len(self.names))
+        if label is not None:
+            candidates = candidates[np.array(self.labels, dtype=object) == label]
+        ranked = candidates[np.argsort(-self.counts[candidates], kind="stable")[:k]]
+        return [self.describe(int(entity_id)) for entity_id in ranked]
+
+    def describe(self, entity_id: int) -> Dict:
+        start, end = self.offsets[entity_id], self.offsets[entity_id + 1]
+        return {
+            "text": self.display[entity_id],
+            "label": self.labels[entity_id],
+            "count": int(self.counts[entity_id]),
+            "documents": np.unique(self.doc_ids[start:end]).tolist(),
+            "sources": sorted({self.sources[source_id] for source_id in np.unique(self.source_ids[start:end])}),
+        }
+
+    def to_dict(self) -> List[Dict]:
+        """One entry per distinct entity, most mentioned first."""
+        return self.top(k=len(self.names))
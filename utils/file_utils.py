@@ -1,5 +1,12 @@
+import codecs
+import multiprocessing
 import os
-from typing import List, Dict, Union
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import List, Dict, Union, Iterable, Iterator, Tuple, Optional
 from io import BytesIO
 
 from docx import Document
@@ -7,82 +14,471 @@ from PyPDF2 import PdfReader
 from openpyxl import load_workbook
 from pptx import Presentation
 
-def extract_text_from_docx(file_stream: BytesIO) -> str:
-    """Extract text from a DOCX file."""
+from utils.cache import ExtractionCache, get_extraction_cache
+from utils.upload_spool import UploadSpool, UploadTooLargeError, open_mapped
+
+# Bump when extraction output changes so cached text is not reused.
+EXTRACTOR_VERSION = "3"
+# Per-document text budget; parsing stops once it is reached (0 disables).
+MAX_EXTRACTED_CHARS = int(os.getenv("EXTRACT_MAX_CHARS", "5000000")) or None
+# Rows taken per worksheet (0 disables); larger sheets are sampled at an
+# even stride unless EXTRACT_SAMPLE_SHEETS=0, which keeps the first rows.
+MAX_SHEET_ROWS = int(os.getenv("EXTRACT_MAX_SHEET_ROWS", "100000")) or None
+SAMPLE_SHEET_ROWS = os.getenv("EXTRACT_SAMPLE_SHEETS", "1").lower() not in ("0", "false", "no")
+EXTRACTION_TIMEOUT = 120
+# Only used to render failures in process_uploaded_files' legacy output;
+# failures are otherwise reported in a separate error field.
+EXTRACTION_ERROR_PREFIX = "Error extracting text:"
+MAX_TASKS_PER_CHILD = 20
+TEXT_CHUNK_SIZE = 1024 * 1024
+XLSX_CHUNK_ROWS = 1000
+TEXT_SNIFF_SIZE = 4096
+# The ZIP central directory (which names every part) sits at the end of the archive.
+ZIP_DIRECTORY_SCAN = 1024 * 1024
+OOXML_MARKERS = (
+    (b"word/document", "docx"),
+    (b"xl/workbook", "xlsx"),
+    (b"ppt/presentation", "pptx"),
+)
+
+def iter_text_from_docx(file_stream: BytesIO) -> Iterator[str]:
+    """Yield the text of each paragraph of a DOCX file."""
     document = Document(file_stream)
-    full_text = []
     for para in document.paragraphs:
-        full_text.append(para.text)
-    return '\n'.join(full_text)
+        yield para.text
+
+def iter_text_from_pdf(file_stream: BytesIO, pages: Optional[Iterable[int]] = None) -> Iterator[str]:
+    """
+    Yield the text of each PDF page as it is parsed, skipping empty pages.
+    pages optionally restricts extraction to the given zero-based page indices.
+    """
+    reader = PdfReader(file_stream)
+    page_count = len(reader.pages)
+    for index in (pages if pages is not None else range(page_count)):
+        if 0 <= index < page_count:
+            text = reader.pages[index].extract_text()
+            if text:
+                yield text
+
+def iter_text_from_xlsx(file_stream: BytesIO, pages: Optional[Iterable[int]] = None, max_rows_per_sheet: Optional[int] = None, sample: bool = False, chunk_rows: int = XLSX_CHUNK_ROWS) -> Iterator[str]:
+    """
+    Stream an XLSX workbook as tab-separated chunks of at most chunk_rows
+    non-empty rows. The workbook is opened read-only, so rows are parsed
+    lazily from the sheet XML and memory stays flat regardless of size.
+    pages selects sheets. max_rows_per_sheet caps the rows taken per sheet;
+    with sample=True, rows are instead taken at an even stride across a
+    sheet whose declared size exceeds the cap.
+    """
+    wb = load_workbook(filename=file_stream, read_only=True, data_only=True)
+    try:
+        sheets = wb.worksheets
+        for index in (pages if pages is not None else range(len(sheets))):
+            if not 0 <= index < len(sheets):
+                continue
+            sheet = sheets[index]
+            stride = 1
+            if sample and max_rows_per_sheet and (sheet.max_row or 0) > max_rows_per_sheet:
+                stride = -(-sheet.max_row // max_rows_per_sheet)
+            rows = []
+            taken = 0
+            for row_number, row in enumerate(sheet.iter_rows(values_only=True)):
+                if row_number % stride:
+                    continue
+                row_text = [str(cell) for cell in row if cell is not None]
+                if not row_text:
+                    continue
+                rows.append('\t'.join(row_text))
+                taken += 1
+                if len(rows) >= chunk_rows:
+                    yield '\n'.join(rows)
+                    rows = []
+                if max_rows_per_sheet is not None and taken >= max_rows_per_sheet:
+                    break
+            if rows:
+                yield '\n'.join(rows)
+    finally:
+        wb.close()
+
+def iter_text_from_pptx(file_stream: BytesIO, pages: Optional[Iterable[int]] = None) -> Iterator[str]:
+    """Yield the text of each slide that has text-bearing shapes (pages selects slides)."""
+    prs = Presentation(file_stream)
+    slides = list(prs.slides)
+    for index in (pages if pages is not None else range(len(slides))):
+        if not 0 <= index < len(slides):
+            continue
+        texts = [shape.text for shape in slides[index].shapes if hasattr(shape, "text")]
+        if texts:
+            yield '\n'.join(texts)
+
+def iter_text_from_txt(file_stream: BytesIO, chunk_size: int = TEXT_CHUNK_SIZE) -> Iterator[str]:
+    """Decode a UTF-8 text file incrementally, yielding chunks that end on line boundaries."""
+    file_stream.seek(0)
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    carry = ''
+    while True:
+        block = file_stream.read(chunk_size)
+        text = carry + decoder.decode(block, final=not block)
+        if not block:
+            if text:
+                yield text
+            return
+        cut = text.rfind('\n') + 1
+        if cut:
+            yield text[:cut]
+        carry = text[cut:]
+
+def extract_text_from_docx(file_stream: BytesIO) -> str:
+    """Extract text from a DOCX file."""
+    return '\n'.join(iter_text_from_docx(file_stream))
 
 def extract_text_from_pdf(file_stream: BytesIO) -> str:
     """Extract text from a PDF file."""
-    reader = PdfReader(file_stream)
-    full_text = []
-    for page in reader.pages:
-        text = page.extract_text()
-        if text:
-            full_text.append(text)
-    return '\n'.join(full_text)
+    return '\n'.join(iter_text_from_pdf(file_stream))
 
 def extract_text_from_xlsx(file_stream: BytesIO) -> str:
     """Extract text from an XLSX file."""
-    wb = load_workbook(filename=file_stream, data_only=True)
-    full_text = []
-    for sheet in wb.worksheets:
-        for row in sheet.iter_rows(values_only=True):
-            row_text = [str(cell) for cell in row if cell is not None]
-            if row_text:
-                full_text.append('\t'.join(row_text))
-    return '\n'.join(full_text)
+    return '\n'.join(iter_text_from_xlsx(file_stream))
 
 def extract_text_from_pptx(file_stream: BytesIO) -> str:
     """Extract text from a PPTX file."""
-    prs = Presentation(file_stream)
-    full_text = []
-    for slide in prs.slides:
-        for shape in slide.shapes:
-            if hasattr(shape, "text"):
-                full_text.append(shape.text)
-    return '\n'.join(full_text)
+    return '\n'.join(iter_text_from_pptx(file_stream))
 
 def extract_text_from_txt(file_stream: BytesIO) -> str:
     """Extract text from a TXT file."""
     file_stream.seek(0)
     return file_stream.read().decode('utf-8')
 
-def extract_text_from_file(file_name: str, file_stream: BytesIO) -> str:
-    """Detect file type and extract text accordingly."""
-    ext = os.path.splitext(file_name)[1].lower()
-    if ext == '.pdf':
-        return extract_text_from_pdf(file_stream)
-    elif ext == '.docx':
-        return extract_text_from_docx(file_stream)
-    elif ext == '.xlsx':
-        return extract_text_from_xlsx(file_stream)
-    elif ext == '.pptx':
-        return extract_text_from_pptx(file_stream)
-    elif ext == '.txt':
-        return extract_text_from_txt(file_stream)
+EXTRACTORS = {
+    'pdf': extract_text_from_pdf,
+    'docx': extract_text_from_docx,
+    'xlsx': extract_text_from_xlsx,
+    'pptx': extract_text_from_pptx,
+    'txt': extract_text_from_txt,
+}
+
+def detect_file_type(data, file_name: Optional[str] = None) -> Optional[str]:
+    """
+    Identify a document from its leading bytes: '%PDF-' for PDF, and for
+    ZIP containers (Office Open XML) the part names listed in the central
+    directory at the end of the archive. Undetected content that decodes as
+    UTF-8 is treated as text; otherwise the file extension decides.
+    data may be bytes or a memoryview; only small slices of it are copied.
+    """
+    view = memoryview(data)
+    if view[:5] == b"%PDF-":
+        return "pdf"
+    if view[:4] == b"PK\x03\x04":
+        tail = view[-ZIP_DIRECTORY_SCAN:].tobytes()
+        for marker, file_type in OOXML_MARKERS:
+            if marker in tail:
+                return file_type
     else:
+        head = view[:TEXT_SNIFF_SIZE].tobytes()
+        if b"\x00" not in head:
+            try:
+                codecs.getincrementaldecoder('utf-8')().decode(head, final=False)
+                return "txt"
+            except UnicodeDecodeError:
+                pass
+    ext = os.path.splitext(file_name or "")[1].lower().lstrip(".")
+    return ext if ext in EXTRACTORS else None
+
+def _detect_stream_type(file_stream: BytesIO, file_name: Optional[str]) -> Optional[str]:
+    if hasattr(file_stream, "getbuffer"):
+        # BytesIO (and Streamlit's UploadedFile): inspect the buffer in place
+        # through a memoryview; the view is released so the stream stays writable.
+        with file_stream.getbuffer() as view:
+            return detect_file_type(view, file_name)
+    position = file_stream.tell()
+    file_stream.seek(0)
+    sample = file_stream.read(TEXT_SNIFF_SIZE)
+    file_stream.seek(0, os.SEEK_END)
+    size = file_stream.tell()
+    file_stream.seek(max(size - ZIP_DIRECTORY_SCAN, 0))
+    sample += file_stream.read()
+    file_stream.seek(position)
+    return detect_file_type(sample, file_name)
+
+def iter_text_from_file(file_name: str, file_stream: BytesIO, pages: Optional[Iterable[int]] = None, max_chars: Optional[int] = None, file_type: Optional[str] = None, max_rows_per_sheet: Optional[int] = None, sample: bool = False) -> Iterator[str]:
+    """
+    Stream a document's text one unit at a time: a page for PDF, a sheet for
+    XLSX, a slide for PPTX, a paragraph for DOCX and a block of lines for TXT.
+    pages selects zero-based pages/sheets/slides; once max_chars characters
+    have been yielded the last chunk is truncated and parsing stops.
+    max_rows_per_sheet and sample are passed to iter_text_from_xlsx.
+    The format is detected from the content unless file_type is given.
+    """
+    file_type = file_type or _detect_stream_type(file_stream, file_name)
+    file_stream.seek(0)
+    if file_type == 'pdf':
+        chunks = iter_text_from_pdf(file_stream, pages)
+    elif file_type == 'docx':
+        chunks = iter_text_from_docx(file_stream)
+    elif file_type == 'xlsx':
+        chunks = iter_text_from_xlsx(file_stream, pages, max_rows_per_sheet, sample)
+    elif file_type == 'pptx':
+        chunks = iter_text_from_pptx(file_stream, pages)
+    elif file_type == 'txt':
+        chunks = iter_text_from_txt(file_stream)
+    else:
+        return  # Unsupported file type
+    remaining = max_chars
+    for chunk in chunks:
+        if remaining is not None:
+            chunk = chunk[:remaining]
+            remaining -= len(chunk)
+        if chunk:
+            yield chunk
+        if remaining is not None and remaining <= 0:
+            break
+
+def extract_text_from_file(file_name: str, file_stream: BytesIO, file_type: Optional[str] = None, max_chars: Optional[int] = None, max_rows_per_sheet: Optional[int] = None, sample: bool = False) -> str:
+    """
+    Detect file type from the content and extract text accordingly.
+    With max_chars, the document is streamed through iter_text_from_file and
+    parsing stops once that many characters have been extracted;
+    max_rows_per_sheet and sample limit the rows read from each worksheet.
+    """
+    file_type = file_type or _detect_stream_type(file_stream, file_name)
+    extractor = EXTRACTORS.get(file_type)
+    if extractor is None:
         return ""  # Unsupported file type
+    if max_chars is not None or max_rows_per_sheet is not None:
+        # TXT chunks already end on line breaks; other units are joined by one.
+        separator = "" if file_type == "txt" else "\n"
+        chunks = iter_text_from_file(file_name, file_stream, max_chars=max_chars, file_type=file_type, max_rows_per_sheet=max_rows_per_sheet, sample=sample)
+        return separator.join(chunks)
+    file_stream.seek(0)
+    return extractor(file_stream)
+
+def _extract_worker(file_name: str, data: Union[bytes, Path], file_type: Optional[str] = None, max_chars: Optional[int] = MAX_EXTRACTED_CHARS, max_rows_per_sheet: Optional[int] = MAX_SHEET_ROWS, sample: bool = SAMPLE_SHEET_ROWS) -> Tuple[str, Optional[str]]:
+    """Returns (text, error); error is None on success."""
+    try:
+        if isinstance(data, Path):
+            # Spooled uploads are mapped from disk, so only the path crosses the
+            # process boundary and pages are loaded as the parser touches them.
+            with open_mapped(data) as file_stream:
+                return extract_text_from_file(file_name, file_stream, file_type, max_chars, max_rows_per_sheet, sample), None
+        # BytesIO over an immutable bytes object shares its buffer instead of copying.
+        return extract_text_from_file(file_name, BytesIO(data), file_type, max_chars, max_rows_per_sheet, sample), None
+    except Exception as e:
+        return "", str(e)
+
+class _TrackingContext:
+    """
+    Spawn multiprocessing context that keeps every worker Process the pool
+    starts (including recycled replacements), so they can be killed without
+    reaching into the executor's internals.
+    """
+
+    def __init__(self):
+        # max_tasks_per_child requires a non-fork start method.
+        self._context = multiprocessing.get_context("spawn")
+        self.processes = []
+
+    def __getattr__(self, name):
+        return getattr(self._context, name)
+
+    def Process(self, *args, **kwargs):
+        process = self._context.Process(*args, **kwargs)
+        self.processes.append(process)
+        return process
+
+    def terminate(self):
+        for process in self.processes:
+            if process.is_alive():
+                process.terminate()
+        self.processes.clear()
+
+def _new_pool(max_workers: int, max_tasks_per_child: int) -> Tuple[ProcessPoolExecutor, _TrackingContext]:
+    context = _TrackingContext()
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=context, max_tasks_per_child=max_tasks_per_child), context
+
+def _terminate_pool(executor: ProcessPoolExecutor, context: _TrackingContext):
+    # shutdown() cannot stop a task that is already running, so a hung or
+    # crashed pool's worker processes are terminated as well.
+    executor.shutdown(wait=False, cancel_futures=True)
+    context.terminate()
+
+def _iter_extract_pool(items: Iterable[Tuple[int, str, bytes, Optional[str]]], max_workers: Optional[int], timeout: float, max_tasks_per_child: int) -> Iterator[Tuple[int, str, str, Optional[str]]]:
+    """Pool engine behind iter_extract_texts_parallel; yields (key, filename, text, error)."""
+    pending = deque(items)
+    suspects = deque()
+    max_workers = max_workers or os.cpu_count() or 1
+    executor = context = None
+    in_flight = {}
+    try:
+        while pending or suspects or in_flight:
+            if executor is None:
+                executor, context = _new_pool(max_workers, max_tasks_per_child)
+            if suspects:
+                if not in_flight:
+                    item = suspects.popleft()
+                    future = executor.submit(_extract_worker, item[1], item[2], item[3])
+                    in_flight[future] = (item, time.monotonic() + timeout, True)
+            else:
+                while pending and len(in_flight) < max_workers:
+                    item = pending.popleft()
+                    future = executor.submit(_extract_worker, item[1], item[2], item[3])
+                    in_flight[future] = (item, time.monotonic() + timeout, False)
+
+            next_deadline = min(deadline for _, deadline, _ in in_flight.values())
+            done, _ = wait(in_flight, timeout=max(next_deadline - time.monotonic(), 0), return_when=FIRST_COMPLETED)
+            broken = False
+            for future in done:
+                item, _, isolated = in_flight.pop(future)
+                try:
+                    text, error = future.result()
+                except BrokenProcessPool:
+                    broken = True
+                    if isolated:
+                        yield item[0], item[1], "", "extraction process crashed"
+                    else:
+                        suspects.append(item)
+                    continue
+                except Exception as e:
+                    text, error = "", str(e)
+                yield item[0], item[1], text, error
+
+            now = time.monotonic()
+            for future, (item, deadline, isolated) in list(in_flight.items()):
+                if deadline <= now and not future.done():
+                    del in_flight[future]
+                    broken = True
+                    yield item[0], item[1], "", f"timed out after {timeout:g}s"
+
+            if broken:
+                # Work still running in the torn-down pool is requeued.
+                for item, _, isolated in in_flight.values():
+                    (suspects if isolated else pending).appendleft(item)
+                in_flight.clear()
+                _terminate_pool(executor, context)
+                executor = None
+    finally:
+        if executor is not None:
+            if in_flight:
+                _terminate_pool(executor, context)
+            else:
+                executor.shutdown(wait=True)
+
+def iter_extract_texts_parallel(files: Iterable[Tuple[str, bytes]], max_workers: Optional[int] = None, timeout: float = EXTRACTION_TIMEOUT, max_tasks_per_child: int = MAX_TASKS_PER_CHILD) -> Iterator[Dict[str, str]]:
+    """
+    Extract text from (filename, bytes) pairs on a process pool, yielding
+    {'filename', 'content', 'error'} dicts in completion order; error is None
+    on success and content empty on failure.
+
+    At most max_workers files are in flight, so each one's timeout runs from
+    when a worker picks it up. Workers are recycled after max_tasks_per_child
+    files. If a file hangs past its timeout, or a worker dies, the pool is torn
+    down and rebuilt; files that were in flight when a worker died are retried
+    one at a time so only the malformed file is reported as failed.
+    """
+    items = ((index, file_name, data, None) for index, (file_name, data) in enumerate(files))
+    for _, file_name, text, error in _iter_extract_pool(items, max_workers, timeout, max_tasks_per_child):
+        yield {"filename": file_name, "content": text, "error": error}
+
+def _extract_with_cache(items: List[Tuple[str, Union[bytes, Path], str, Optional[str]]], max_workers: Optional[int], timeout: float, use_cache: bool) -> Iterator[Tuple[int, str, Optional[str]]]:
+    """
+    Extract (filename, data, sha256, file_type) items, yielding
+    (index, text, error) in completion order. data is either the file's bytes or a spooled path.
+    Cache hits come first; every miss is extracted on the pool, with its
+    timeout and crash isolation, and only successful extractions are stored.
+    """
+    cache = get_extraction_cache(EXTRACTOR_VERSION) if use_cache else None
+    misses = []
+    for index, (file_name, data, digest, file_type) in enumerate(items):
+        text = cache.get(digest, file_type) if cache is not None else None
+        if text is not None:
+            yield index, text, None
+        else:
+            misses.append((index, file_name, data, file_type))
+
+    if not misses:
+        return
+    # Even a single file goes to the pool: a malformed upload must time out
+    # or crash in a worker, never in the Streamlit process. The pool is no
+    # larger than the number of files, since spawn starts every worker up front.
+    max_workers = min(max_workers or os.cpu_count() or 1, len(misses))
+    for index, _, text, error in _iter_extract_pool(misses, max_workers, timeout, MAX_TASKS_PER_CHILD):
+        if cache is not None and error is None:
+            _, _, digest, file_type = items[index]
+            cache.put(digest, file_type, text)
+        yield index, text, error
+
+def extract_texts_parallel(files: Iterable[Tuple[str, bytes]], max_workers: Optional[int] = None, timeout: float = EXTRACTION_TIMEOUT, use_cache: bool = True) -> List[Dict[str, str]]:
+    """
+    Extract a batch of files on worker processes into
+    {'filename', 'content', 'error'} dicts.
+    Files already in the extraction cache are answered from it, and successful
+    extractions are stored. Results are in completion order, cache hits first.
+    """
+    items = [
+        (file_name, data, ExtractionCache.digest(data), detect_file_type(data, file_name))
+        for file_name, data in files
+    ]
+    return [
+        {"filename": items[index][0], "content": text, "error": error}
+        for index, text, error in _extract_with_cache(items, max_workers, timeout, use_cache)
+    ]
+
+def ingest_uploads(uploaded_files: List, max_workers: Optional[int] = None, timeout: float = EXTRACTION_TIMEOUT, use_cache: bool = True, spool: Optional[UploadSpool] = None) -> List[Dict]:
+    """
+    Single ingestion pass over Streamlit uploads. Metadata, SHA-256, detected
+    type and extracted text are produced together, and records keep upload order:
+    {'filename', 'filetype', 'detected_type', 'size', 'sha256', 'content', 'status', 'error'}.
+
+    With a spool, each upload is streamed to disk under its content hash and
+    the extractors read it through mmap; uploads over the spool's size limits
+    are recorded as 'rejected'. Without one, each upload is read once through
+    a memoryview over its in-memory buffer.
+    """
+    records, items = [], []
+    for uploaded_file in uploaded_files:
+        record = {
+            "filename": uploaded_file.name,
+            "filetype": getattr(uploaded_file, "type", None),
+        }
+        records.append(record)
+        if spool is not None:
+            try:
+                spooled = spool.add(uploaded_file)
+            except UploadTooLargeError as e:
+                record.update(detected_type=None, size=getattr(uploaded_file, "size", None), sha256=None,
+                              content="", status="rejected", error=str(e))
+                continue
+            with open_mapped(spooled.path) as file_stream:
+                detected_type = _detect_stream_type(file_stream, spooled.name)
+            record.update(detected_type=detected_type, size=spooled.size, sha256=spooled.sha256)
+            data = spooled.path
+        else:
+            # BytesIO.getvalue() returns the upload's own bytes object, not a copy.
+            data = uploaded_file.getvalue()
+            view = memoryview(data)
+            record.update(
+                detected_type=detect_file_type(view, uploaded_file.name),
+                size=view.nbytes,
+                sha256=ExtractionCache.digest(view),
+            )
+        items.append((len(records) - 1, record["filename"], data, record["sha256"], record["detected_type"]))
+    for position, text, error in _extract_with_cache([item[1:] for item in items], max_workers, timeout, use_cache):
+        record = records[items[position][0]]
+        if error is not None:
+            record.update(content="", status="failed", error=error)
+        elif record["detected_type"] is None:
+            record.update(content="", status="unsupported", error="Unsupported file type")
+        else:
+            record.update(content=text, status="success", error=None)
+    return records
+
+def is_ingested(items: List) -> bool:
+    return all(isinstance(item, dict) and "sha256" in item for item in items)
 
 def process_uploaded_files(uploaded_files: List) -> List[Dict[str, Union[str, BytesIO]]]:
     """
     Process uploaded files and extract important text content for knowledge transfer.
     Returns a list of dicts: [{'filename': ..., 'content': ...}, ...]
     """
-    results = []
-    for uploaded_file in uploaded_files:
-        file_name = uploaded_file.name
-        file_stream = BytesIO(uploaded_file.getvalue())
-        try:
-            extracted_text = extract_text_from_file(file_name, file_stream)
-        except Exception as e:
-            extracted_text = f"Error extracting text: {str(e)}"
-        results.append({
-            "filename": file_name,
-            "content": extracted_text
-        })
-    return results
-
+    return [
+        {"filename": record["filename"], "content": record["content"] if record["status"] != "failed" else f"{EXTRACTION_ERROR_PREFIX} {record['error']}"}
+        for record in ingest_uploads(uploaded_files)
+    ]
@@ -0,0 +1,127 @@
+import base64
+import os
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Optional, List, Dict, Iterable, Union
+
+from utils.cache import DATA_DIR
+
+MIRROR_DIR = DATA_DIR / "raw" / "git_mirrors"
+
+# Fields are separated by \x1f and each commit record starts with \x1e, so
+# subjects containing tabs or punctuation parse unambiguously.
+LOG_FORMAT = "%x1e%H%x1f%an%x1f%ae%x1f%aI%x1f%cI%x1f%s"
+
+class GitError(Exception):
+    """Raised when a git command exits with a non-zero status."""
+
+def _run_git(args: List[str], git_dir: Optional[Path] = None, token: Optional[str] = None) -> str:
+    command = ["git"]
+    if git_dir is not None:
+        command.append(f"--git-dir={git_dir}")
+    command += args
+    env = dict(os.environ, GIT_TERMINAL_PROMPT="0")
+    if token:
+        # Pass the credential per invocation through GIT_CONFIG_* (git >= 2.31),
+        # so it neither lands in the mirror's config nor shows up on argv in ps.
+        basic = base64.b64encode(f"x-access-token:{token}".encode()).decode()
+        index = int(env.get("GIT_CONFIG_COUNT") or 0)
+        env[f"GIT_CONFIG_KEY_{index}"] = "http.extraHeader"
+        env[f"GIT_CONFIG_VALUE_{index}"] = f"Authorization: Basic {basic}"
+        env["GIT_CONFIG_COUNT"] = str(index + 1)
+    result = subprocess.run(command, capture_output=True, text=True, env=env, errors="replace")
+    if result.returncode != 0:
+        raise GitError(f"{' '.join(args[:2])} failed: {result.stderr.strip()}")
+    return result.stdout
+
+def mirror_repo(clone_url: str, dest: Union[str, Path], token: Optional[str] = None) -> Path:
+    """
+    Create a bare mirror of a repository, or refresh it if one already exists.
+    Only branches and tags are fetched; pull-request refs are skipped.
+    """
+    dest = Path(dest)
+    if dest.exists():
+        _run_git(["fetch", "--prune", "origin", "+refs/heads/*:refs/heads/*", "+refs/tags/*:refs/tags/*"], git_dir=dest, token=token)
+    else:
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        _run_git(["clone", "--bare", "--quiet", clone_url, str(dest)], token=token)
+    return dest
+
+def find_local_repos(clone_dir: Union[str, Path]) -> List[Path]:
+    """List the bare repositories (``*.git`` directories) stored under clone_dir."""
+    clone_dir = Path(clone_dir)
+    if not clone_dir.is_dir():
+        return []
+    return sorted(path for path in clone_dir.iterdir() if path.is_dir() and (path / "HEAD").exists())
+
+def git_log_commits(repo_path: Union[str, Path], repo_name: Optional[str] = None, since: Optional[str] = None, max_count: Optional[int] = None) -> List[Dict]:
+    """
+    Mine commit metadata and line stats from a local repository with one
+    `git log --numstat` call. Works on bare and non-bare repositories.
+    """
+    repo_path = Path(repo_path)
+    git_dir = repo_path / ".git" if (repo_path / ".git").is_dir() else repo_path
+    repo_name = repo_name or repo_path.name.removesuffix(".git")
+    args = ["log", "--branches", "--tags", "--date-order", f"--format={LOG_FORMAT}", "--numstat"]
+    if since:
+        args.append(f"--since={since}")
+    if max_count:
+        args.append(f"--max-count={max_count}")
+    try:
+        output = _run_git(args, git_dir=git_dir)
+    except GitError:
+        # Empty repositories have no refs to walk.
+        return []
+    commits = []
+    for record in output.split("\x1e")[1:]:
+        header, _, stats = record.partition("\n")
+        sha, author, email, author_date, commit_date, subject = header.split("\x1f", 5)
+        additions = deletions = files_changed = 0
+        for line in stats.splitlines():
+            parts = line.split("\t")
+            if len(parts) != 3:
+                continue
+            files_changed += 1
+            # Binary files report "-" instead of line counts.
+            additions += int(parts[0]) if parts[0].isdigit() else 0
+            deletions += int(parts[1]) if parts[1].isdigit() else 0
+        commits.append({
+            "sha": sha,
+            "repo": repo_name,
+            "author": author,
+            "author_email": email,
+            "date": author_date,
+            "committed_date": commit_date,
+            "message": subject,
+            "url": None,
+            "additions": additions,
+            "deletions": deletions,
+            "files_changed": files_changed,
+        })
+    return commits
+
+def mirror_user_repos(repos: Iterable[Dict], clone_dir: Union[str, Path] = MIRROR_DIR, token: Optional[str] = None, max_workers: int = 4) -> List[Path]:
+    """Mirror (or refresh) each GitHub repo dict in parallel; returns the local paths."""
+    clone_dir = Path(clone_dir)
+    targets = [
+        (repo["clone_url"], clone_dir / f"{repo['name']}.git")
+        for repo in repos
+        if isinstance(repo, dict) and repo.get("clone_url") and repo.get("name")
+    ]
+    if not targets:
+        return []
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(targets)))) as executor:
+        return list(executor.map(lambda target: mirror_repo(target[0], target[1], token), targets))
+
+def mine_repos(repo_paths: Iterable[Union[str, Path]], max_commits: Optional[int] = None, max_workers: int = 4) -> List[Dict]:
+    """Run git_log_commits over several repositories in parallel, newest commits first."""
+    repo_paths = list(repo_paths)
+    if not repo_paths:
+        return []
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(repo_paths)))) as executor:
+        per_repo = executor.map(lambda path: git_log_commits(path, max_count=max_commits), repo_paths)
+        commits = [commit for repo_commits in per_repo for commit in repo_commits]
+    commits.sort(key=lambda commit: datetime.fromisoformat(commit["committed_date"]), reverse=True)
+    return commits[:max_commits] if max_commits is not None else commits
@@ -1,5 +1,52 @@
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from contextvars import ContextVar, copy_context
+from datetime import datetime, timezone
+from pathlib import Path
+from urllib.parse import urlparse
+
 import requests
-from typing import Optional, List, Dict
+from requests.adapters import HTTPAdapter
+from typing import Optional, List, Dict, Iterable, Iterator, Tuple, Any, NamedTuple
+
+from utils.cache import DiskLRUCache, DATA_DIR, PROCESSED_DIR
+
+GITHUB_API_URL = "https://api.github.com"
+DEFAULT_MAX_WORKERS = 8
+HTTP_CACHE_PATH = PROCESSED_DIR / "github_http_cache.sqlite"
+HTTP_CACHE_MAX_BYTES = 128 * 1024 * 1024
+PER_PAGE = 100
+# Longest the scheduler sleeps before giving up; runs are interactive, so an
+# exhausted quota is reported rather than waited out.
+MAX_RATE_LIMIT_WAIT = 30.0
+SYNC_STATE_DIR = DATA_DIR / "knowledge_base" / "github_sync"
+# Commits a first sync collects across repos that have no high-water mark yet.
+COLD_START_COMMITS = int(os.getenv("GITHUB_COLD_START_COMMITS", "2000")) or None
+
+_session = None
+_session_lock = threading.Lock()
+
+def get_session(pool_size: int = DEFAULT_MAX_WORKERS) -> requests.Session:
+    """
+    Return the shared keep-alive session used for all GitHub calls.
+    The connection pool is sized so every worker thread can hold a connection.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _session = session
+        return _session
 
 def parse_github_username(user_input: str) -> str:
     if user_input.startswith("http"):
@@ -14,44 +61,394 @@ def get_headers(token: Optional[str] = None) -> Dict[str, str]:
         headers["Authorization"] = f"token {token}"
     return headers
 
-def fetch_user_repos(github_username: str, token: str = None) -> List[Dict]:
-    url = f"https://api.github.com/users/{github_username}/repos"
-    headers = {"Authorization": f"token {token}"} if token else {}
-    response = requests.get(url, headers=headers)
-    response.raise_for_status()
-    return response.json()
+class GitHubAPIError(Exception):
+    """Raised when a GitHub call fails after the scheduler has given up retrying."""
+
+class QuotaUsage:
+    """Per-run accounting of GitHub requests and the rate-limit quota they consumed."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.quota_spent = 0
+        self.retries = 0
+        self.wait_seconds = 0.0
+        self.remaining = None
+        self.limit = None
+
+    def record(self, counted: bool = True, retried: bool = False, waited: float = 0.0, remaining: Optional[int] = None, limit: Optional[int] = None):
+        with self._lock:
+            self.requests += 1
+            if counted:
+                self.quota_spent += 1
+            if retried:
+                self.retries += 1
+            self.wait_seconds += waited
+            if remaining is not None:
+                self.remaining = remaining
+            if limit is not None:
+                self.limit = limit
+
+    def add_wait(self, seconds: float):
+        with self._lock:
+            self.wait_seconds += seconds
+
+    def as_dict(self) -> Dict:
+        return {
+            "requests": self.requests,
+            "quota_spent": self.quota_spent,
+            "retries": self.retries,
+            "wait_seconds": round(self.wait_seconds, 2),
+            "remaining": self.remaining,
+            "limit": self.limit,
+        }
+
+_current_usage: ContextVar[Optional[QuotaUsage]] = ContextVar("github_quota_usage", default=None)
+
+@contextmanager
+def track_quota():
+    """
+    Collect quota spend for every GitHub call made inside the block,
+    including calls made from iter_repo_commits_concurrently's worker threads.
+    """
+    usage = QuotaUsage()
+    reset_token = _current_usage.set(usage)
+    try:
+        yield usage
+    finally:
+        _current_usage.reset(reset_token)
+
+class GitHubRequestScheduler:
+    """
+    Shared gate for GitHub REST calls.
+
+    Tracks X-RateLimit-Limit/Remaining/Reset per token. Once less than the
+    pace_below fraction of the limit remains, the rest of the quota is spread
+    evenly over the time left in the window, unless that spacing would exceed
+    max_wait (e.g. the 60/h anonymous limit), in which case requests are sent
+    unpaced. Primary and secondary rate-limit responses are retried
+    (honouring Retry-After) with exponential backoff. Any wait longer than
+    max_wait raises GitHubAPIError with the time the quota resets instead.
+    """
+
+    RETRY_STATUSES = {403, 429, 500, 502, 503, 504}
+
+    def __init__(self, max_retries: int = 5, backoff_base: float = 1.0, backoff_max: float = 60.0, reserve: int = 10, pace_below: float = 0.1, max_wait: float = MAX_RATE_LIMIT_WAIT):
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.reserve = reserve
+        self.pace_below = pace_below
+        self.max_wait = max_wait
+        self._lock = threading.Lock()
+        self._limits = {}
+        self._next_slot = {}
+
+    def _wait_for_slot(self, key: str) -> float:
+        """Block until this token may send its next request; returns seconds waited."""
+        with self._lock:
+            now = time.time()
+            remaining, reset, limit = self._limits.get(key, (None, None, None))
+            slot = max(now, self._next_slot.get(key, now))
+            if remaining is not None and reset is not None and reset > now:
+                # Small quotas keep a proportionally small reserve.
+                reserve = min(self.reserve, limit // 20) if limit else self.reserve
+                if remaining <= reserve:
+                    if reset + 1 - now > self.max_wait:
+                        raise GitHubAPIError(f"GitHub rate limit exhausted; quota resets at {_format_reset(reset)}")
+                    slot = max(slot, reset + 1)
+                elif limit and remaining < self.pace_below * limit:
+                    interval = (reset - now) / (remaining - reserve)
+                    if interval <= self.max_wait:
+                        slot = min(slot, now + self.max_wait)
+                        self._next_slot[key] = slot + interval
+                # Count the request optimistically; the response corrects the counters.
+                self._limits[key] = (remaining - 1, reset, limit)
+            delay = slot - now
+        if delay > 0:
+            time.sleep(delay)
+        return max(delay, 0.0)
+
+    def _update_limits(self, key: str, response: requests.Response):
+        remaining = _int_header(response, "X-RateLimit-Remaining")
+        reset = _int_header(response, "X-RateLimit-Reset")
+        if remaining is None or reset is None:
+            return
+        with self._lock:
+            self._limits[key] = (remaining, reset, _int_header(response, "X-RateLimit-Limit"))
+
+    def _retry_delay(self, response: requests.Response, attempt: int) -> Optional[float]:
+        """Seconds to wait before retrying, or None if the response is final."""
+        if response.status_code not in self.RETRY_STATUSES:
+            return None
+        retry_after = response.headers.get("Retry-After")
+        if retry_after is not None:
+            return float(retry_after)
+        if response.status_code == 403:
+            if response.headers.get("X-RateLimit-Remaining") == "0":
+                reset = int(response.headers.get("X-RateLimit-Reset", time.time()))
+                return max(reset - time.time(), 0) + 1
+            if "rate limit" not in response.text.lower():
+                return None
+        return min(self.backoff_base * (2 ** attempt), self.backoff_max) * (1 + random.random() / 2)
+
+    def request(self, url: str, token: Optional[str] = None, params: Optional[Dict] = None, headers: Optional[Dict] = None) -> requests.Response:
+        key = token or "anonymous"
+        request_headers = get_headers(token)
+        if headers:
+            request_headers.update(headers)
+        usage = _current_usage.get()
+        session = get_session()
+        for attempt in range(self.max_retries + 1):
+            waited = self._wait_for_slot(key)
+            response = session.get(url, headers=request_headers, params=params)
+            self._update_limits(key, response)
+            delay = self._retry_delay(response, attempt) if attempt < self.max_retries else None
+            if usage is not None:
+                usage.record(
+                    counted=response.status_code != 304,
+                    retried=delay is not None,
+                    waited=waited,
+                    remaining=_int_header(response, "X-RateLimit-Remaining"),
+                    limit=_int_header(response, "X-RateLimit-Limit"),
+                )
+            if delay is None:
+                return response
+            if delay > self.max_wait:
+                raise GitHubAPIError(f"GitHub asked to back off for {int(delay)}s on {url}; retry after {_format_reset(time.time() + delay)}")
+            time.sleep(delay)
+            if usage is not None:
+                usage.add_wait(delay)
+        return response
+
+def _format_reset(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp, tz=timezone.utc).strftime("%Y-%m-%d %H:%M:%S UTC")
+
+def _int_header(response: requests.Response, name: str) -> Optional[int]:
+    value = response.headers.get(name)
+    return int(value) if value is not None else None
+
+scheduler = GitHubRequestScheduler()
 
-def fetch_repo_commits(github_username: str, repo_name: str, token: str = None, per_page: int = 30, max_pages: int = 2) -> List[Dict]:
+class GitHubResponse(NamedTuple):
+    status_code: int
+    data: Any
+    headers: Dict[str, str]
+    from_cache: bool = False
+
+_http_cache = None
+_http_cache_lock = threading.Lock()
+
+def get_http_cache() -> DiskLRUCache:
+    """Return the on-disk ETag cache shared by all GitHub calls."""
+    global _http_cache
+    with _http_cache_lock:
+        if _http_cache is None:
+            _http_cache = DiskLRUCache(HTTP_CACHE_PATH, max_bytes=HTTP_CACHE_MAX_BYTES)
+        return _http_cache
+
+def _cache_key(url: str, token: Optional[str], params: Optional[Dict]) -> str:
+    # Responses differ per credential (private repos), so the token is part of the key.
+    identity = hashlib.sha256(token.encode()).hexdigest()[:16] if token else "anonymous"
+    query = json.dumps(sorted((params or {}).items()))
+    return f"{identity} {url} {query}"
+
+def cached_request(url: str, token: Optional[str] = None, params: Optional[Dict] = None) -> GitHubResponse:
+    """
+    GET a GitHub API URL, replaying the stored ETag/Last-Modified validators.
+    A 304 answer is served from the local cache and does not consume quota.
+    """
+    cache = get_http_cache()
+    key = _cache_key(url, token, params)
+    raw = cache.get(key)
+    entry = json.loads(raw) if raw is not None else None
+    headers = {}
+    if entry is not None:
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+    response = scheduler.request(url, token, params=params, headers=headers)
+    if response.status_code == 304 and entry is not None:
+        return GitHubResponse(200, entry["data"], entry["headers"], from_cache=True)
+    if response.status_code != 200:
+        return GitHubResponse(response.status_code, None, dict(response.headers))
+    data = response.json()
+    kept_headers = {name: response.headers[name] for name in ("Link",) if name in response.headers}
+    etag = response.headers.get("ETag")
+    last_modified = response.headers.get("Last-Modified")
+    if etag or last_modified:
+        cache.set(key, json.dumps({
+            "etag": etag,
+            "last_modified": last_modified,
+            "headers": kept_headers,
+            "data": data,
+        }).encode())
+    return GitHubResponse(200, data, kept_headers)
+
+def fetch_user_repos(github_username: str, token: str = None, per_page: int = PER_PAGE) -> List[Dict]:
+    """Fetch every repository of a user, following the Link pagination headers."""
+    repos = []
+    url = f"{GITHUB_API_URL}/users/{github_username}/repos"
+    params = {"per_page": per_page}
+    while url:
+        response = cached_request(url, token, params=params)
+        if response.status_code != 200:
+            raise GitHubAPIError(f"Fetching repositories for {github_username} failed with HTTP {response.status_code}")
+        repos.extend(response.data)
+        url = _next_page_url(response)
+        # The next-page URL already carries the query string.
+        params = None
+    return repos
+
+def _next_page_url(response: GitHubResponse) -> Optional[str]:
+    link = response.headers.get("Link")
+    if not link:
+        return None
+    for entry in requests.utils.parse_header_links(link):
+        if entry.get("rel") == "next":
+            return entry.get("url")
+    return None
+
+def fetch_repo_commits(github_username: str, repo_name: str, token: str = None, per_page: int = PER_PAGE, max_pages: Optional[int] = None, stop_event: Optional[threading.Event] = None, since: Optional[str] = None, limit: Optional[int] = None) -> List[Dict]:
+    """Fetch a repo's commits page by page; max_pages=None walks the full history."""
     commits = []
-    for page in range(1, max_pages + 1):
-        url = f"https://api.github.com/repos/{github_username}/{repo_name}/commits"
+    page = 1
+    while max_pages is None or page <= max_pages:
+        if stop_event is not None and stop_event.is_set():
+            break
+        url = f"{GITHUB_API_URL}/repos/{github_username}/{repo_name}/commits"
         params = {"per_page": per_page, "page": page}
-        headers = {"Authorization": f"token {token}"} if token else {}
-        response = requests.get(url, headers=headers, params=params)
-        if response.status_code != 200:
+        if since:
+            params["since"] = since
+        response = cached_request(url, token, params=params)
+        if response.status_code in (404, 409, 451):
+            # Missing, empty or blocked repository: nothing to collect.
             break
-        page_commits = response.json()
+        if response.status_code != 200:
+            raise GitHubAPIError(f"Fetching commits for {repo_name} failed with HTTP {response.status_code}")
+        page_commits = response.data
         if not page_commits:
             break
         commits.extend(page_commits)
+        if len(page_commits) < per_page or (limit is not None and len(commits) >= limit):
+            break
+        page += 1
     return commits
 
-def parse_commit_data(commit_json: Dict) -> Dict:
+def iter_repo_commits_concurrently(github_username: str, repo_names: Iterable[str], token: str = None, per_page: int = PER_PAGE, max_pages: Optional[int] = None, max_workers: int = DEFAULT_MAX_WORKERS, since: Optional[Dict[str, str]] = None, limit: Optional[int] = None) -> Iterator[Tuple[str, List[Dict]]]:
+    """
+    Fetch commits for several repos in parallel over the shared session,
+    yielding (repo_name, commits) in completion order. `since` optionally maps
+    repo names to an ISO timestamp to fetch from; `limit` caps commits per
+    repo. Closing the iterator early cancels queued repos and stops in-flight
+    ones from paginating further.
+    """
+    repo_names = list(repo_names)
+    if not repo_names:
+        return
+    since = since or {}
+    stop_event = threading.Event()
+    max_workers = max(1, min(max_workers, len(repo_names)))
+    get_session(max_workers)
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        futures = {
+            executor.submit(copy_context().run, fetch_repo_commits, github_username, repo_name, token, per_page, max_pages, stop_event, since.get(repo_name), limit): repo_name
+            for repo_name in repo_names
+        }
+        for future in as_completed(futures):
+            if future.cancelled():
+                continue
+            yield futures[future], future.result()
+    finally:
+        stop_event.set()
+        executor.shutdown(wait=True, cancel_futures=True)
+
+def parse_commit_data(commit_json: Dict, repo_name: Optional[str] = None) -> Dict:
     return {
         "sha": commit_json.get("sha"),
+        "repo": repo_name,
         "author": commit_json.get("commit", {}).get("author", {}).get("name"),
+        "author_login": (commit_json.get("author") or {}).get("login"),
         "date": commit_json.get("commit", {}).get("author", {}).get("date"),
         "message": commit_json.get("commit", {}).get("message"),
         "url": commit_json.get("html_url"),
     }
 
-def fetch_all_user_commits(user_input: str, token: Optional[str] = None, per_page: int = 30, max_pages: int = 2) -> List[Dict]:
-    username = parse_github_username(user_input)
+def _sync_state_path(username: str) -> Path:
+    return SYNC_STATE_DIR / f"{username.lower()}.json"
+
+def load_sync_state(username: str) -> Dict:
+    """Load the stored per-repo high-water marks and commit history for a user."""
+    path = _sync_state_path(username)
+    if not path.exists():
+        return {"username": username, "repos": {}}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def save_sync_state(username: str, state: Dict):
+    path = _sync_state_path(username)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # A unique temporary name, so concurrent syncs of one user cannot clobber each other's file.
+    tmp_path = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    os.replace(tmp_path, path)
+
+def sync_user_commits(username: str, token: Optional[str] = None, per_page: int = PER_PAGE, max_pages: Optional[int] = None, max_workers: int = DEFAULT_MAX_WORKERS, cold_start_commits: Optional[int] = COLD_START_COMMITS) -> List[Dict]:
+    """
+    Bring the stored commit history for a user up to date.
+    Repos seen before are only asked for commits since their high-water mark
+    (the newest committer date already stored); new commits are merged in
+    and the marks advanced. Returns the full merged history, newest first.
+
+    Repos without a mark are fetched newest first under a shared budget of
+    cold_start_commits (None for no budget): each stops paginating at the
+    budget, and once the budget is spent the remaining ones are cancelled
+    and left for the next sync. History older than what a first sync
+    collected is not backfilled later.
+    """
+    state = load_sync_state(username)
+    repo_states = state.setdefault("repos", {})
     repos = fetch_user_repos(username, token)
-    all_commits = []
-    for repo in repos:
-        repo_name = repo["name"]
-        commits = fetch_repo_commits(username, repo_name, token, per_page, max_pages)
-        for commit in commits:
-            all_commits.append(parse_commit_data(commit))
-    return all_commits
+    repo_names = [repo["name"] for repo in repos if isinstance(repo, dict) and "name" in repo]
+    since = {name: repo_states[name]["last_date"] for name in repo_names if repo_states.get(name, {}).get("last_date")}
+    cold = [name for name in repo_names if name not in since]
+
+    def merge(repo_name: str, raw_commits: List[Dict]) -> int:
+        repo_state = repo_states.setdefault(repo_name, {"last_sha": None, "last_date": None, "commits": []})
+        known = {commit["sha"] for commit in repo_state["commits"]}
+        new_commits = [parse_commit_data(commit, repo_name) for commit in raw_commits if commit.get("sha") not in known]
+        if not raw_commits and not new_commits:
+            return 0
+        newest = max(raw_commits, key=_committer_date)
+        if repo_state["last_date"] is None or _committer_date(newest) >= repo_state["last_date"]:
+            repo_state["last_sha"] = newest.get("sha")
+            repo_state["last_date"] = _committer_date(newest)
+        repo_state["commits"] = new_commits + repo_state["commits"]
+        return len(new_commits)
+
+    for repo_name, raw_commits in iter_repo_commits_concurrently(username, list(since), token, per_page, max_pages, max_workers, since=since):
+        merge(repo_name, raw_commits)
+    collected = 0
+    results = iter_repo_commits_concurrently(username, cold, token, per_page, max_pages, max_workers, limit=cold_start_commits)
+    try:
+        for repo_name, raw_commits in results:
+            collected += merge(repo_name, raw_commits)
+            if cold_start_commits is not None and collected >= cold_start_commits:
+                break
+    finally:
+        results.close()
+    save_sync_state(username, state)
+    history = [commit for name in repo_names for commit in repo_states.get(name, {}).get("commits", [])]
+    history.sort(key=lambda commit: commit.get("date") or "", reverse=True)
+    return history
+
+def _committer_date(commit_json: Dict) -> str:
+    commit = commit_json.get("commit", {})
+    return (commit.get("committer") or {}).get("date") or (commit.get("author") or {}).get("date") or ""
+
+def fetch_all_user_commits(user_input: str, token: Optional[str] = None, per_page: int = PER_PAGE, max_pages: Optional[int] = None, max_workers: int = DEFAULT_MAX_WORKERS, cold_start_commits: Optional[int] = COLD_START_COMMITS) -> List[Dict]:
+    username = parse_github_username(user_input)
+    return sync_user_commits(username, token, per_page, max_pages, max_workers, cold_start_commits)
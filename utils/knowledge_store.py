@@ -0,0 +1,187 @@
+import hashlib
+import re
+import zlib
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Optional, List, Dict, Iterable, Union
+
+import numpy as np
+
+from utils.cache import DATA_DIR
+from utils.nlp_utils import split_text
+
+KNOWLEDGE_BASE_DIR = DATA_DIR / "knowledge_base"
+CHROMA_DIR = KNOWLEDGE_BASE_DIR / "chroma"
+COLLECTION_NAME = "handover"
+EMBEDDING_DIM = 1024
+CHUNK_CHARS = 1500
+UPSERT_BATCH_SIZE = 256
+_TOKEN_RE = re.compile(r"\w+")
+
+def _to_timestamp(value: Optional[str]) -> Optional[int]:
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return int(parsed.timestamp())
+
+class HashingEmbedder:
+    """
+    Offline embedding: word unigrams and bigrams are hashed (CRC32, stable
+    across processes) into a fixed number of signed buckets, weighted by
+    1 + log(tf) and L2-normalized. No model download and no network.
+    """
+
+    def __init__(self, dim: int = EMBEDDING_DIM):
+        self.dim = dim
+
+    def __call__(self, texts: List[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            tokens = _TOKEN_RE.findall(text.lower())
+            features = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+            if not features:
+                continue
+            hashes = np.fromiter((zlib.crc32(feature.encode("utf-8")) for feature in features), dtype=np.uint32, count=len(features))
+            # The low bits pick the bucket and the top bit the sign, so
+            # colliding features tend to cancel rather than pile up.
+            signs = np.where(hashes >> 31, -1.0, 1.0)
+            counts = np.bincount(hashes % self.dim, weights=signs, minlength=self.dim)
+            nonzero = counts != 0
+            vector = np.zeros(self.dim)
+            vector[nonzero] = np.sign(counts[nonzero]) * (1.0 + np.log(np.abs(counts[nonzero])))
+            norm = np.linalg.norm(vector)
+            if norm:
+                vectors[row] = vector / norm
+        return vectors
+
+def chunk_id(doc_id: str, text: str) -> str:
+    return hashlib.sha256(f"{doc_id}\0{text}".encode("utf-8")).hexdigest()
+
+class KnowledgeStore:
+    """
+    Persistent Chroma collection of handover chunks under data/knowledge_base.
+
+    Each item ({'doc_id', 'text', 'source', 'person', 'date', 'title'}) is
+    split into chunks whose ids are content hashes, so re-ingesting a
+    handover only embeds and writes new or changed chunks; chunks of a
+    changed item that no longer exist are deleted.
+    """
+
+    def __init__(self, path: Union[str, Path] = CHROMA_DIR, collection: str = COLLECTION_NAME, embedder: Optional[HashingEmbedder] = None):
+        import chromadb
+
+        Path(path).mkdir(parents=True, exist_ok=True)
+        self.client = chromadb.PersistentClient(path=str(path))
+        # Embeddings are always passed in explicitly, so Chroma never loads
+        # (or downloads) its default embedding model.
+        self.collection = self.client.get_or_create_collection(collection, embedding_function=None, metadata={"hnsw:space": "cosine"})
+        self.embedder = embedder or HashingEmbedder()
+
+    def upsert(self, items: Iterable[Dict], chunk_chars: int = CHUNK_CHARS) -> Dict[str, int]:
+        """Index items; returns counts of chunks added and removed."""
+        chunks = {}
+        doc_ids = set()
+        for item in items:
+            text = (item.get("text") or "").strip()
+            if not text:
+                continue
+            doc_ids.add(item["doc_id"])
+            metadata = {
+                "doc_id": item["doc_id"],
+                "source": item.get("source"),
+                "person": item.get("person"),
+                "title": item.get("title"),
+                "date": item.get("date"),
+                "timestamp": _to_timestamp(item.get("date")),
+            }
+            metadata = {key: value for key, value in metadata.items() if value is not None}
+            for index, (_, chunk) in enumerate(split_text(text, chunk_chars)):
+                chunk = chunk.strip()
+                if chunk:
+                    chunks[chunk_id(item["doc_id"], chunk)] = (chunk, dict(metadata, chunk=index))
+
+        existing = set()
+        doc_ids = sorted(doc_ids)
+        for start in range(0, len(doc_ids), UPSERT_BATCH_SIZE):
+            batch = doc_ids[start:start + UPSERT_BATCH_SIZE]
+            existing.update(self.collection.get(where={"doc_id": {"$in": batch}}, include=[])["ids"])
+        stale = [chunk for chunk in existing if chunk not in chunks]
+        if stale:
+            self.collection.delete(ids=stale)
+
+        new_ids = [chunk for chunk in chunks if chunk not in existing]
+        for start in range(0, len(new_ids), UPSERT_BATCH_SIZE):
+            batch = new_ids[start:start + UPSERT_BATCH_SIZE]
+            documents = [chunks[chunk][0] for chunk in batch]
+            self.collection.upsert(
+                ids=batch,
+                documents=documents,
+                embeddings=self.embedder(documents).tolist(),
+                metadatas=[chunks[chunk][1] for chunk in batch],
+            )
+        return {"added": len(new_ids), "removed": len(stale), "total": self.collection.count()}
+
+    def query(self, text: str, k: int = 5, source: Optional[str] = None, person: Optional[str] = None, date_from: Optional[str] = None, date_to: Optional[str] = None) -> List[Dict]:
+        """Top-k chunks most similar to text, optionally filtered by source, person and date range."""
+        conditions = []
+        if source:
+            conditions.append({"source": source})
+        if person:
+            conditions.append({"person": person})
+        if _to_timestamp(date_from) is not None:
+            conditions.append({"timestamp": {"$gte": _to_timestamp(date_from)}})
+        if _to_timestamp(date_to) is not None:
+            conditions.append({"timestamp": {"$lte": _to_timestamp(date_to)}})
+        where = conditions[0] if len(conditions) == 1 else ({"$and": conditions} if conditions else None)
+        result = self.collection.query(
+            query_embeddings=self.embedder([text]).tolist(),
+            n_results=k,
+            where=where,
+            include=["documents", "metadatas", "distances"],
+        )
+        return [
+            {"id": chunk, "text": document, "score": 1.0 - distance, **metadata}
+            for chunk, document, metadata, distance in zip(result["ids"][0], result["documents"][0], result["metadatas"][0], result["distances"][0])
+        ]
+
+_stores = {}
+
+def get_knowledge_store(path: Union[str, Path] = CHROMA_DIR) -> KnowledgeStore:
+    """Process-wide KnowledgeStore per path; Chroma is only imported on first use."""
+    key = str(path)
+    if key not in _stores:
+        _stores[key] = KnowledgeStore(path)
+    return _stores[key]
+
+# The store is shared by every handover, so document and email ids are
+# scoped by person; otherwise one person's notes.txt would replace another's.
+# Ids stay stable across revisions of a file: the content-hash chunk ids
+# detect the change, and the old revision's chunks are deleted.
+def items_from_documents(documents: Iterable[Dict], person: Optional[str] = None) -> List[Dict]:
+    """Knowledge items from DocumentTextExtractorTool output, identified by person and filename."""
+    return [
+        {"doc_id": f"document:{person or ''}:{doc['filename']}", "text": doc["content"], "source": "document",
+         "person": person, "title": doc["filename"]}
+        for doc in documents if doc.get("content")
+    ]
+
+def items_from_commits(commits: Iterable[Dict], person: Optional[str] = None) -> List[Dict]:
+    """Knowledge items from slim commit dicts (parse_commit_data shape)."""
+    return [
+        {"doc_id": f"commit:{commit['sha']}", "text": commit.get("message"), "source": "commit",
+         "person": person or commit.get("author_login") or commit.get("author"), "title": commit.get("repo"), "date": commit.get("date")}
+        for commit in commits if commit.get("sha")
+    ]
+
+def items_from_threads(threads: Iterable[Dict], person: Optional[str] = None) -> List[Dict]:
+    """Knowledge items from the email threads returned by EmailProcessorTool."""
+    return [
+        {"doc_id": f"email:{person or ''}:{thread['subject']}:{thread['first_date']}", "text": thread["text"], "source": "email",
+         "person": person, "title": thread["subject"], "date": thread["last_date"]}
+        for thread in threads
+    ]
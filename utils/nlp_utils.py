@@ -0,0 +1,137 @@
+import os
+import re
+import threading
+from typing import Any, Optional, List, NamedTuple, Tuple, Iterable, Iterator
+
+SPACY_MODEL = os.getenv("SPACY_MODEL", "en_core_web_sm")
+NER_BATCH_SIZE = 64
+# Sentence boundary components, cheapest first.
+SENTENCE_COMPONENTS = ("senter", "sentencizer", "parser")
+# Chunks are cut at the last paragraph, line or sentence break inside this
+# window before the length limit, so entities are rarely split in two.
+CHUNK_BOUNDARY_WINDOW = 2000
+_BOUNDARY_RE = re.compile(r"\n\s*\n|\n|(?<=[.!?])\s")
+
+# (text, label, start_char, end_char), offsets relative to the full document.
+Entity = Tuple[str, str, int, int]
+
+class ParsedText(NamedTuple):
+    """NER and sentence segmentation of one text; offsets are into the full text."""
+    entities: List[Entity]
+    sentences: List[Tuple[int, int]]
+    sentence_terms: List[List[int]]
+
+_models = {}
+_models_lock = threading.Lock()
+
+def get_nlp(name: str = SPACY_MODEL):
+    """
+    Process-wide spaCy pipeline, loaded on first use. spaCy itself is only
+    imported here, so code paths that never run NLP never pay for it.
+    """
+    model = _models.get(name)
+    if model is None:
+        with _models_lock:
+            model = _models.get(name)
+            if model is None:
+                import spacy
+                model = spacy.load(name)
+                sentence_component(model)
+                _models[name] = model
+    return model
+
+def split_text(text: str, max_chars: int) -> List[Tuple[int, str]]:
+    """
+    Split text into (offset, chunk) pieces of at most max_chars characters,
+    preferring paragraph, line and sentence boundaries.
+    """
+    chunks = []
+    start = 0
+    while len(text) - start > max_chars:
+        end = start + max_chars
+        window_start = max(start + 1, end - CHUNK_BOUNDARY_WINDOW)
+        boundaries = [m.end() for m in _BOUNDARY_RE.finditer(text, window_start, end)]
+        cut = boundaries[-1] if boundaries else end
+        chunks.append((start, text[start:cut]))
+        start = cut
+    chunks.append((start, text[start:]))
+    return chunks
+
+def pipes_to_disable(nlp, keep: Iterable[str]) -> List[str]:
+    """
+    Names of the pipeline components not needed to run keep. A shared tok2vec
+    stays enabled only if one of the kept components listens to it.
+    """
+    keep = set(keep)
+    needed = set(keep)
+    for name, component in nlp.pipeline:
+        if keep & set(getattr(component, "listening_components", []) or []):
+            needed.add(name)
+    return [name for name in nlp.pipe_names if name not in needed]
+
+def sentence_component(nlp) -> str:
+    """
+    Name of the cheapest component that sets sentence boundaries. A disabled
+    senter (en_core_web_sm ships one) is enabled, and a rule-based
+    sentencizer is added to pipelines that have neither senter nor parser.
+    """
+    if "senter" in nlp.disabled:
+        nlp.enable_pipe("senter")
+    for name in SENTENCE_COMPONENTS:
+        if name in nlp.pipe_names:
+            return name
+    nlp.add_pipe("sentencizer")
+    return "sentencizer"
+
+def iter_docs(nlp, texts: Iterable[str], keep: Iterable[str], batch_size: int = NER_BATCH_SIZE, n_process: int = 1, max_chars: Optional[int] = None) -> Iterator[Tuple[int, int, Any]]:
+    """
+    Run only the components in keep over texts through nlp.pipe, yielding
+    (text_index, char_offset, doc) in input order. Texts longer than
+    max_chars (nlp.max_length by default) are split into chunks; offset is
+    where each chunk starts in its text.
+    """
+    max_chars = max_chars or nlp.max_length
+    disable = pipes_to_disable(nlp, keep)
+
+    def chunks():
+        for index, text in enumerate(texts):
+            for offset, chunk in split_text(text, max_chars):
+                yield chunk, (index, offset)
+
+    docs = nlp.pipe(chunks(), as_tuples=True, batch_size=batch_size, n_process=n_process, disable=disable)
+    for doc, (index, offset) in docs:
+        yield index, offset, doc
+
+def iter_entities(nlp, texts: Iterable[str], batch_size: int = NER_BATCH_SIZE, n_process: int = 1, max_chars: Optional[int] = None) -> Iterator[Tuple[int, Entity]]:
+    """
+    Run only the NER stage over texts, yielding (text_index, entity) in
+    input order with offsets into the original text.
+    """
+    for index, offset, doc in iter_docs(nlp, texts, ["ner"], batch_size, n_process, max_chars):
+        for ent in doc.ents:
+            yield index, (ent.text, ent.label_, offset + ent.start_char, offset + ent.end_char)
+
+def extract_entities(nlp, texts: List[str], batch_size: int = NER_BATCH_SIZE, n_process: int = 1, max_chars: Optional[int] = None) -> List[List[Entity]]:
+    """Batched NER over texts; returns one entity list per text, in text order."""
+    entities = [[] for _ in texts]
+    for index, entity in iter_entities(nlp, texts, batch_size, n_process, max_chars):
+        entities[index].append(entity)
+    return entities
+
+def parse_texts(nlp, texts: List[str], batch_size: int = NER_BATCH_SIZE, n_process: int = 1, max_chars: Optional[int] = None) -> List[ParsedText]:
+    """
+    One batched pass of NER plus sentence segmentation over texts. Besides
+    the entities, each sentence's span and content terms (lower-case lexeme
+    hashes, stop words and punctuation dropped) are kept for summarization.
+    """
+    parsed = [ParsedText([], [], []) for _ in texts]
+    keep = ["ner", sentence_component(nlp)]
+    for index, offset, doc in iter_docs(nlp, texts, keep, batch_size, n_process, max_chars):
+        result = parsed[index]
+        for ent in doc.ents:
+            result.entities.append((ent.text, ent.label_, offset + ent.start_char, offset + ent.end_char))
+        for sent in doc.sents:
+            if sent.text.strip():
+                result.sentences.append((offset + sent.start_char, offset + sent.end_char))
+                result.sentence_terms.append([token.lower for token in sent if not (token.is_stop or token.is_punct or token.is_space)])
+    return parsed
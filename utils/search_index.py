@@ -0,0 +1,384 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import uuid
+from pathlib import Path
+from typing import Optional, List, Dict, Iterable, Tuple, Union
+
+import numpy as np
+
+from utils.knowledge_store import KNOWLEDGE_BASE_DIR
+
+SEARCH_INDEX_DIR = KNOWLEDGE_BASE_DIR / "search"
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Once this many segments exist, the smallest ones are merged into one.
+MERGE_FACTOR = 8
+MAX_TERM_CHARS = 40
+SNIPPET_CHARS = 300
+_TOKEN_RE = re.compile(r"\w+")
+STOP_WORDS = frozenset(
+    "a an and are as at be but by for from has have he her his i if in into is it its "
+    "of on or our she so that the their them then there these they this to was we were "
+    "what when which who will with you your".split()
+)
+
+def tokenize(text: str) -> List[str]:
+    """Lower-case word tokens without stop words or very long tokens."""
+    return [token for token in _TOKEN_RE.findall(text.lower()) if token not in STOP_WORDS and len(token) <= MAX_TERM_CHARS]
+
+def encode_varints(values: np.ndarray) -> Tuple[bytes, np.ndarray]:
+    """
+    LEB128-encode non-negative integers, 7 bits per byte with the high bit
+    marking continuation. Returns the bytes and each value's start offset.
+    """
+    values = np.asarray(values, dtype=np.uint64)
+    sizes = np.ones(len(values), dtype=np.int64)
+    for k in range(1, 10):
+        sizes += values >= np.uint64(1 << (7 * k))
+    starts = np.cumsum(sizes) - sizes
+    out = np.empty(int(sizes.sum()), dtype=np.uint8)
+    for k in range(int(sizes.max()) if len(values) else 0):
+        present = sizes > k
+        byte = (values[present] >> np.uint64(7 * k)) & np.uint64(0x7F)
+        byte |= np.where(sizes[present] > k + 1, np.uint64(0x80), np.uint64(0))
+        out[starts[present] + k] = byte
+    return out.tobytes(), starts
+
+def decode_varints(buffer: np.ndarray) -> np.ndarray:
+    """Inverse of encode_varints over a uint8 array."""
+    buffer = np.asarray(buffer, dtype=np.uint8)
+    ends = np.flatnonzero(buffer < 0x80)
+    starts = np.concatenate(([0], ends[:-1] + 1)).astype(np.int64)
+    values = np.zeros(len(ends), dtype=np.uint64)
+    for k in range(int((ends - starts).max()) + 1 if len(ends) else 0):
+        positions = starts + k
+        present = positions <= ends
+        values[present] |= (buffer[positions[present]].astype(np.uint64) & np.uint64(0x7F)) << np.uint64(7 * k)
+    return values.astype(np.int64)
+
+def _atomic_write(path: Path, data: bytes):
+    tmp_path = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+class Segment:
+    """
+    One immutable on-disk segment:
+    - <name>.terms.npz: sorted term dictionary, per-term document frequency
+      and byte offsets into the postings files, plus document lengths;
+    - <name>.docs / <name>.freqs: varint-encoded postings, doc ids as
+      deltas within each term and term frequencies;
+    - <name>.meta.jsonl: one line per document (id, hash, title, source, snippet).
+    Postings are memory-mapped and decoded one term at a time.
+    """
+
+    def __init__(self, directory: Path, name: str):
+        self.directory = Path(directory)
+        self.name = name
+        with np.load(self.directory / f"{name}.terms.npz") as data:
+            self.terms = data["terms"]
+            self.doc_freqs = data["doc_freqs"]
+            self.doc_offsets = data["doc_offsets"]
+            self.freq_offsets = data["freq_offsets"]
+            self.doc_lengths = data["doc_lengths"]
+        self._doc_postings = self._map(f"{name}.docs")
+        self._freq_postings = self._map(f"{name}.freqs")
+        with open(self.directory / f"{name}.meta.jsonl", encoding="utf-8") as f:
+            self.docs = [json.loads(line) for line in f]
+        self.sources = np.array([doc.get("source") or "" for doc in self.docs], dtype=object)
+
+    def _map(self, file_name: str) -> np.ndarray:
+        path = self.directory / file_name
+        if path.stat().st_size == 0:
+            return np.zeros(0, dtype=np.uint8)
+        return np.memmap(path, dtype=np.uint8, mode="r")
+
+    def __len__(self) -> int:
+        return len(self.docs)
+
+    def term_index(self, term: str) -> Optional[int]:
+        index = int(np.searchsorted(self.terms, term))
+        if index < len(self.terms) and self.terms[index] == term:
+            return index
+        return None
+
+    def postings(self, term: str) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """(doc_ids, term_frequencies) for term, or None if it does not occur."""
+        index = self.term_index(term)
+        if index is None:
+            return None
+        deltas = decode_varints(self._doc_postings[self.doc_offsets[index]:self.doc_offsets[index + 1]])
+        freqs = decode_varints(self._freq_postings[self.freq_offsets[index]:self.freq_offsets[index + 1]])
+        return np.cumsum(deltas), freqs
+
+    def all_postings(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Every (term_index, doc_id, frequency) triple, decoded in bulk for merging."""
+        term_ids = np.repeat(np.arange(len(self.terms)), self.doc_freqs)
+        deltas = decode_varints(self._doc_postings)
+        freqs = decode_varints(self._freq_postings)
+        totals = np.cumsum(deltas)
+        first = np.cumsum(self.doc_freqs) - self.doc_freqs
+        # Undo the delta coding per term: subtract the running total before each term starts.
+        before = np.where(first > 0, totals[np.maximum(first - 1, 0)], 0)
+        return term_ids, totals - np.repeat(before, self.doc_freqs), freqs
+
+    def delete_files(self):
+        for suffix in (".terms.npz", ".docs", ".freqs", ".meta.jsonl"):
+            (self.directory / f"{self.name}{suffix}").unlink(missing_ok=True)
+
+    @staticmethod
+    def write(directory: Path, name: str, terms: np.ndarray, term_ids: np.ndarray, doc_ids: np.ndarray, freqs: np.ndarray, doc_lengths: np.ndarray, docs: List[Dict]) -> "Segment":
+        """Write postings sorted by (term_id, doc_id) as a new segment."""
+        directory = Path(directory)
+        doc_freqs = np.bincount(term_ids, minlength=len(terms))
+        first = np.cumsum(doc_freqs) - doc_freqs
+        new_term = np.ones(len(term_ids), dtype=bool)
+        new_term[1:] = term_ids[1:] != term_ids[:-1]
+        deltas = np.where(new_term, doc_ids, doc_ids - np.concatenate(([0], doc_ids[:-1])))
+        doc_bytes, doc_starts = encode_varints(deltas)
+        freq_bytes, freq_starts = encode_varints(freqs)
+        # Every term in the dictionary has postings, so first indexes both start arrays.
+        doc_offsets = np.append(doc_starts[first], len(doc_bytes)).astype(np.int64)
+        freq_offsets = np.append(freq_starts[first], len(freq_bytes)).astype(np.int64)
+        _atomic_write(directory / f"{name}.docs", doc_bytes)
+        _atomic_write(directory / f"{name}.freqs", freq_bytes)
+        _atomic_write(directory / f"{name}.meta.jsonl", "".join(json.dumps(doc) + "\n" for doc in docs).encode("utf-8"))
+        tmp_path = directory / f".{name}.terms.{uuid.uuid4().hex}.npz"
+        np.savez(tmp_path, terms=terms, doc_freqs=doc_freqs.astype(np.int32), doc_offsets=doc_offsets,
+                 freq_offsets=freq_offsets, doc_lengths=np.asarray(doc_lengths, dtype=np.int32))
+        os.replace(tmp_path, directory / f"{name}.terms.npz")
+        return Segment(directory, name)
+
+def _build_postings(token_lists: List[List[str]]) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Sorted term dictionary plus (term_id, doc_id, frequency) postings for tokenized docs."""
+    lengths = np.fromiter((len(tokens) for tokens in token_lists), dtype=np.int64, count=len(token_lists))
+    flat = np.array([token for tokens in token_lists for token in tokens], dtype=f"<U{MAX_TERM_CHARS}")
+    terms, token_term_ids = np.unique(flat, return_inverse=True)
+    token_doc_ids = np.repeat(np.arange(len(token_lists)), lengths)
+    keys, freqs = np.unique(token_term_ids.ravel().astype(np.int64) * len(token_lists) + token_doc_ids, return_counts=True)
+    return terms, keys // max(len(token_lists), 1), keys % max(len(token_lists), 1), freqs
+
+class SearchIndex:
+    """
+    BM25 search over an on-disk, segmented inverted index.
+
+    Each add_documents call writes one new immutable segment. A document
+    whose id is re-added with different text is marked deleted in its old
+    segment (deletions live in manifest.json) and indexed again; unchanged
+    documents are skipped. When MERGE_FACTOR segments accumulate, the
+    smallest are merged on a background thread, dropping deleted documents.
+    Searches run against a snapshot of the segment list, so they never wait
+    for a merge.
+    """
+
+    def __init__(self, directory: Union[str, Path] = SEARCH_INDEX_DIR, merge_factor: int = MERGE_FACTOR, k1: float = BM25_K1, b: float = BM25_B):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.merge_factor = merge_factor
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.RLock()
+        # Serializes add_documents, so the skip-unchanged check and the
+        # segment write of one call are not interleaved with another's.
+        self._write_lock = threading.Lock()
+        self._merge_thread = None
+        manifest_path = self.directory / "manifest.json"
+        manifest = json.loads(manifest_path.read_text()) if manifest_path.exists() else {"segments": [], "deleted": {}}
+        self.segments = [Segment(self.directory, name) for name in manifest["segments"]]
+        self.deleted = {name: set(ids) for name, ids in manifest["deleted"].items()}
+        # External id -> (segment name, local doc id, content hash) of its live version.
+        self._locations = {}
+        for segment in self.segments:
+            dead = self.deleted.get(segment.name, set())
+            for local, doc in enumerate(segment.docs):
+                if local not in dead:
+                    self._locations[doc["id"]] = (segment.name, local, doc["hash"])
+
+    def _save_manifest(self):
+        manifest = {
+            "segments": [segment.name for segment in self.segments],
+            "deleted": {name: sorted(ids) for name, ids in self.deleted.items() if ids},
+        }
+        _atomic_write(self.directory / "manifest.json", json.dumps(manifest).encode("utf-8"))
+
+    def add_documents(self, docs: Iterable[Dict]) -> Dict[str, int]:
+        """
+        Index docs ({'id', 'text', 'title', 'source'}) as a new segment.
+        Returns counts of documents added and of older versions deleted.
+        """
+        with self._write_lock:
+            result = self._add_documents(docs)
+        self.maybe_merge()
+        return result
+
+    def _add_documents(self, docs: Iterable[Dict]) -> Dict[str, int]:
+        batch, token_lists = [], []
+        seen = set()
+        for doc in docs:
+            text = doc.get("text") or ""
+            content_hash = hashlib.sha256(text.encode("utf-8")).hexdigest()
+            with self._lock:
+                location = self._locations.get(doc["id"])
+            if doc["id"] in seen or not text.strip() or (location and location[2] == content_hash):
+                continue
+            seen.add(doc["id"])
+            token_lists.append(tokenize(text))
+            batch.append({
+                "id": doc["id"],
+                "hash": content_hash,
+                "title": doc.get("title"),
+                "source": doc.get("source"),
+                "snippet": " ".join(text.split())[:SNIPPET_CHARS],
+            })
+        if not batch:
+            return {"added": 0, "deleted": 0, "segments": len(self.segments)}
+
+        terms, term_ids, doc_ids, freqs = _build_postings(token_lists)
+        name = f"seg_{uuid.uuid4().hex[:12]}"
+        lengths = [len(tokens) for tokens in token_lists]
+        segment = Segment.write(self.directory, name, terms, term_ids, doc_ids, freqs, lengths, batch)
+        with self._lock:
+            # Old versions are looked up again here: a merge that finished
+            # while the segment was written may have moved them.
+            replaced = 0
+            for local, doc in enumerate(batch):
+                location = self._locations.get(doc["id"])
+                if location:
+                    self.deleted.setdefault(location[0], set()).add(location[1])
+                    replaced += 1
+                self._locations[doc["id"]] = (name, local, doc["hash"])
+            self.segments = self.segments + [segment]
+            self._save_manifest()
+            return {"added": len(batch), "deleted": replaced, "segments": len(self.segments)}
+
+    def search(self, query: str, k: int = 10, source: Optional[str] = None) -> List[Dict]:
+        """Top-k documents for query by BM25, optionally restricted to one source."""
+        query_terms = list(dict.fromkeys(tokenize(query)))
+        with self._lock:
+            segments = list(self.segments)
+            deleted = {name: set(ids) for name, ids in self.deleted.items()}
+        # Collection statistics count live documents only, so scores do not
+        # change when a merge drops the deleted ones.
+        alive = {}
+        for segment in segments:
+            alive[segment.name] = np.ones(len(segment), dtype=bool)
+            alive[segment.name][list(deleted.get(segment.name, ()))] = False
+        live_docs = sum(int(mask.sum()) for mask in alive.values())
+        if not query_terms or live_docs == 0:
+            return []
+        total_length = sum(int(segment.doc_lengths[alive[segment.name]].sum()) for segment in segments)
+        avg_length = max(total_length / live_docs, 1.0)
+
+        postings = [[segment.postings(term) for term in query_terms] for segment in segments]
+        doc_freqs = np.zeros(len(query_terms))
+        for segment, segment_postings in zip(segments, postings):
+            for i, posting in enumerate(segment_postings):
+                if posting is not None:
+                    doc_freqs[i] += int(alive[segment.name][posting[0]].sum())
+        idf = np.log(1 + (live_docs - doc_freqs + 0.5) / (doc_freqs + 0.5))
+
+        candidates = []
+        for segment, segment_postings in zip(segments, postings):
+            scores = np.zeros(len(segment))
+            norms = self.k1 * (1 - self.b + self.b * segment.doc_lengths / avg_length)
+            for i, posting in enumerate(segment_postings):
+                if posting is None:
+                    continue
+                doc_ids, freqs = posting
+                scores[doc_ids] += idf[i] * freqs * (self.k1 + 1) / (freqs + norms[doc_ids])
+            scores[~alive[segment.name]] = 0
+            if source is not None:
+                scores[segment.sources != source] = 0
+            top = np.flatnonzero(scores > 0)
+            if len(top) > k:
+                top = top[np.argpartition(-scores[top], k - 1)[:k]]
+            candidates.extend((float(scores[local]), segment, int(local)) for local in top)
+
+        candidates.sort(key=lambda candidate: -candidate[0])
+        return [
+            {"score": score, **{key: value for key, value in segment.docs[local].items() if key != "hash"}}
+            for score, segment, local in candidates[:k]
+        ]
+
+    def maybe_merge(self):
+        """Start a background merge when MERGE_FACTOR segments have accumulated."""
+        with self._lock:
+            if len(self.segments) < self.merge_factor or (self._merge_thread and self._merge_thread.is_alive()):
+                return
+            self._merge_thread = threading.Thread(target=self.merge, name="search-index-merge", daemon=True)
+            self._merge_thread.start()
+
+    def wait_for_merges(self):
+        thread = self._merge_thread
+        if thread is not None:
+            thread.join()
+
+    def merge(self, max_segments: Optional[int] = None):
+        """Merge the smallest max_segments (default MERGE_FACTOR) segments into one."""
+        with self._lock:
+            chosen = sorted(self.segments, key=len)[:max_segments or self.merge_factor]
+            if len(chosen) < 2:
+                return
+            deleted = {segment.name: set(self.deleted.get(segment.name, ())) for segment in chosen}
+
+        vocabularies, term_ids, doc_ids, freqs, lengths, docs = [], [], [], [], [], []
+        remap = {}
+        for segment in chosen:
+            dead = deleted[segment.name]
+            keep = np.ones(len(segment), dtype=bool)
+            keep[list(dead)] = False
+            new_ids = np.cumsum(keep) - 1 + len(docs)
+            for local in np.flatnonzero(keep):
+                remap[(segment.name, int(local))] = int(new_ids[local])
+            segment_terms, segment_docs, segment_freqs = segment.all_postings()
+            live = keep[segment_docs]
+            vocabularies.append(segment.terms)
+            term_ids.append(segment.terms[segment_terms[live]])
+            doc_ids.append(new_ids[segment_docs[live]])
+            freqs.append(segment_freqs[live])
+            lengths.extend(segment.doc_lengths[keep].tolist())
+            docs.extend(doc for doc, alive in zip(segment.docs, keep) if alive)
+
+        terms = np.unique(np.concatenate(vocabularies))
+        merged_term_ids = np.searchsorted(terms, np.concatenate(term_ids))
+        merged_doc_ids = np.concatenate(doc_ids)
+        order = np.lexsort((merged_doc_ids, merged_term_ids))
+        used = np.zeros(len(terms), dtype=bool)
+        used[merged_term_ids] = True
+        # Terms that only occurred in deleted documents are dropped from the dictionary.
+        compact = np.cumsum(used) - 1
+        name = f"seg_{uuid.uuid4().hex[:12]}"
+        merged = Segment.write(self.directory, name, terms[used], compact[merged_term_ids[order]], merged_doc_ids[order],
+                               np.concatenate(freqs)[order], lengths, docs)
+
+        with self._lock:
+            # Deletions made while the merge ran are carried over to the new segment.
+            late = [remap[(segment.name, local)] for segment in chosen
+                    for local in self.deleted.get(segment.name, set()) - deleted[segment.name]]
+            chosen_names = {segment.name for segment in chosen}
+            self.segments = [segment for segment in self.segments if segment.name not in chosen_names] + [merged]
+            for segment_name in chosen_names:
+                self.deleted.pop(segment_name, None)
+            if late:
+                self.deleted[name] = set(late)
+            for doc_id, (segment_name, local, content_hash) in list(self._locations.items()):
+                if segment_name in chosen_names:
+                    self._locations[doc_id] = (name, remap[(segment_name, local)], content_hash)
+            self._save_manifest()
+        for segment in chosen:
+            segment.delete_files()
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+def get_search_index(directory: Union[str, Path] = SEARCH_INDEX_DIR) -> SearchIndex:
+    """Process-wide SearchIndex per directory."""
+    key = str(directory)
+    with _indexes_lock:
+        if key not in _indexes:
+            _indexes[key] = SearchIndex(directory)
+        return _indexes[key]
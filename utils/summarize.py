@@ -0,0 +1,119 @@
+from concurrent.futures import Executor
+from typing import Optional, List, Sequence
+
+import numpy as np
+from scipy import sparse
+
+from utils.nlp_utils import ParsedText
+
+# Sections are bounded in size so each TextRank graph stays small and the
+# total cost grows linearly with document length.
+SECTION_CHARS = 6000
+SECTION_SENTENCES = (5, 3)
+MAX_LEVELS = 8
+DAMPING = 0.85
+
+def textrank_scores(sentence_terms: Sequence[Sequence[int]], damping: float = DAMPING, tol: float = 1e-6, max_iter: int = 100) -> np.ndarray:
+    """
+    TextRank over sentences given as lists of term ids (any hashable ints).
+
+    Edge weights follow the original TextRank overlap measure: shared terms
+    divided by log(|Si|) + log(|Sj|). Overlaps come from one sparse
+    product of the sentence-term count matrix, and scores from power
+    iteration on the row-normalized graph.
+    """
+    n = len(sentence_terms)
+    if n == 0:
+        return np.zeros(0)
+    lengths = np.fromiter((len(terms) for terms in sentence_terms), dtype=np.int64, count=n)
+    flat = np.fromiter((term for terms in sentence_terms for term in terms), dtype=np.uint64, count=int(lengths.sum()))
+    _, columns = np.unique(flat, return_inverse=True)
+    rows = np.repeat(np.arange(n), lengths)
+    counts = sparse.csr_matrix((np.ones(len(flat)), (rows, columns.ravel())), shape=(n, columns.max() + 1 if len(flat) else 0))
+
+    overlap = (counts @ counts.T).tocoo()
+    off_diagonal = overlap.row != overlap.col
+    row, col, shared = overlap.row[off_diagonal], overlap.col[off_diagonal], overlap.data[off_diagonal]
+    log_lengths = np.log(np.maximum(lengths, 1))
+    norm = log_lengths[row] + log_lengths[col]
+    weight = np.divide(shared, norm, out=np.zeros_like(shared), where=norm > 1e-7)
+    graph = sparse.csr_matrix((weight, (row, col)), shape=(n, n))
+
+    out_weight = np.asarray(graph.sum(axis=1)).ravel()
+    dangling = out_weight == 0
+    inverse = np.divide(1.0, out_weight, out=np.zeros_like(out_weight), where=~dangling)
+    transition_t = (sparse.diags(inverse) @ graph).T.tocsr()
+
+    scores = np.full(n, 1.0 / n)
+    for _ in range(max_iter):
+        # Sentences with no edges spread their score evenly.
+        updated = (1 - damping) / n + damping * (transition_t @ scores + scores[dangling].sum() / n)
+        converged = np.abs(updated - scores).sum() < tol
+        scores = updated
+        if converged:
+            break
+    return scores
+
+def top_sentences(sentence_terms: Sequence[Sequence[int]], sentence_count: int) -> List[int]:
+    """Indices of the sentence_count highest-ranked sentences, in document order."""
+    scores = textrank_scores(sentence_terms)
+    return sorted(np.argsort(-scores, kind="stable")[:sentence_count].tolist())
+
+def _sections(indices: List[int], lengths: Sequence[int], section_chars: int) -> List[List[int]]:
+    sections, current, size = [], [], 0
+    for index in indices:
+        if current and size + lengths[index] > section_chars:
+            sections.append(current)
+            current, size = [], 0
+        current.append(index)
+        size += lengths[index]
+    if current:
+        sections.append(current)
+    return sections
+
+def hierarchical_rank(
+    sentence_terms: Sequence[Sequence[int]],
+    sentence_lengths: Sequence[int],
+    sentence_count: int = 3,
+    section_chars: int = SECTION_CHARS,
+    section_sentences: Sequence[int] = SECTION_SENTENCES,
+    executor: Optional[Executor] = None,
+) -> List[int]:
+    """
+    Map-reduce TextRank. While the selected sentences are longer than
+    section_chars, they are grouped into consecutive sections, and each
+    section keeps its top section_sentences[level] sentences (the last
+    budget repeats for deeper levels). The survivors are then ranked
+    together and cut to sentence_count. Sections of a level run on
+    executor when one is given. Returns sentence indices in document order.
+    """
+    selected = list(range(len(sentence_terms)))
+    for level in range(MAX_LEVELS):
+        if sum(sentence_lengths[i] for i in selected) <= section_chars:
+            break
+        budget = section_sentences[min(level, len(section_sentences) - 1)]
+        sections = _sections(selected, sentence_lengths, section_chars)
+        groups = [[sentence_terms[i] for i in section] for section in sections]
+        if executor is not None and len(sections) > 1:
+            picks = list(executor.map(top_sentences, groups, [budget] * len(groups)))
+        else:
+            picks = [top_sentences(group, budget) for group in groups]
+        reduced = [section[j] for section, pick in zip(sections, picks) for j in pick]
+        if len(reduced) >= len(selected):
+            break
+        selected = reduced
+    picks = top_sentences([sentence_terms[i] for i in selected], sentence_count)
+    return [selected[j] for j in picks]
+
+def hierarchical_summary(
+    text: str,
+    parsed: ParsedText,
+    sentence_count: int = 3,
+    section_chars: int = SECTION_CHARS,
+    section_sentences: Sequence[int] = SECTION_SENTENCES,
+    executor: Optional[Executor] = None,
+) -> str:
+    """Extractive summary of text built from the sentences parse_texts found in it."""
+    lengths = [end - start for start, end in parsed.sentences]
+    chosen = hierarchical_rank(parsed.sentence_terms, lengths, sentence_count, section_chars, section_sentences, executor)
+    return " ".join(text[start:end].strip() for start, end in (parsed.sentences[i] for i in chosen))
@@ -0,0 +1,108 @@
+from typing import Callable, List, Dict, Sequence, Tuple
+
+import numpy as np
+from scipy import sparse
+
+MAX_TOPICS = 8
+MIN_TOPIC_DOCS = 3
+TOPIC_LABEL_TERMS = 3
+# Per-document topic weights below this share are left out of the output.
+MIN_TOPIC_WEIGHT = 0.1
+_EPS = 1e-10
+
+def tfidf_matrix(doc_terms: Sequence[Sequence[int]], max_df: float = 0.95) -> Tuple[sparse.csr_matrix, np.ndarray]:
+    """
+    L2-normalized TF-IDF matrix (documents x terms) with sublinear term
+    frequency and smoothed idf, built from all documents in one pass.
+    doc_terms holds integer term ids (e.g. spaCy lexeme hashes); terms in
+    more than max_df of the documents, or in only one of several, are
+    dropped. Returns the matrix and the term id of each column.
+    """
+    n_docs = len(doc_terms)
+    lengths = np.fromiter((len(terms) for terms in doc_terms), dtype=np.int64, count=n_docs)
+    flat = np.fromiter((term for terms in doc_terms for term in terms), dtype=np.uint64, count=int(lengths.sum()))
+    vocabulary, columns = np.unique(flat, return_inverse=True)
+    rows = np.repeat(np.arange(n_docs), lengths)
+    counts = sparse.csr_matrix((np.ones(len(flat)), (rows, columns.ravel())), shape=(n_docs, len(vocabulary)))
+    counts.sum_duplicates()
+
+    doc_freqs = np.bincount(counts.indices, minlength=len(vocabulary))
+    keep = doc_freqs <= max(max_df * n_docs, 1)
+    if n_docs >= MIN_TOPIC_DOCS:
+        keep &= doc_freqs >= 2
+    counts = counts[:, np.flatnonzero(keep)]
+    vocabulary, doc_freqs = vocabulary[keep], doc_freqs[keep]
+
+    tfidf = counts.copy()
+    tfidf.data = 1.0 + np.log(tfidf.data)
+    tfidf = tfidf @ sparse.diags(np.log((1.0 + n_docs) / (1.0 + doc_freqs)) + 1.0)
+    norms = np.sqrt(np.asarray(tfidf.multiply(tfidf).sum(axis=1)).ravel())
+    tfidf = sparse.diags(np.divide(1.0, norms, out=np.zeros_like(norms), where=norms > 0)) @ tfidf
+    return tfidf.tocsr(), vocabulary
+
+def nmf(matrix: sparse.csr_matrix, n_topics: int, max_iter: int = 200, tol: float = 1e-4, seed: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Factorize a non-negative sparse matrix X ~ W @ H with Lee-Seung
+    multiplicative updates for the Frobenius loss. Only W.T @ X and X @ H.T
+    touch X, so it is never densified.
+    """
+    rng = np.random.default_rng(seed)
+    n_docs, n_terms = matrix.shape
+    scale = np.sqrt(matrix.mean() / n_topics) if matrix.nnz else 1.0
+    W = rng.random((n_docs, n_topics)) * scale + _EPS
+    H = rng.random((n_topics, n_terms)) * scale + _EPS
+    squared_norm = matrix.multiply(matrix).sum()
+    previous = None
+    for _ in range(max_iter):
+        H *= (matrix.T @ W).T / (W.T @ W @ H + _EPS)
+        XHt = matrix @ H.T
+        HHt = H @ H.T
+        W *= XHt / (W @ HHt + _EPS)
+        # ||X - WH||^2 expanded so the dense product WH is never formed.
+        loss = squared_norm - 2 * np.sum(W * XHt) + np.sum((W.T @ W) * HHt)
+        if previous is not None and abs(previous - loss) <= tol * max(previous, _EPS):
+            break
+        previous = loss
+    return W, H
+
+def corpus_topics(doc_terms: Sequence[Sequence[int]], term_text: Callable[[int], str], n_topics: int = MAX_TOPICS, top_terms: int = 5) -> Dict:
+    """
+    Shared topics over a handover's documents: TF-IDF over every document,
+    then NMF. Returns {'topics': [label, ...], 'weights': documents x topics
+    array normalized per document, 'keywords': per-document top terms},
+    where each label joins a topic's strongest terms and keywords rank a
+    document's own terms by its topic mixture.
+    """
+    tfidf, vocabulary = tfidf_matrix(doc_terms)
+    # At most one topic per two documents, so a small handover gets topics
+    # shared across its documents rather than one per document.
+    n_topics = max(1, min(n_topics, tfidf.shape[0] // 2, tfidf.shape[1]))
+    if tfidf.shape[1] == 0:
+        return {"topics": [], "weights": np.zeros((tfidf.shape[0], 0)), "keywords": [[] for _ in doc_terms]}
+    W, H = nmf(tfidf, n_topics)
+    labels = [
+        ", ".join(term_text(int(vocabulary[j])) for j in np.argsort(-H[topic])[:TOPIC_LABEL_TERMS])
+        for topic in range(n_topics)
+    ]
+    totals = W.sum(axis=1, keepdims=True)
+    weights = np.divide(W, totals, out=np.zeros_like(W), where=totals > 0)
+
+    keywords = []
+    for doc in range(tfidf.shape[0]):
+        start, end = tfidf.indptr[doc], tfidf.indptr[doc + 1]
+        columns = tfidf.indices[start:end]
+        scores = (W[doc] @ H[:, columns]) * tfidf.data[start:end]
+        keywords.append([term_text(int(vocabulary[j])) for j in columns[np.argsort(-scores)[:top_terms]]])
+    return {"topics": labels, "weights": weights, "keywords": keywords}
+
+def topic_weights(labels: List[str], weights: np.ndarray, min_weight: float = MIN_TOPIC_WEIGHT) -> Dict[int, Dict]:
+    """
+    One document's topic shares above min_weight, strongest first, as
+    {topic index: {'label', 'weight'}}. Topics are keyed by index because
+    two topics can share the same top terms.
+    """
+    order = np.argsort(-weights)
+    return {
+        int(topic): {"label": labels[topic], "weight": round(float(weights[topic]), 3)}
+        for topic in order if weights[topic] >= min_weight
+    }
@@ -0,0 +1,147 @@
+import hashlib
+import mmap
+import os
+import shutil
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional, List, Dict, Union
+
+from utils.cache import DATA_DIR
+
+SPOOL_DIR = DATA_DIR / "raw" / "spool"
+SPOOL_CHUNK_SIZE = 1024 * 1024
+MAX_FILE_BYTES = int(os.getenv("UPLOAD_MAX_FILE_MB", "200")) * 1024 * 1024
+MAX_RUN_BYTES = int(os.getenv("UPLOAD_MAX_RUN_MB", "1024")) * 1024 * 1024
+# Run directories left behind by crashed runs are removed after this long.
+STALE_RUN_SECONDS = 6 * 3600
+
+class _MappedFile(mmap.mmap):
+    # mmap already reads and seeks like a file; zipfile (and so openpyxl,
+    # python-docx and python-pptx) also asks whether it is seekable.
+    def seekable(self) -> bool:
+        return True
+
+    def readable(self) -> bool:
+        return True
+
+class UploadTooLargeError(ValueError):
+    """Raised when an upload would exceed the per-file or per-run size limit."""
+
+@dataclass
+class SpooledFile:
+    """An upload written to disk under its content hash."""
+    name: str
+    path: Path
+    size: int
+    sha256: str
+    mime_type: Optional[str] = None
+
+@contextmanager
+def open_mapped(path: Union[str, Path]):
+    """
+    Memory-map a spooled file read-only. The map is a seekable file-like
+    object, so the extractors can read it without loading it into memory.
+    """
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            # Empty files cannot be mapped; the open handle reads as empty.
+            yield f
+            return
+        mapped = _MappedFile(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            yield mapped
+        finally:
+            mapped.close()
+
+class UploadSpool:
+    """
+    Spool for one ingestion run under data/raw/spool/<run>/.
+
+    Uploads are streamed to disk in chunks while being hashed and stored as
+    <sha256><ext>, so identical uploads share one file. Per-file and per-run
+    byte limits are enforced while writing; the run limit covers the uploads
+    added to this spool, not a user's whole Streamlit session. The run
+    directory is removed on close(), and stale ones are swept on start.
+    """
+
+    def __init__(self, root: Union[str, Path] = SPOOL_DIR, max_file_bytes: int = MAX_FILE_BYTES, max_run_bytes: int = MAX_RUN_BYTES):
+        self.root = Path(root)
+        self.max_file_bytes = max_file_bytes
+        self.max_run_bytes = max_run_bytes
+        self.run_dir = self.root / uuid.uuid4().hex
+        self.run_dir.mkdir(parents=True, exist_ok=True)
+        self.total_bytes = 0
+        self.files: List[SpooledFile] = []
+        self._paths: Dict[str, Path] = {}
+        sweep_stale_runs(self.root, exclude=self.run_dir)
+
+    def add(self, uploaded_file) -> SpooledFile:
+        """Stream one upload (any readable file-like with .name) into the spool."""
+        digest = hashlib.sha256()
+        size = 0
+        tmp_path = self.run_dir / f".{uuid.uuid4().hex}.part"
+        if hasattr(uploaded_file, "seek"):
+            uploaded_file.seek(0)
+        try:
+            with open(tmp_path, "wb") as out:
+                while True:
+                    chunk = uploaded_file.read(SPOOL_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    if size > self.max_file_bytes:
+                        raise UploadTooLargeError(f"{uploaded_file.name} exceeds the {_format_size(self.max_file_bytes)} per-file limit")
+                    if self.total_bytes + size > self.max_run_bytes:
+                        raise UploadTooLargeError(f"Uploads exceed the {_format_size(self.max_run_bytes)} per-run limit")
+                    digest.update(chunk)
+                    out.write(chunk)
+        except BaseException:
+            tmp_path.unlink(missing_ok=True)
+            raise
+        sha256 = digest.hexdigest()
+        path = self._paths.get(sha256)
+        if path is not None:
+            tmp_path.unlink()
+        else:
+            path = self.run_dir / f"{sha256}{Path(uploaded_file.name).suffix.lower()}"
+            os.replace(tmp_path, path)
+            self._paths[sha256] = path
+            self.total_bytes += size
+        spooled = SpooledFile(uploaded_file.name, path, size, sha256, getattr(uploaded_file, "type", None))
+        self.files.append(spooled)
+        return spooled
+
+    def close(self):
+        shutil.rmtree(self.run_dir, ignore_errors=True)
+        self.files = []
+        self._paths = {}
+        self.total_bytes = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def _format_size(num_bytes: int) -> str:
+    if num_bytes >= 1024 * 1024:
+        return f"{num_bytes / (1024 * 1024):g} MB"
+    return f"{num_bytes} bytes"
+
+def sweep_stale_runs(root: Union[str, Path] = SPOOL_DIR, max_age: float = STALE_RUN_SECONDS, exclude: Optional[Path] = None):
+    """Remove spool run directories not modified within max_age seconds."""
+    root = Path(root)
+    if not root.is_dir():
+        return
+    cutoff = time.time() - max_age
+    for run_dir in root.iterdir():
+        if run_dir == exclude or not run_dir.is_dir():
+            continue
+        try:
+            if run_dir.stat().st_mtime < cutoff:
+                shutil.rmtree(run_dir, ignore_errors=True)
+        except FileNotFoundError:
+            pass